@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 
-from flask import Blueprint, render_template
+from datetime import datetime
+
+from flask import Blueprint, render_template, request
+from sqlalchemy import tuple_
 
 from database import db
 from models import User, BillingAccount
@@ -11,16 +14,59 @@ from saas import admin_required
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
+ADMIN_PAGE_SIZE = 50
+
+
+def _parse_cursor():
+    """Return (created_at, id) keyset cursor from query args, or None."""
+    raw_ts = (request.args.get("after_created_at") or "").strip()
+    raw_id = (request.args.get("after_id") or "").strip()
+    if not raw_ts or not raw_id:
+        return None
+    try:
+        return datetime.fromisoformat(raw_ts), raw_id
+    except ValueError:
+        return None
+
 
 @admin_bp.route("", methods=["GET"])
 @admin_required
 def admin_home():
-    # left join users -> billing
-    rows = (
-        db.session.query(User, BillingAccount)
+    # left join users -> billing; select only the columns rendered in admin.html
+    # so we ship light Row tuples instead of hydrating two ORM entities per row.
+    query = (
+        db.session.query(
+            User.id,
+            User.email,
+            User.username,
+            User.created_at,
+            User.last_login,
+            BillingAccount.subscription_status,
+            BillingAccount.current_period_end,
+            BillingAccount.stripe_customer_id,
+            BillingAccount.stripe_subscription_id,
+        )
         .outerjoin(BillingAccount, BillingAccount.user_id == User.id)
-        .order_by(User.created_at.desc())
-        .limit(500)
+    )
+
+    # Keyset pagination on (created_at, id): an index range scan per page
+    # instead of sorting the whole users table and cutting 500 rows.
+    cursor = _parse_cursor()
+    if cursor is not None:
+        query = query.filter(tuple_(User.created_at, User.id) < cursor)
+
+    rows = (
+        query
+        .order_by(User.created_at.desc(), User.id.desc())
+        .limit(ADMIN_PAGE_SIZE + 1)
         .all()
     )
-    return render_template("admin.html", rows=rows)
+
+    next_cursor = None
+    if len(rows) > ADMIN_PAGE_SIZE:
+        rows = rows[:ADMIN_PAGE_SIZE]
+        last = rows[-1]
+        if last.created_at is not None:
+            next_cursor = {"after_created_at": last.created_at.isoformat(), "after_id": last.id}
+
+    return render_template("admin.html", rows=rows, next_cursor=next_cursor, is_first_page=cursor is None)
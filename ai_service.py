@@ -7,15 +7,56 @@
 - Обробка трендів з RSS
 """
 import os
+import re
 import json
-from typing import Dict, List, Optional
+import time
+import asyncio
+import functools
+import tempfile
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 
+import semantic_cache
+
+# orjson швидше парсить unicode-важкі відповіді (umlauts, emoji, кирилиця);
+# json.dumps (indent/ensure_ascii) лишається на stdlib
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
 load_dotenv()
 
 # OpenAI API
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
+# Бекенд для аналізу профілів (класифікація): openai | ollama (локальна модель).
+# Генерація постів/повідомлень завжди йде через OpenAI.
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'openai').strip().lower()
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434').rstrip('/')
+OLLAMA_ANALYZE_MODEL = os.environ.get('OLLAMA_ANALYZE_MODEL', 'llama3.1:8b-instruct-q4_0')
+ANALYZE_MODEL = OLLAMA_ANALYZE_MODEL if LLM_BACKEND == 'ollama' else 'gpt-4o-mini'
+
+# Скільки запитів до OpenAI виконуємо паралельно в batch_analyze_profiles
+OPENAI_CONCURRENCY = int(os.environ.get('OPENAI_CONCURRENCY', '10'))
+
+# Скільки профілів пакуємо в один chat.completions запит (BUSINESS_CONTEXT йде один раз на пакет)
+ANALYZE_PACK_SIZE = int(os.environ.get('OPENAI_ANALYZE_PACK_SIZE', '10'))
+
+# Захист від 429: ліміт запитів на хвилину (спільний для потоків/event loop-ів процесу)
+# + вбудовані в SDK повтори з експоненційним backoff на 429/408/5xx (враховують Retry-After)
+OPENAI_RPM = int(os.environ.get('OPENAI_RPM', '500'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '6'))
+
+# Бюджет токенів на зміст RSS-статті в summarize_trend (потрібен tiktoken; без нього - ліміт символів)
+TREND_CONTENT_MAX_TOKENS = int(os.environ.get('TREND_CONTENT_MAX_TOKENS', '350'))
+
+# OpenAI Batch API (нічний/фоновий скоринг: -50% вартості, окремі rate limits)
+BATCH_API_POLL_SECONDS = int(os.environ.get('OPENAI_BATCH_POLL_SECONDS', '30'))
+BATCH_API_FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
 # Контекст бізнесу (для персоналізації)
 BUSINESS_CONTEXT = """
 Ми - компанія з укладання плитки та ремонту ванних кімнат у регіоні Франкфурт (Німеччина).
@@ -33,19 +74,392 @@ BUSINESS_CONTEXT = """
 Тон комунікації: професійний, дружній, на "ви", німецькою або англійською.
 """
 
+# Статичні system-промпти: незмінна частина (роль + контекст бізнесу + формат відповіді)
+# стоїть першою і однакова байт-в-байт між викликами, тому OpenAI кешує цей префікс.
+# У user-повідомлення йдуть тільки дані конкретного виклику.
+ANALYZE_SYSTEM_PROMPT = (
+    "Ти експерт з аналізу соціальних мереж для B2C маркетингу. Відповідай тільки валідним JSON.\n"
+    "\nКОНТЕКСТ БІЗНЕСУ:\n" + BUSINESS_CONTEXT + """
+ЗАВДАННЯ:
+Проаналізуй Instagram профіль з повідомлення користувача для компанії з укладання плитки у Франкфурті.
+Визнач тип профілю та оціни якість як потенційного клієнта.
 
+Відповідь у JSON форматі:
+{
+    "profile_type": "потенційний_клієнт|конкурент|постачальник|інфлюенсер|нерелевантний",
+    "quality_score": 0-100,
+    "is_target_audience": true/false,
+    "reasoning": "коротке пояснення",
+    "contact_recommendation": "рекомендація щодо контакту",
+    "suggested_message_tone": "дружній|діловий|casual",
+    "interests_detected": ["список", "інтересів"]
+}"""
+)
+
+# Пакетний варіант: той самий префікс (кеш промпту спільний) + інструкція для масиву
+ANALYZE_PACKED_SYSTEM_PROMPT = ANALYZE_SYSTEM_PROMPT + """
+
+ПАКЕТНИЙ РЕЖИМ:
+Повідомлення користувача - JSON-масив профілів. Поверни {"analyses": [...]} -
+рівно один аналіз у форматі вище на кожен профіль, у тому ж порядку."""
+
+_ANALYSIS_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "profile_type": {
+            "type": "string",
+            "enum": ["потенційний_клієнт", "конкурент", "постачальник", "інфлюенсер", "нерелевантний"]
+        },
+        "quality_score": {"type": "integer"},
+        "is_target_audience": {"type": "boolean"},
+        "reasoning": {"type": "string"},
+        "contact_recommendation": {"type": "string"},
+        "suggested_message_tone": {"type": "string", "enum": ["дружній", "діловий", "casual"]},
+        "interests_detected": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": [
+        "profile_type", "quality_score", "is_target_audience", "reasoning",
+        "contact_recommendation", "suggested_message_tone", "interests_detected"
+    ],
+    "additionalProperties": False
+}
+
+MESSAGE_SYSTEM_PROMPT = (
+    "Ти копірайтер для Instagram маркетингу. Пишеш природні, персоналізовані повідомлення.\n"
+    "\nВІДПРАВНИК:\n" + BUSINESS_CONTEXT + """
+ЗАВДАННЯ:
+Створи 3 варіанти персоналізованого повідомлення для Instagram Direct отримувачу з повідомлення користувача.
+
+ВИМОГИ:
+1. Повідомлення 50-150 слів
+2. Персоналізація на основі біографії
+3. Природний тон, не спам
+4. Можна використовувати емодзі (1-3)
+5. Німецька або українська мова
+6. Call-to-action в кінці
+
+Відповідь у JSON:
+{
+    "messages": ["варіант 1", "варіант 2", "варіант 3"],
+    "recommended": 0,
+    "personalization_notes": "що персоналізовано"
+}"""
+)
+
+POST_SYSTEM_PROMPT = (
+    "Ти SMM спеціаліст для Instagram. Створюєш вірусний контент для бізнес-акаунтів.\n"
+    "\nБІЗНЕС:\n" + BUSINESS_CONTEXT + """
+ЗАВДАННЯ:
+Створи контент для Instagram поста на тему з повідомлення користувача.
+
+ВИМОГИ:
+1. Caption 100-200 слів
+2. Привабливий перший рядок (hook)
+3. Emoji для візуального оформлення
+4. Call-to-action в кінці
+5. Німецька мова (основна) з англійськими термінами
+6. 15-20 релевантних хештегів
+
+Відповідь у JSON:
+{
+    "hook": "перший рядок для привернення уваги",
+    "caption": "повний текст поста",
+    "hashtags": ["список", "хештегів"],
+    "best_time_to_post": "рекомендований час",
+    "content_ideas": ["ідея для фото 1", "ідея для фото 2"]
+}"""
+)
+
+TREND_SYSTEM_PROMPT = """Ти контент-стратег для Instagram в ніші ремонту та дизайну.
+
+БІЗНЕС: Укладання плитки та ремонт ванних у Франкфурті
+
+ЗАВДАННЯ:
+Проаналізуй тренд з дизайну/ремонту з повідомлення користувача та створи ідеї для Instagram контенту.
+1. Коротке саммарі тренду (2-3 речення)
+2. Як це стосується нашого бізнесу
+3. 3 ідеї для Instagram постів на основі цього тренду
+
+JSON відповідь:
+{
+    "summary": "коротке саммарі",
+    "relevance": "як стосується нашого бізнесу",
+    "post_ideas": [
+        {"title": "назва поста", "description": "опис", "type": "тип поста"},
+        ...
+    ]
+}"""
+
+# Шаблони user-повідомлень (змінна частина промпту), заповнюються через format_map
+ANALYZE_USER_TMPL = """ПРОФІЛЬ:
+- Username: @{username}
+- Біографія: {bio}
+- Підписників: {followers_count}
+- Постів: {posts_count}
+- Бізнес-акаунт: {is_business}"""
+
+MESSAGE_USER_TMPL = """ОТРИМУВАЧ:
+- Username: @{username}
+- Ім'я: {name}
+- Біографія: {bio}
+
+МЕТА: {goal}"""
+
+POST_USER_TMPL = """ТЕМА: {topic}
+ТИП: {post_type}"""
+
+TREND_USER_TMPL = """ТРЕНД:
+Заголовок: {title}
+Зміст: {content}"""
+
+MESSAGE_GOALS = {
+    'знайомство': 'Перше знайомство, м\'який підхід, без нав\'язування',
+    'пропозиція': 'Конкретна пропозиція послуг',
+    'знижка': 'Спеціальна пропозиція/знижка для нових клієнтів',
+    'follow_up': 'Нагадування/повторний контакт'
+}
+
+POST_TYPES = {
+    'informative': 'Інформативний пост з корисними порадами',
+    'promotional': 'Рекламний пост з call-to-action',
+    'behind_scenes': 'За лаштунками роботи, показати процес',
+    'tips': 'Корисні поради для власників будинків',
+    'before_after': 'До/Після проекту ремонту',
+    'trend': 'Тренди та новинки в дизайні'
+}
+
+
+@functools.lru_cache(maxsize=1)
 def get_openai_client():
-    """Отримати клієнт OpenAI"""
+    """Отримати клієнт OpenAI (один на процес: перевикористовує пул HTTP-з'єднань)"""
     if not OPENAI_API_KEY:
         return None
     
     try:
         from openai import OpenAI
-        return OpenAI(api_key=OPENAI_API_KEY)
+        return OpenAI(api_key=OPENAI_API_KEY, max_retries=OPENAI_MAX_RETRIES)
+    except ImportError:
+        print("⚠️ openai package not installed. Run: pip install openai")
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_ollama_client():
+    """Клієнт для Ollama через її OpenAI-сумісний API (/v1)"""
+    try:
+        from openai import OpenAI
+        return OpenAI(base_url=f"{OLLAMA_BASE_URL}/v1", api_key='ollama', max_retries=OPENAI_MAX_RETRIES)
+    except ImportError:
+        print("⚠️ openai package not installed. Run: pip install openai")
+        return None
+
+
+def get_analyze_client():
+    """Клієнт для аналізу профілів згідно LLM_BACKEND"""
+    return get_ollama_client() if LLM_BACKEND == 'ollama' else get_openai_client()
+
+
+# httpx.AsyncClient прив'язаний до event loop, тому async клієнти кешуємо per-loop
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _get_async_client(name: str, **kwargs):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    clients = _ASYNC_CLIENTS.setdefault(loop, {}) if loop is not None else {}
+    if name in clients:
+        return clients[name]
+
+    try:
+        from openai import AsyncOpenAI
     except ImportError:
         print("⚠️ openai package not installed. Run: pip install openai")
         return None
 
+    clients[name] = AsyncOpenAI(max_retries=OPENAI_MAX_RETRIES, **kwargs)
+    return clients[name]
+
+
+def get_async_openai_client():
+    """Отримати async клієнт OpenAI (для паралельних запитів), один на event loop"""
+    if not OPENAI_API_KEY:
+        return None
+    return _get_async_client('openai', api_key=OPENAI_API_KEY)
+
+
+def get_async_analyze_client():
+    """Async клієнт для аналізу профілів згідно LLM_BACKEND"""
+    if LLM_BACKEND == 'ollama':
+        return _get_async_client('ollama', base_url=f"{OLLAMA_BASE_URL}/v1", api_key='ollama')
+    return get_async_openai_client()
+
+
+def _run_async(coro):
+    """asyncio.run(coro) + закрити async клієнти цього loop перед його знищенням"""
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            clients = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None) or {}
+            for client in clients.values():
+                await client.close()
+
+    threadpool = _gevent_threadpool()
+    if threadpool is not None:
+        return threadpool.apply(asyncio.run, (_runner(),))
+    return asyncio.run(_runner())
+
+
+def _gevent_threadpool():
+    """Native-потоки gevent hub-а, якщо threading пропатчено gevent (gunicorn gevent worker), інакше None.
+
+    Під gevent усі greenlet-и воркера живуть на одному OS-потоці: другий паралельний
+    asyncio.run там падає з "cannot be called from a running event loop", тому loop
+    запускаємо в окремому native-потоці, а greenlet запиту чекає на результат.
+    """
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('threading'):
+        return None
+    return get_hub().threadpool
+
+
+# JSON mode: модель гарантовано повертає валідний JSON-об'єкт (без ```markdown```)
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+
+def _parse_json_content(result_text: str):
+    """Розпарсити JSON з відповіді моделі (запити йдуть з response_format=json_object)"""
+    return _json.loads(result_text or '')
+
+
+class _RateLimiter:
+    """Token bucket: не більше `rate` запитів за `period` секунд.
+
+    Працює і з потоків, і з будь-якого event loop (asyncio.run створює новий loop
+    на кожен виклик, тому asyncio-примітиви тут не підходять).
+    """
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate = max(1, int(rate))
+        self.period = float(period)
+        self.tokens = float(self.rate)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Забрати токен; повертає, скільки секунд треба почекати (токени можуть піти в мінус = черга)."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens * self.period / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_openai_rpm = _RateLimiter(OPENAI_RPM, 60.0)
+
+
+class _JsonObjectStream:
+    """Накопичує стрім відповіді і знаходить кінець верхньорівневого JSON-об'єкта.
+
+    Дужки всередині рядків ігноруються. Після закриваючої `}` стрім можна
+    обірвати: хвіст (пробіли/переноси до max_tokens) - це оплачені, але зайві токени.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.done = False
+
+    def feed(self, chunk: str) -> bool:
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '{':
+                self.depth += 1
+                self.started = True
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.parts.append(chunk[:i + 1])
+                    self.done = True
+                    return True
+        self.parts.append(chunk)
+        return False
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+def _create_json_completion(client, **kwargs) -> Dict:
+    """chat.completions зі stream=True: обриваємо з'єднання одразу після кінця JSON.
+
+    Якщо накопичений буфер не парситься - один повторний запит без стріму.
+    """
+    buf = _JsonObjectStream()
+    _openai_rpm.acquire()
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content and buf.feed(chunk.choices[0].delta.content):
+                break
+    finally:
+        stream.close()
+
+    try:
+        return _parse_json_content(buf.text)
+    except ValueError:
+        _openai_rpm.acquire()
+        response = client.chat.completions.create(**kwargs)
+        return _parse_json_content(response.choices[0].message.content)
+
+
+async def _acreate_json_completion(client, **kwargs) -> Dict:
+    """Async-версія _create_json_completion."""
+    buf = _JsonObjectStream()
+    await _openai_rpm.acquire_async()
+    stream = await client.chat.completions.create(stream=True, **kwargs)
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content and buf.feed(chunk.choices[0].delta.content):
+                break
+    finally:
+        await stream.close()
+
+    try:
+        return _parse_json_content(buf.text)
+    except ValueError:
+        await _openai_rpm.acquire_async()
+        response = await client.chat.completions.create(**kwargs)
+        return _parse_json_content(response.choices[0].message.content)
+
 
 def generate_dm_reply(system_instructions: str, messages: List[Dict], language: str = 'ru') -> str:
     """Generate a short DM reply.
@@ -86,6 +500,7 @@ def generate_dm_reply(system_instructions: str, messages: List[Dict], language:
             chat_messages.append({"role": role, "content": content})
 
     try:
+        _openai_rpm.acquire()
         response = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=chat_messages,
@@ -99,6 +514,93 @@ def generate_dm_reply(system_instructions: str, messages: List[Dict], language:
         return "Дякуємо за повідомлення! Підкажіть, будь ласка, ваш район/місто та що саме плануєте (ванна кімната, плитка), і ми запропонуємо варіант." 
 
 
+def _analyze_fallback(reasoning: str) -> Dict:
+    return {
+        'profile_type': 'потенційний_клієнт',
+        'quality_score': 50,
+        'is_target_audience': True,
+        'reasoning': reasoning,
+        'contact_recommendation': 'Можна контактувати',
+        'suggested_message_tone': 'дружній'
+    }
+
+
+def _analyze_user_prompt(username: str, bio: str, followers_count: int = 0,
+                         posts_count: int = 0, is_business: bool = False) -> str:
+    return ANALYZE_USER_TMPL.format_map({
+        'username': username,
+        'bio': bio or 'Немає',
+        'followers_count': followers_count,
+        'posts_count': posts_count,
+        'is_business': 'Так' if is_business else 'Ні',
+    })
+
+
+def _build_analyze_messages(username: str, bio: str, followers_count: int = 0,
+                            posts_count: int = 0, is_business: bool = False) -> List[Dict]:
+    return [
+        {"role": "system", "content": ANALYZE_SYSTEM_PROMPT},
+        {"role": "user", "content": _analyze_user_prompt(username, bio, followers_count, posts_count, is_business)}
+    ]
+
+
+def _analyze_cache_text(username: str, bio: str, followers_count: int = 0,
+                        posts_count: int = 0, is_business: bool = False) -> str:
+    """Змінна частина промпту аналізу (ключ для semantic cache)."""
+    return f"@{username}\n{bio or ''}\n{followers_count}|{posts_count}|{'business' if is_business else 'personal'}"
+
+
+def _profile_kwargs(profile: Dict) -> Dict:
+    """Поля профілю (як їх віддає парсер) -> аргументи analyze_profile."""
+    return {
+        'username': profile.get('username', ''),
+        'bio': profile.get('biography', '') or profile.get('bio', ''),
+        'followers_count': profile.get('followers_count', 0),
+        'posts_count': profile.get('posts_count', 0),
+        'is_business': profile.get('is_business', False),
+    }
+
+
+def _packed_response_format(count: int) -> Dict:
+    """json_schema: рівно `count` аналізів у масиві analyses."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "profile_analyses",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "analyses": {
+                        "type": "array",
+                        "items": _ANALYSIS_ITEM_SCHEMA,
+                        "minItems": count,
+                        "maxItems": count
+                    }
+                },
+                "required": ["analyses"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def _build_packed_analyze_messages(profiles: List[Dict]) -> List[Dict]:
+    items = []
+    for kw in (_profile_kwargs(p) for p in profiles):
+        items.append({
+            'username': kw['username'],
+            'bio': kw['bio'] or '',
+            'followers': kw['followers_count'],
+            'posts': kw['posts_count'],
+            'business': bool(kw['is_business']),
+        })
+    return [
+        {"role": "system", "content": ANALYZE_PACKED_SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
+    ]
+
+
 def analyze_profile(username: str, bio: str, followers_count: int = 0, 
                    posts_count: int = 0, is_business: bool = False) -> Dict:
     """
@@ -119,75 +621,125 @@ def analyze_profile(username: str, bio: str, followers_count: int = 0,
     Returns:
         Dict з результатами аналізу
     """
-    client = get_openai_client()
+    client = get_analyze_client()
     
     if not client:
         # Fallback без AI
-        return {
-            'profile_type': 'потенційний_клієнт',
-            'quality_score': 50,
-            'is_target_audience': True,
-            'reasoning': 'AI недоступний - базова оцінка',
-            'contact_recommendation': 'Можна контактувати',
-            'suggested_message_tone': 'дружній'
-        }
-    
-    prompt = f"""Проаналізуй Instagram профіль для компанії з укладання плитки у Франкфурті.
+        return _analyze_fallback('AI недоступний - базова оцінка')
 
-ПРОФІЛЬ:
-- Username: @{username}
-- Біографія: {bio or 'Немає'}
-- Підписників: {followers_count}
-- Постів: {posts_count}
-- Бізнес-акаунт: {'Так' if is_business else 'Ні'}
+    cache_text = _analyze_cache_text(username, bio, followers_count, posts_count, is_business)
+    embed_client = get_openai_client() if LLM_BACKEND == 'ollama' else client
+    cached, vector = semantic_cache.lookup('analyze_profile', cache_text, embed_client)
+    if cached is not None:
+        return cached
 
-КОНТЕКСТ БІЗНЕСУ:
-{BUSINESS_CONTEXT}
+    try:
+        result = _create_json_completion(
+            client,
+            model=ANALYZE_MODEL,
+            messages=_build_analyze_messages(username, bio, followers_count, posts_count, is_business),
+            temperature=0.3,
+            max_tokens=500,
+            response_format=JSON_RESPONSE_FORMAT
+        )
 
-ЗАВДАННЯ:
-Визнач тип профілю та оціни якість як потенційного клієнта.
+        semantic_cache.store('analyze_profile', cache_text, result, vector)
+        return result
+        
+    except Exception as e:
+        print(f"❌ AI аналіз помилка: {e}")
+        return _analyze_fallback(f'AI помилка: {str(e)}')
 
-Відповідь у JSON форматі:
-{{
-    "profile_type": "потенційний_клієнт|конкурент|постачальник|інфлюенсер|нерелевантний",
-    "quality_score": 0-100,
-    "is_target_audience": true/false,
-    "reasoning": "коротке пояснення",
-    "contact_recommendation": "рекомендація щодо контакту",
-    "suggested_message_tone": "дружній|діловий|casual",
-    "interests_detected": ["список", "інтересів"]
-}}"""
+
+async def analyze_profile_async(username: str, bio: str, followers_count: int = 0,
+                                posts_count: int = 0, is_business: bool = False,
+                                client=None) -> Dict:
+    """Async-версія analyze_profile (для паралельного пакетного аналізу)."""
+    client = client or get_async_analyze_client()
+
+    if not client:
+        return _analyze_fallback('AI недоступний - базова оцінка')
+
+    cache_text = _analyze_cache_text(username, bio, followers_count, posts_count, is_business)
+    embed_client = get_async_openai_client() if LLM_BACKEND == 'ollama' else client
+    cached, vector = await semantic_cache.alookup('analyze_profile', cache_text, embed_client)
+    if cached is not None:
+        return cached
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Ти експерт з аналізу соціальних мереж для B2C маркетингу. Відповідай тільки валідним JSON."},
-                {"role": "user", "content": prompt}
-            ],
+        result = await _acreate_json_completion(
+            client,
+            model=ANALYZE_MODEL,
+            messages=_build_analyze_messages(username, bio, followers_count, posts_count, is_business),
             temperature=0.3,
-            max_tokens=500
+            max_tokens=500,
+            response_format=JSON_RESPONSE_FORMAT
         )
-        
-        result_text = response.choices[0].message.content.strip()
-        # Очищаємо від markdown
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-        
-        return json.loads(result_text)
-        
+
+        semantic_cache.store('analyze_profile', cache_text, result, vector)
+        return result
+
     except Exception as e:
         print(f"❌ AI аналіз помилка: {e}")
-        return {
-            'profile_type': 'потенційний_клієнт',
-            'quality_score': 50,
-            'is_target_audience': True,
-            'reasoning': f'AI помилка: {str(e)}',
-            'contact_recommendation': 'Можна контактувати',
-            'suggested_message_tone': 'дружній'
-        }
+        return _analyze_fallback(f'AI помилка: {str(e)}')
+
+
+async def analyze_profiles_packed_async(profiles: List[Dict], client=None) -> List[Dict]:
+    """
+    Аналіз пакета профілів одним запитом (BUSINESS_CONTEXT + інструкції - один раз на пакет).
+
+    Профілі з semantic cache не відправляються. Якщо модель повернула не ту
+    кількість аналізів або запит впав - ці профілі аналізуються поодинці.
+
+    Returns:
+        List[Dict] аналізів у тому ж порядку, що й profiles
+    """
+    client = client or get_async_analyze_client()
+    if not client:
+        return [_analyze_fallback('AI недоступний - базова оцінка') for _ in profiles]
+
+    kwargs = [_profile_kwargs(p) for p in profiles]
+    cache_texts = [_analyze_cache_text(**kw) for kw in kwargs]
+    embed_client = get_async_openai_client() if LLM_BACKEND == 'ollama' else client
+    lookups = await asyncio.gather(
+        *(semantic_cache.alookup('analyze_profile', text, embed_client) for text in cache_texts)
+    )
+
+    results: List[Optional[Dict]] = [cached for cached, _ in lookups]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if not missing:
+        return results
+
+    analyses = None
+    try:
+        packed = await _acreate_json_completion(
+            client,
+            model=ANALYZE_MODEL,
+            messages=_build_packed_analyze_messages([profiles[i] for i in missing]),
+            temperature=0.3,
+            max_tokens=300 * len(missing) + 100,
+            response_format=_packed_response_format(len(missing))
+        )
+        analyses = (packed or {}).get('analyses')
+        if not isinstance(analyses, list) or len(analyses) != len(missing):
+            print(f"⚠️ AI пакетний аналіз: очікувалось {len(missing)} аналізів, "
+                  f"отримано {len(analyses) if isinstance(analyses, list) else 0} - аналізуємо поодинці")
+            analyses = None
+    except Exception as e:
+        print(f"❌ AI пакетний аналіз помилка: {e}")
+
+    if analyses is None:
+        analyses = await asyncio.gather(
+            *(analyze_profile_async(**kwargs[i], client=client) for i in missing)
+        )
+        for i, analysis in zip(missing, analyses):
+            results[i] = analysis
+        return results
+
+    for i, analysis in zip(missing, analyses):
+        semantic_cache.store('analyze_profile', cache_texts[i], analysis, lookups[i][1])
+        results[i] = analysis
+    return results
 
 
 def generate_personalized_message(recipient_username: str, recipient_bio: str,
@@ -218,58 +770,25 @@ def generate_personalized_message(recipient_username: str, recipient_bio: str,
             'ai_generated': False
         }
     
-    goal_prompts = {
-        'знайомство': 'Перше знайомство, м\'який підхід, без нав\'язування',
-        'пропозиція': 'Конкретна пропозиція послуг',
-        'знижка': 'Спеціальна пропозиція/знижка для нових клієнтів',
-        'follow_up': 'Нагадування/повторний контакт'
-    }
-    
-    prompt = f"""Створи 3 варіанти персоналізованого повідомлення для Instagram Direct.
-
-ОТРИМУВАЧ:
-- Username: @{recipient_username}
-- Ім'я: {recipient_name or 'Невідоме'}
-- Біографія: {recipient_bio or 'Немає'}
-
-МЕТА: {goal_prompts.get(message_goal, message_goal)}
-
-ВІДПРАВНИК:
-{BUSINESS_CONTEXT}
-
-ВИМОГИ:
-1. Повідомлення 50-150 слів
-2. Персоналізація на основі біографії
-3. Природний тон, не спам
-4. Можна використовувати емодзі (1-3)
-5. Німецька або українська мова
-6. Call-to-action в кінці
-
-Відповідь у JSON:
-{{
-    "messages": ["варіант 1", "варіант 2", "варіант 3"],
-    "recommended": 0,
-    "personalization_notes": "що персоналізовано"
-}}"""
+    prompt = MESSAGE_USER_TMPL.format_map({
+        'username': recipient_username,
+        'name': recipient_name or 'Невідоме',
+        'bio': recipient_bio or 'Немає',
+        'goal': MESSAGE_GOALS.get(message_goal, message_goal),
+    })
 
     try:
-        response = client.chat.completions.create(
+        result = _create_json_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": "Ти копірайтер для Instagram маркетингу. Пишеш природні, персоналізовані повідомлення."},
+                {"role": "system", "content": MESSAGE_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=800
+            max_tokens=800,
+            response_format=JSON_RESPONSE_FORMAT
         )
-        
-        result_text = response.choices[0].message.content.strip()
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-        
-        result = json.loads(result_text)
         result['ai_generated'] = True
         return result
         
@@ -306,58 +825,23 @@ def generate_post_content(topic: str, post_type: str = "informative",
             'ai_generated': False
         }
     
-    type_prompts = {
-        'informative': 'Інформативний пост з корисними порадами',
-        'promotional': 'Рекламний пост з call-to-action',
-        'behind_scenes': 'За лаштунками роботи, показати процес',
-        'tips': 'Корисні поради для власників будинків',
-        'before_after': 'До/Після проекту ремонту',
-        'trend': 'Тренди та новинки в дизайні'
-    }
-    
-    prompt = f"""Створи контент для Instagram поста.
-
-ТЕМА: {topic}
-ТИП: {type_prompts.get(post_type, post_type)}
-
-БІЗНЕС:
-{BUSINESS_CONTEXT}
-
-ВИМОГИ:
-1. Caption 100-200 слів
-2. Привабливий перший рядок (hook)
-3. Emoji для візуального оформлення
-4. Call-to-action в кінці
-5. Німецька мова (основна) з англійськими термінами
-6. 15-20 релевантних хештегів
-
-Відповідь у JSON:
-{{
-    "hook": "перший рядок для привернення уваги",
-    "caption": "повний текст поста",
-    "hashtags": ["список", "хештегів"],
-    "best_time_to_post": "рекомендований час",
-    "content_ideas": ["ідея для фото 1", "ідея для фото 2"]
-}}"""
+    prompt = POST_USER_TMPL.format_map({
+        'topic': topic,
+        'post_type': POST_TYPES.get(post_type, post_type),
+    })
 
     try:
-        response = client.chat.completions.create(
+        result = _create_json_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": "Ти SMM спеціаліст для Instagram. Створюєш вірусний контент для бізнес-акаунтів."},
+                {"role": "system", "content": POST_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.8,
-            max_tokens=1000
+            max_tokens=1000,
+            response_format=JSON_RESPONSE_FORMAT
         )
-        
-        result_text = response.choices[0].message.content.strip()
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-        
-        result = json.loads(result_text)
         result['ai_generated'] = True
         return result
         
@@ -371,13 +855,61 @@ def generate_post_content(topic: str, post_type: str = "informative",
         }
 
 
-def summarize_trend(trend_title: str, trend_content: str) -> Dict:
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+
+
+def _truncate_at_sentence(text: str, limit: int) -> str:
+    """Обрізати текст до `limit` символів по межі речення (без обрізаного хвоста)."""
+    text = ' '.join((text or '').split())
+    if len(text) <= limit:
+        return text
+
+    parts = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(text[:limit + 1]):
+        if used + len(sentence) > limit:
+            break
+        parts.append(sentence)
+        used += len(sentence) + 1
+
+    # Перше речення довше за ліміт - ріжемо по слову
+    return ' '.join(parts) if parts else text[:limit].rsplit(' ', 1)[0]
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """tiktoken encoding для gpt-4o-mini (o200k_base) або None, якщо tiktoken не встановлений."""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model('gpt-4o-mini')
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"⚠️ tiktoken недоступний: {e}")
+        return None
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрізати текст до бюджету токенів по межі речення (без tiktoken - текст як є)."""
+    enc = _get_encoding()
+    if enc is None or not text:
+        return text
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    head = enc.decode(tokens[:max_tokens])
+    return _truncate_at_sentence(head, len(head) - 1)
+
+
+def summarize_trend(trend_title: str, trend_content: str, content_limit: int = 1500) -> Dict:
     """
     📰 Саммарі тренду з RSS для ідей контенту
     
     Args:
         trend_title: Заголовок статті/тренду
         trend_content: Текст статті
+        content_limit: Максимум символів змісту в промпті (обрізається по межі речення);
+            далі зміст додатково обрізається до TREND_CONTENT_MAX_TOKENS токенів
         
     Returns:
         Dict з саммарі та ідеями
@@ -391,48 +923,28 @@ def summarize_trend(trend_title: str, trend_content: str) -> Dict:
             'ai_generated': False
         }
     
-    prompt = f"""Проаналізуй тренд з дизайну/ремонту та створи ідеї для Instagram контенту.
-
-ТРЕНД:
-Заголовок: {trend_title}
-Зміст: {trend_content[:2000]}
-
-БІЗНЕС: Укладання плитки та ремонт ванних у Франкфурті
-
-ЗАВДАННЯ:
-1. Коротке саммарі тренду (2-3 речення)
-2. Як це стосується нашого бізнесу
-3. 3 ідеї для Instagram постів на основі цього тренду
+    content = _truncate_to_tokens(_truncate_at_sentence(trend_content, content_limit), TREND_CONTENT_MAX_TOKENS)
+    cache_text = f"{trend_title}\n{content}"
+    cached, vector = semantic_cache.lookup('summarize_trend', cache_text, client)
+    if cached is not None:
+        return cached
 
-JSON відповідь:
-{{
-    "summary": "коротке саммарі",
-    "relevance": "як стосується нашого бізнесу",
-    "post_ideas": [
-        {{"title": "назва поста", "description": "опис", "type": "тип поста"}},
-        ...
-    ]
-}}"""
+    prompt = TREND_USER_TMPL.format_map({'title': trend_title, 'content': content})
 
     try:
-        response = client.chat.completions.create(
+        result = _create_json_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": "Ти контент-стратег для Instagram в ніші ремонту та дизайну."},
+                {"role": "system", "content": TREND_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.6,
-            max_tokens=600
+            max_tokens=600,
+            response_format=JSON_RESPONSE_FORMAT
         )
-        
-        result_text = response.choices[0].message.content.strip()
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-        
-        result = json.loads(result_text)
         result['ai_generated'] = True
+        semantic_cache.store('summarize_trend', cache_text, result, vector)
         return result
         
     except Exception as e:
@@ -444,6 +956,54 @@ JSON відповідь:
         }
 
 
+async def batch_analyze_profiles_async(profiles: List[Dict], max_profiles: int = 50,
+                                      concurrency: int = OPENAI_CONCURRENCY,
+                                      pack_size: int = ANALYZE_PACK_SIZE) -> List[Dict]:
+    """
+    🔄 Пакетний аналіз профілів
+
+    Профілі пакуються по `pack_size` в один запит, пакети йдуть паралельно
+    (не більше `concurrency` запитів одночасно).
+
+    Args:
+        profiles: Список профілів [{username, bio, followers_count, ...}]
+        max_profiles: Максимум профілів для аналізу
+        concurrency: Ліміт одночасних запитів до OpenAI
+        pack_size: Скільки профілів в одному запиті
+
+    Returns:
+        List[Dict] з результатами аналізу (у тому ж порядку, що й profiles)
+    """
+    selected = profiles[:max_profiles]
+    total = len(selected)
+    size = max(1, int(pack_size or 1))
+    sem = asyncio.Semaphore(max(1, int(concurrency or 1)))
+    client = get_async_analyze_client()
+
+    async def _analyze_pack(start: int, pack: List[Dict]) -> List[Dict]:
+        async with sem:
+            print(f"🔍 Аналіз профілів {start+1}-{start+len(pack)}/{total}")
+            return await analyze_profiles_packed_async(pack, client=client)
+
+    packs = [(i, selected[i:i + size]) for i in range(0, total, size)]
+    packed = await asyncio.gather(
+        *(_analyze_pack(start, pack) for start, pack in packs),
+        return_exceptions=True
+    )
+
+    results = []
+    for (_, pack), analyses in zip(packs, packed):
+        if isinstance(analyses, BaseException):
+            analyses = [_analyze_fallback(f'AI помилка: {str(analyses)}') for _ in pack]
+        for profile, analysis in zip(pack, analyses):
+            results.append({
+                **profile,
+                'ai_analysis': analysis
+            })
+
+    return results
+
+
 def batch_analyze_profiles(profiles: List[Dict], max_profiles: int = 50) -> List[Dict]:
     """
     🔄 Пакетний аналіз профілів
@@ -455,25 +1015,97 @@ def batch_analyze_profiles(profiles: List[Dict], max_profiles: int = 50) -> List
     Returns:
         List[Dict] з результатами аналізу
     """
-    results = []
-    
-    for i, profile in enumerate(profiles[:max_profiles]):
-        print(f"🔍 Аналіз профілю {i+1}/{min(len(profiles), max_profiles)}: @{profile.get('username', 'N/A')}")
-        
-        analysis = analyze_profile(
-            username=profile.get('username', ''),
-            bio=profile.get('biography', '') or profile.get('bio', ''),
-            followers_count=profile.get('followers_count', 0),
-            posts_count=profile.get('posts_count', 0),
-            is_business=profile.get('is_business', False)
+    return _run_async(batch_analyze_profiles_async(profiles, max_profiles=max_profiles))
+
+
+def batch_analyze_profiles_via_batch_api(profiles: List[Dict],
+                                        poll_seconds: int = BATCH_API_POLL_SECONDS,
+                                        timeout_seconds: int = 24 * 3600,
+                                        on_progress: Optional[Callable] = None) -> List[Dict]:
+    """
+    🌙 Пакетний аналіз профілів через OpenAI Batch API (для фонових задач)
+
+    Результат приходить асинхронно (до 24 год), тому функція блокує виконання
+    і опитує статус batch кожні `poll_seconds`. Не викликати з HTTP-запиту.
+
+    Args:
+        profiles: Список профілів [{username, bio, followers_count, ...}]
+        poll_seconds: Інтервал опитування статусу batch
+        timeout_seconds: Максимальний час очікування
+        on_progress: callback(batch) після кожного опитування (batch.request_counts)
+
+    Returns:
+        List[Dict] з результатами аналізу (у тому ж порядку, що й profiles)
+    """
+    client = get_openai_client()
+    if not client or not profiles:
+        return [{**p, 'ai_analysis': _analyze_fallback('AI недоступний - базова оцінка')} for p in profiles]
+
+    # 1) JSONL: один chat.completions запит на профіль; custom_id = індекс (username може повторюватись)
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+        input_path = f.name
+        for i, profile in enumerate(profiles):
+            messages = _build_analyze_messages(**_profile_kwargs(profile))
+            f.write(json.dumps({
+                'custom_id': str(i),
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': 'gpt-4o-mini',
+                    'messages': messages,
+                    'temperature': 0.3,
+                    'max_tokens': 500,
+                    'response_format': JSON_RESPONSE_FORMAT,
+                },
+            }, ensure_ascii=False) + '\n')
+
+    analyses: Dict[int, Dict] = {}
+    try:
+        # 2) Upload + 3) create batch
+        with open(input_path, 'rb') as fh:
+            input_file = client.files.create(file=fh, purpose='batch')
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
         )
-        
-        results.append({
-            **profile,
-            'ai_analysis': analysis
-        })
-    
-    return results
+        print(f"🌙 OpenAI batch створено: {batch.id} ({len(profiles)} профілів)")
+
+        # 4) Poll
+        deadline = time.time() + timeout_seconds
+        while batch.status not in BATCH_API_FINAL_STATUSES and time.time() < deadline:
+            time.sleep(max(1, int(poll_seconds)))
+            batch = client.batches.retrieve(batch.id)
+            if on_progress is not None:
+                on_progress(batch)
+
+        if batch.status != 'completed' or not batch.output_file_id:
+            print(f"❌ OpenAI batch {batch.id} завершився зі статусом: {batch.status}")
+        else:
+            # 5) Download output and merge by custom_id
+            output = client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    item = _json.loads(line)
+                    idx = int(item['custom_id'])
+                    body = (item.get('response') or {}).get('body') or {}
+                    analyses[idx] = _parse_json_content(body['choices'][0]['message']['content'])
+                except Exception as e:
+                    print(f"❌ OpenAI batch: не вдалося розібрати рядок: {e}")
+    except Exception as e:
+        print(f"❌ OpenAI batch помилка: {e}")
+    finally:
+        try:
+            os.remove(input_path)
+        except Exception:
+            pass
+
+    return [
+        {**profile, 'ai_analysis': analyses.get(i) or _analyze_fallback('AI batch: немає результату')}
+        for i, profile in enumerate(profiles)
+    ]
 
 
 # Тест
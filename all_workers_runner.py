@@ -8,11 +8,23 @@ Usage:
 Enable via env:
   ENABLE_ALL_WORKERS=true
   WORKERS_LOOP_SECONDS=60
+  WORKERS_PARALLELISM=8
+  WORKERS_QUEUE=rq        # optional: enqueue jobs to Redis (see tasks.py) instead of running them here
 
 Behavior:
 - Automation: runs only when AutomationSettings.enabled=true (UI-controlled).
 - DM assistant: runs only for accounts with DmAssistantSettings.enabled=true (UI-controlled).
 - Invite campaign: runs only for accounts with InviteCampaignSettings.enabled=true (UI-controlled).
+- Only settings rows that are due (next_run_at IS NULL or <= now) are processed; each
+  service sets its own next_run_at. The loop sleeps until the earliest next_run_at,
+  but at most WORKERS_LOOP_SECONDS (so settings saved in the UI are picked up).
+  Run migrate_worker_schedule.py once on existing DBs.
+- Due users are processed in parallel (WORKERS_PARALLELISM threads, each with its own
+  app context/DB session); one user's workers still run sequentially in one thread, so
+  the same Instagram account is never driven from two threads at once.
+- With REDIS_URL set, each job takes a per-user Redis lock, so several runner replicas can
+  run side by side. With WORKERS_QUEUE=rq this process is only the producer: due jobs are
+  enqueued and `rq worker osintgram-workers` processes execute them (scale out freely).
 
 Notes:
 - For production, prefer separate worker processes.
@@ -20,6 +32,7 @@ Notes:
 
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from dotenv import load_dotenv
@@ -28,6 +41,46 @@ load_dotenv()
 
 ENABLE_ALL_WORKERS = os.environ.get('ENABLE_ALL_WORKERS', 'false').lower() in {'1', 'true', 'yes'}
 LOOP_SECONDS = int(os.environ.get('WORKERS_LOOP_SECONDS', '60'))
+PARALLELISM = int(os.environ.get('WORKERS_PARALLELISM', '8'))
+WORKERS_QUEUE = os.environ.get('WORKERS_QUEUE', '').strip().lower()
+
+
+def _due_user_ids(model, now: datetime):
+    from database import db  # noqa: E402
+    from sqlalchemy import or_  # noqa: E402
+
+    rows = (db.session.query(model.user_id)
+            .filter(model.enabled.is_(True),
+                    or_(model.next_run_at.is_(None), model.next_run_at <= now))
+            .distinct()
+            .all())
+    return [r[0] for r in rows]
+
+
+def _seconds_until_next_run(models, now: datetime) -> float:
+    from database import db  # noqa: E402
+
+    next_runs = [
+        db.session.query(db.func.min(model.next_run_at)).filter(model.enabled.is_(True)).scalar()
+        for model in models
+    ]
+    next_runs = [t for t in next_runs if t is not None]
+    if not next_runs:
+        return LOOP_SECONDS
+    return min(LOOP_SECONDS, max(1.0, (min(next_runs) - now).total_seconds()))
+
+
+def _run_user(user_id: str, jobs: set) -> list:
+    """Run due workers for one user (each job opens its own app context: contexts are thread-local)."""
+    from tasks import JOBS  # noqa: E402
+
+    lines = []
+    for job in ('automation', 'dm', 'invite'):
+        if job in jobs:
+            line = JOBS[job](user_id)
+            if line:
+                lines.append(line)
+    return lines
 
 
 def main():
@@ -37,34 +90,60 @@ def main():
 
     # Import only when enabled to avoid side effects on import.
     import app as app_module  # noqa: E402
-    from models import User  # noqa: E402
-    from dm_assistant_service import poll_and_reply_for_user  # noqa: E402
-    from invite_campaign_service import run_invite_campaign_for_user  # noqa: E402
-    from automation_service import create_scheduled_content_from_new_rss, publish_due_content  # noqa: E402
+    from database import db  # noqa: E402
+    from models import AutomationSettings, DmAssistantSettings, InviteCampaignSettings  # noqa: E402
 
     # Reuse the app instance created in app.py (prevents double create_app()).
     flask_app = getattr(app_module, 'app', None) or app_module.create_app()
+    workers = (('automation', AutomationSettings), ('dm', DmAssistantSettings), ('invite', InviteCampaignSettings))
+
+    queue = None
+    if WORKERS_QUEUE == 'rq':
+        from tasks import get_queue, enqueue_user_job  # noqa: E402
+        queue = get_queue()
+        if queue is None:
+            print('WORKERS_QUEUE=rq needs REDIS_URL and rq installed; running jobs in-process.')
 
-    with flask_app.app_context():
+    with flask_app.app_context(), ThreadPoolExecutor(max_workers=max(1, PARALLELISM)) as ex:
         while True:
             try:
-                users = User.query.all()
-                for u in users:
-                    created = create_scheduled_content_from_new_rss(u.id, days=2, max_topics=20)
-                    published = publish_due_content(u.id, limit=3)
-                    replied = poll_and_reply_for_user(u.id, threads_limit=10, messages_per_thread=20)
-                    stats = run_invite_campaign_for_user(u.id)
-
-                    if created or published or replied or stats.get('sent') or stats.get('stopped') or stats.get('failed'):
-                        print(
-                            f"[{datetime.utcnow().isoformat()}] user={u.id} "
-                            f"automation(created={created}, published={published}) "
-                            f"dm_replied={replied} invite={stats}"
-                        )
+                now = datetime.utcnow()
+                due = {}
+                for job, model in workers:
+                    for user_id in _due_user_ids(model, now):
+                        due.setdefault(user_id, set()).add(job)
+                # Release this thread's connection while the pool works.
+                db.session.remove()
+
+                if queue is not None:
+                    enqueued = sum(
+                        enqueue_user_job(queue, job, user_id)
+                        for user_id, jobs in due.items() for job in jobs
+                    )
+                    if enqueued:
+                        print(f"[{datetime.utcnow().isoformat()}] enqueued {enqueued} jobs")
+                    due = {}
+
+                futs = {ex.submit(_run_user, user_id, jobs): user_id for user_id, jobs in due.items()}
+                for f in as_completed(futs):
+                    user_id = futs[f]
+                    try:
+                        lines = f.result()
+                    except Exception as e:
+                        lines = [f"error: {e}"]
+                    if lines:
+                        print(f"[{datetime.utcnow().isoformat()}] user={user_id} " + ' '.join(lines))
+
+                sleep_seconds = _seconds_until_next_run([m for _, m in workers], datetime.utcnow())
+                if queue is not None:
+                    # Enqueued rows stay due until a consumer moves next_run_at; don't spin on them.
+                    sleep_seconds = max(sleep_seconds, min(10, LOOP_SECONDS))
             except Exception as e:
+                db.session.rollback()
                 print(f"All workers error: {e}")
+                sleep_seconds = LOOP_SECONDS
 
-            time.sleep(max(10, LOOP_SECONDS))
+            time.sleep(sleep_seconds)
 
 
 if __name__ == '__main__':
@@ -2,14 +2,23 @@
 Main Flask application for Instagram OSINT.
 Contains all routes for dashboard, accounts, parsing, followers, export, and publishing.
 """
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+import os
+
+# `DEV_SERVER=gevent python app.py`: как в production (gunicorn + gevent) - monkey-patch
+# должен пройти до импорта всего остального (requests, redis, ssl)
+if __name__ == '__main__' and os.environ.get('DEV_SERVER', '').lower() == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, g, render_template, stream_template, get_flashed_messages, request, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context, current_app
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, login_required, current_user
 from flask_migrate import Migrate
 from config import config
-from database import db, init_db
-from models import User, InstagramAccount, Follower, ParseSession, PublishedContent, ExportHistory, MessageLog, SentMessage, RssTrend, ContentIdea, AutomationSettings, RssFeedSettings, AiCache, GeoSettings, DiscoverCache, DmAssistantSettings, InviteCampaignSettings
-from instagram_service import InstagramService
-from encryption import encrypt_password, decrypt_password
+from database import db, init_db, init_query_counter, SCHEMA_NAME
+from models import User, InstagramAccount, Follower, ParseSession, PublishedContent, ExportHistory, MessageLog, SentMessage, RssTrend, ContentIdea, AutomationSettings, RssFeedSettings, AiCache, GeoSettings, DiscoverCache, DmAssistantSettings, InviteCampaignSettings, FOLLOWER_COUNTER_RECOUNT_SQL
+from instagram_service import InstagramService, import_followers_by_username, drop_saved_session, instagram_account_lock, FOLLOWERS_INSERT_CHUNK
+from encryption import encrypt_password, decrypt_account_password
 from geo_search import normalize_geo_config, get_search_hashtags
 from ai_service import analyze_profile, generate_personalized_message, generate_post_content, batch_analyze_profiles, summarize_trend, OPENAI_API_KEY
 from rss_service import get_trending_topics, generate_content_ideas_from_trends
@@ -17,17 +26,415 @@ from auth import auth_bp
 from billing import billing_bp
 from admin import admin_bp
 from saas import saas_require_subscription, is_admin_email, is_subscription_active
-import os
-from datetime import datetime
-from io import BytesIO, StringIO
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import csv
+import io
+import re
+import shutil
+import tempfile
+from sqlalchemy import delete, lambda_stmt, tuple_
+from sqlalchemy.orm import raiseload
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 import uuid
+from types import SimpleNamespace
 from media_utils import normalize_to_jpeg
+import tasks
+from cache import (
+    DISCOVER_CACHE_SECONDS, cache_get_json, cache_set_json, discover_key, invalidate_user_caches,
+    publications_key, source_accounts_key, statistics_key,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Загрузить переменные окружения
 load_dotenv()
 
+# Сколько строк тянуть из server-side курсора за раз при потоковом экспорте
+EXPORT_YIELD_PER = 1000
+
+# Параллельная нормализация изображений карусели /publish (native-потоки: Pillow отпускает GIL)
+MEDIA_NORMALIZE_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def _media_executor(max_workers: int):
+    """
+    Пул native-потоков для Pillow. Под gevent-воркером threading пропатчен: обычный
+    ThreadPoolExecutor - это greenlet-ы на одном OS-потоке, декодирование шло бы подряд
+    и блокировало hub (все остальные запросы воркера) - тогда пул потоков gevent hub-а.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+# Кэш списка источников для фильтра /followers и списков /statistics (Redis, если настроен)
+SOURCE_ACCOUNTS_CACHE_SECONDS = 60
+STATISTICS_CACHE_SECONDS = 60
+STATISTICS_SESSIONS_PER_PAGE = 50
+
+
+class _OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON для jsonify и фильтра tojson через orjson. Формат как у DefaultJSONProvider: ключи
+    отсортированы, datetime/date/Decimal/UUID - через его default(); tojson по-прежнему
+    экранирует <, >, & и ' (htmlsafe_json_dumps вызывает этот dumps).
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class _CsvEcho:
+    """Псевдо-буфер для csv.writer: writerow() сразу возвращает строку (без накопления)."""
+
+    def write(self, value):
+        return value
+
+
+# Заголовки CSV-экспорта: строка рендерится один раз при импорте, а не на каждый запрос
+META_ADS_CSV_HEADER = csv.writer(_CsvEcho()).writerow([
+    'email',
+    'phone',
+    'fn',  # first name
+    'ln',  # last name
+    'country',
+    'external_id'
+])
+FULL_CSV_HEADER = csv.writer(_CsvEcho()).writerow([
+    'Username',
+    'Full Name',
+    'Followers',
+    'Following',
+    'Posts',
+    'Email',
+    'Phone',
+    'Website',
+    'Is Verified',
+    'Is Business',
+    'Is Private',
+    'Biography',
+    'Source Account',
+    'Quality Score',
+    'Collected At'
+])
+
+
+def create_schema_and_tables(app) -> None:
+    """CREATE SCHEMA IF NOT EXISTS + db.create_all() (идемпотентно)."""
+    from database import SCHEMA_NAME
+    from sqlalchemy import text
+    with app.app_context():
+        # Сначала создаём schema
+        with db.engine.connect() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME}'))
+            conn.commit()
+            print(f"Schema '{SCHEMA_NAME}' создана или уже существует")
+        
+        # Затем создаём таблицы
+        db.create_all()
+        print(f"Все таблицы созданы в schema '{SCHEMA_NAME}'")
+
+
+def schema_tables_missing(app) -> bool:
+    """True, если в schema нет таблицы users (release/pre-deploy `flask init-db` не выполнялся)."""
+    from database import SCHEMA_NAME
+    from sqlalchemy import inspect
+    with app.app_context():
+        return not inspect(db.engine).has_table('users', schema=SCHEMA_NAME)
+
+
+def _parse_followers_cursor():
+    """Keyset-курсор (coalesce(quality_score, 0), id) из query args или None."""
+    raw_score = (request.args.get('after_score') or '').strip()
+    raw_id = (request.args.get('after_id') or '').strip()
+    if not raw_score or not raw_id:
+        return None
+    try:
+        return int(raw_score), raw_id
+    except ValueError:
+        return None
+
+
+# Импорт: username - всё между запятыми/пробельными символами; файл читается блоками по IMPORT_READ_CHARS
+_IMPORT_USERNAME_TOKEN = re.compile(r'[^\s,]+')
+IMPORT_READ_CHARS = 64 * 1024
+
+
+def _is_import_separator(char: str) -> bool:
+    return char == ',' or char.isspace()
+
+
+def _get_last_discovered(user_id: str) -> dict:
+    """Последний результат поиска схожих аккаунтов: {'accounts': [...], 'instagram_account_id': ...}."""
+    key = discover_key(user_id)
+    cached = cache_get_json(key)
+    if cached is not None:
+        return cached
+
+    last_cache = (db.session.query(DiscoverCache.payload, DiscoverCache.instagram_account_id)
+                  .filter_by(user_id=user_id)
+                  .order_by(DiscoverCache.updated_at.desc())
+                  .first())
+    discovered = {
+        'accounts': (last_cache.payload or []) if last_cache else [],
+        'instagram_account_id': last_cache.instagram_account_id if last_cache else '',
+    }
+
+    cache_set_json(key, discovered, DISCOVER_CACHE_SECONDS)
+    return discovered
+
+
+def _get_source_accounts(user_id: str) -> list:
+    """
+    Источники для фильтра /followers из ParseSession.competitor_usernames
+    (сессий на порядки меньше, чем подписчиков - вместо DISTINCT по followers).
+    """
+    key = source_accounts_key(user_id)
+    cached = cache_get_json(key)
+    if cached is not None:
+        return cached
+
+    sources = set()
+    rows = db.session.query(ParseSession.competitor_usernames, ParseSession.failed_accounts).filter_by(user_id=user_id)
+    for usernames, failed_accounts in rows:
+        # Старые импорты сохраняли источник строкой, а не списком
+        if isinstance(usernames, str):
+            usernames = [usernames]
+        # Аккаунты, которые в этой сессии не спарсились, подписчиков не дали
+        failed = set(failed_accounts or {})
+        sources.update(
+            u.strip().lstrip('@') for u in usernames or []
+            if u and u.strip() and u.strip().lstrip('@') not in failed
+        )
+    sources = sorted(sources)
+
+    cache_set_json(key, sources, SOURCE_ACCOUNTS_CACHE_SECONDS)
+    return sources
+
+
+def _parse_statistics_cursor():
+    """Keyset-курсор (started_at, id) сессий из query args или None."""
+    raw_before = (request.args.get('before') or '').strip()
+    raw_id = (request.args.get('before_id') or '').strip()
+    if not raw_before or not raw_id:
+        return None
+    try:
+        return datetime.fromisoformat(raw_before), raw_id
+    except ValueError:
+        return None
+
+
+def _statistics_row(row) -> dict:
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row._asdict().items()}
+
+
+def _statistics_obj(row: dict, date_field: str):
+    if row.get(date_field):
+        row = dict(row, **{date_field: datetime.fromisoformat(row[date_field])})
+    return SimpleNamespace(**row)
+
+
+def _query_statistics_sessions(user_id: str, cursor=None) -> list:
+    """Страница сессий (STATISTICS_SESSIONS_PER_PAGE + 1 строка - признак следующей страницы)."""
+    query = (db.session.query(
+                 ParseSession.id, ParseSession.started_at, ParseSession.competitor_usernames,
+                 ParseSession.status, ParseSession.total_followers_collected,
+                 ParseSession.duration_seconds, ParseSession.failed_accounts)
+             .filter_by(user_id=user_id))
+    if cursor is not None:
+        query = query.filter(tuple_(ParseSession.started_at, ParseSession.id) < cursor)
+    rows = (query.order_by(ParseSession.started_at.desc(), ParseSession.id.desc())
+            .limit(STATISTICS_SESSIONS_PER_PAGE + 1)
+            .all())
+    return [_statistics_row(s) for s in rows]
+
+
+# Первая страница /statistics одним round-trip: сессии и экспорты сразу в JSON
+# (даты - ISO с 6 знаками микросекунд, как ждет _statistics_obj / datetime.fromisoformat)
+_STATISTICS_FIRST_PAGE_SQL = f"""
+SELECT
+  (SELECT COALESCE(json_agg(s ORDER BY s.started_at DESC, s.id DESC), '[]'::json)
+   FROM (SELECT id,
+                to_char(started_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS started_at,
+                competitor_usernames, status, total_followers_collected,
+                duration_seconds, failed_accounts
+         FROM {SCHEMA_NAME}.parse_sessions
+         WHERE user_id = :user_id
+         ORDER BY parse_sessions.started_at DESC, id DESC
+         LIMIT :sessions_limit) s) AS sessions,
+  (SELECT COALESCE(json_agg(e ORDER BY e.exported_at DESC), '[]'::json)
+   FROM (SELECT export_type, rows_exported,
+                to_char(exported_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS exported_at
+         FROM {SCHEMA_NAME}.export_history
+         WHERE user_id = :user_id
+         ORDER BY export_history.exported_at DESC
+         LIMIT 10) e) AS exports
+"""
+
+
+# Дашборд одним round-trip: количество аккаунтов и сессий + 5 последних сессий в JSON
+_DASHBOARD_SQL = f"""
+SELECT
+  (SELECT count(*) FROM {SCHEMA_NAME}.instagram_accounts WHERE user_id = :user_id) AS accounts,
+  (SELECT count(*) FROM {SCHEMA_NAME}.parse_sessions WHERE user_id = :user_id) AS sessions,
+  (SELECT COALESCE(json_agg(s ORDER BY s.started_at DESC), '[]'::json)
+   FROM (SELECT id,
+                to_char(started_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS started_at,
+                competitor_usernames, status, total_followers_collected
+         FROM {SCHEMA_NAME}.parse_sessions
+         WHERE user_id = :user_id
+         ORDER BY parse_sessions.started_at DESC
+         LIMIT 5) s) AS recent_sessions
+"""
+
+
+def _get_statistics_page(user_id: str, cursor=None):
+    """
+    (sessions, exports, next_args) для /statistics и /api/statistics - словари с датами в ISO,
+    только колонки, которые рендерит шаблон. Первая страница сессий и экспорты кэшируются
+    в Redis на STATISTICS_CACHE_SECONDS; следующие страницы сессий читаются из БД по курсору.
+    """
+    key = statistics_key(user_id)
+    payload = cache_get_json(key)
+    if payload is None:
+        row = db.session.execute(
+            db.text(_STATISTICS_FIRST_PAGE_SQL),
+            {'user_id': user_id, 'sessions_limit': STATISTICS_SESSIONS_PER_PAGE + 1}
+        ).one()
+        payload = {'sessions': row.sessions, 'exports': row.exports}
+        cache_set_json(key, payload, STATISTICS_CACHE_SECONDS)
+
+    sessions = payload['sessions'] if cursor is None else _query_statistics_sessions(user_id, cursor)
+    next_args = None
+    if len(sessions) > STATISTICS_SESSIONS_PER_PAGE:
+        sessions = sessions[:STATISTICS_SESSIONS_PER_PAGE]
+        next_args = {'before': sessions[-1]['started_at'], 'before_id': sessions[-1]['id']}
+    return sessions, payload['exports'], next_args
+
+
+def _get_follower_counters(user) -> dict:
+    """Денормализованные счетчики users (ведут триггеры на followers) - без запроса к БД."""
+    return {
+        'total_followers': user.followers_count,
+        'followers_with_email': user.followers_with_email_count,
+        'verified_followers': user.followers_verified_count,
+        'business_followers': user.followers_business_count,
+    }
+
+
+def _get_recent_publications(user_id: str) -> list:
+    """10 последних публикаций для /publish (только рендерящиеся колонки, кэш STATISTICS_CACHE_SECONDS)."""
+    key = publications_key(user_id)
+    rows = cache_get_json(key)
+    if rows is None:
+        publications = (db.session.query(
+                            PublishedContent.content_type, PublishedContent.status, PublishedContent.created_at)
+                        .filter_by(user_id=user_id)
+                        .order_by(PublishedContent.created_at.desc())
+                        .limit(10)
+                        .all())
+        rows = [_statistics_row(p) for p in publications]
+        cache_set_json(key, rows, STATISTICS_CACHE_SECONDS)
+    return [_statistics_obj(p, 'created_at') for p in rows]
+
+
+def _iter_import_usernames(sources):
+    """
+    username'ы из текстовых блоков (файл/textarea): разделители - запятые и пробельные
+    символы, '@' убирается. Блок разбирается одним findall (C), а не split/strip в Python по строкам.
+    """
+    for chunks in sources:
+        tail = ''
+        for chunk in chunks:
+            chunk = tail + chunk
+            tokens = _IMPORT_USERNAME_TOKEN.findall(chunk)
+            # Последний токен может продолжаться в следующем блоке - переносим его
+            tail = tokens.pop() if tokens and not _is_import_separator(chunk[-1]) else ''
+            for token in tokens:
+                username = token.lstrip('@')
+                if username:
+                    yield username
+        username = tail.lstrip('@')
+        if username:
+            yield username
+
+
+def _save_upload(file_storage, path: str) -> None:
+    """
+    Сохранить загруженный файл. Werkzeug держит загрузку в SpooledTemporaryFile: больше 500 КБ -
+    уже временный файл на диске, его копирует ядро (os.sendfile), без чтения в Python; меньше -
+    в памяти, и fileno() сначала сбросил бы её в новый временный файл (rollover), поэтому
+    такие (и BytesIO) - copyfileobj по 1 МБ.
+    """
+    src = file_storage.stream
+    with open(path, 'wb') as dst:
+        if not getattr(src, '_rolled', True):
+            shutil.copyfileobj(src, dst, length=1 << 20)
+            return
+        try:
+            src_fd = src.fileno()
+            size = os.fstat(src_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # Частично скопированное перезаписываем с начала обычным копированием
+            dst.seek(0)
+            dst.truncate()
+            src.seek(0)
+            shutil.copyfileobj(src, dst, length=1 << 20)
+
+
+def _drop_legacy_session_keys(*keys: str) -> None:
+    """
+    Убрать из cookie-сессии старые большие payload'ы. pop() отсутствующего ключа тоже
+    помечает сессию измененной - и Flask заново подписывает и отправляет cookie в каждом ответе.
+    """
+    from flask import session as flask_session
+    for key in keys:
+        if key in flask_session:
+            flask_session.pop(key)
+
+
+def _csv_response(rows, filename: str, on_close=None) -> Response:
+    """
+    Потоковый CSV: строки уходят клиенту по мере чтения из БД, память O(1).
+    on_close() вызывается (в app context) после закрытия ответа - вне пути отдачи данных.
+    """
+    response = Response(
+        stream_with_context(rows),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+    if on_close is not None:
+        flask_app = current_app._get_current_object()
+
+        def _run_on_close():
+            with flask_app.app_context():
+                on_close()
+
+        response.call_on_close(_run_on_close)
+    return response
+
 
 def create_app(config_name=None):
     """
@@ -44,9 +451,12 @@ def create_app(config_name=None):
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    if orjson is not None:
+        app.json = _OrjsonProvider(app)
     
     # Инициализация расширений
     db.init_app(app)
+    init_query_counter(app)
     migrate = Migrate(app, db)
     
     # Login Manager
@@ -72,19 +482,41 @@ def create_app(config_name=None):
     app.register_blueprint(billing_bp)
     app.register_blueprint(admin_bp)
     
-    # Создать schema и таблицы при первом запуске
-    with app.app_context():
-        # Сначала создаём schema
-        from database import SCHEMA_NAME
-        from sqlalchemy import text
-        with db.engine.connect() as conn:
-            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME}'))
-            conn.commit()
-            print(f"Schema '{SCHEMA_NAME}' создана или уже существует")
-        
-        # Затем создаём таблицы
-        db.create_all()
-        print(f"Все таблицы созданы в schema '{SCHEMA_NAME}'")
+    # Создать schema и таблицы: явный шаг `flask init-db` (release / Render Pre-Deploy) или при старте,
+    # если включен RUN_DDL (по умолчанию только в development) либо таблиц еще нет
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Создать schema и таблицы (CREATE SCHEMA + db.create_all())."""
+        create_schema_and_tables(app)
+    
+    @app.cli.command('recount-followers')
+    def recount_followers_command():
+        """Пересчитать users.followers_* из followers (если счетчики разошлись с данными)."""
+        # Блокирует запись в followers до commit, чтобы триггеры не добавили дельту поверх пересчета
+        db.session.execute(db.text(f'LOCK TABLE {SCHEMA_NAME}.followers IN SHARE ROW EXCLUSIVE MODE'))
+        result = db.session.execute(db.text(FOLLOWER_COUNTER_RECOUNT_SQL))
+        db.session.commit()
+        print(f"✅ Пересчитаны счетчики подписчиков: {result.rowcount} пользователей")
+    
+    @app.cli.command('score-followers')
+    def score_followers_command():
+        """Ночной AI-скоринг неразобранных подписчиков через OpenAI Batch API (cron, до 24ч)."""
+        def _progress(batch):
+            counts = batch.request_counts
+            print(f"🌙 batch {batch.id}: {batch.status} ({counts.completed}/{counts.total})")
+        scored = tasks.score_unanalyzed_followers(on_progress=_progress)
+        print(f"✅ AI-скоринг: обновлено {scored} подписчиков")
+    
+    if app.config.get('RUN_DDL') or schema_tables_missing(app):
+        create_schema_and_tables(app)
+    
+    # Настройки, которые не меняются после старта: читаются один раз, а не в каждом запросе
+    items_per_page = app.config.get('ITEMS_PER_PAGE', 50)
+    upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+    workers_env = {
+        'ENABLE_ALL_WORKERS': os.environ.get('ENABLE_ALL_WORKERS', ''),
+        'ENABLE_DM_ASSISTANT': os.environ.get('ENABLE_DM_ASSISTANT', ''),
+    }
 
     def _get_geo_config_for_user(user_id: str):
         row = GeoSettings.query.filter_by(user_id=user_id).first()
@@ -100,6 +532,59 @@ def create_app(config_name=None):
             }
         return normalize_geo_config(geo_overrides)
     
+    def _list_accounts(user_id: str):
+        """Аккаунты пользователя для списков/селектов: шаблоны читают только колонки, связи не грузятся."""
+        return InstagramAccount.query.options(raiseload('*')).filter_by(user_id=user_id).all()
+    
+    def _get_user_account(account_id):
+        """Аккаунт текущего пользователя по id (или None). В пределах запроса - из g, без повторного SELECT."""
+        cache = g.setdefault('user_accounts', {})
+        if account_id not in cache:
+            cache[account_id] = InstagramAccount.query.filter_by(id=account_id, user_id=current_user.id).first()
+        return cache[account_id]
+    
+    def _today_range():
+        # Диапазон по sent_at (индекс user_id + sent_at), а не date(sent_at) = today
+        day_start = datetime.combine(date.today(), datetime.min.time())
+        return day_start, day_start + timedelta(days=1)
+    
+    def _count_messages_used_today(user_id: str) -> int:
+        """Отправлено сегодня + еще не отправленные получатели сегодняшних pending/running рассылок."""
+        day_start, day_end = _today_range()
+        # lambda_stmt: конструкция и cache key строятся один раз, дальше - только параметры
+        # (значения вычисляются снаружи lambda - внутри допустимы только замыкания)
+        return db.session.scalar(lambda_stmt(
+            lambda: db.select(
+                db.select(db.func.count()).select_from(SentMessage).where(
+                    SentMessage.user_id == user_id,
+                    SentMessage.sent_at >= day_start,
+                    SentMessage.sent_at < day_end,
+                ).scalar_subquery()
+                + db.select(db.func.coalesce(db.func.sum(
+                    db.func.greatest(MessageLog.total_recipients - MessageLog.total_sent, 0)), 0)).where(
+                    MessageLog.user_id == user_id,
+                    MessageLog.status.in_(('pending', 'running')),
+                    MessageLog.created_at >= day_start,
+                ).scalar_subquery()
+            )
+        ))
+    
+    def _stream_page(template_name: str, **context):
+        """
+        Страница со списками: HTML отдается по мере рендера (stream_template), без сборки
+        всей строки в памяти. Flash-сообщения забираются из сессии до отправки заголовков -
+        иначе Set-Cookie уже ушел бы, и base.html показал бы их повторно.
+        """
+        get_flashed_messages(with_categories=True)
+        return stream_template(template_name, **context)
+    
+    def _flash_job_result(result: dict) -> None:
+        flash(result['message'], result.get('category', 'info'))
+    
+    def _job_started(job_id: str, message: str, events_url: str = None):
+        """202 + страница, которая опрашивает /jobs/<job_id> и уходит на redirect по завершении."""
+        return render_template('job_status.html', job_id=job_id, message=message, events_url=events_url), 202
+    
     # ============ ROUTES ============
 
     @app.before_request
@@ -155,30 +640,17 @@ def create_app(config_name=None):
     @login_required
     def dashboard():
         """Дашборд пользователя со статистикой"""
-        user_id = current_user.id
-        
-        # Статистика
-        instagram_accounts_count = InstagramAccount.query.filter_by(user_id=user_id).count()
-        total_followers = Follower.query.filter_by(user_id=user_id).count()
-        parse_sessions_count = ParseSession.query.filter_by(user_id=user_id).count()
-        
-        # Подписчики с email
-        followers_with_email = Follower.query.filter(
-            Follower.user_id == user_id,
-            Follower.email.isnot(None)
-        ).count()
-        
-        # Последние сессии парсинга
-        recent_sessions = ParseSession.query.filter_by(user_id=user_id).order_by(
-            ParseSession.started_at.desc()
-        ).limit(5).all()
+        # Аккаунты, сессии и 5 последних сессий (только колонки шаблона) - одним запросом;
+        # счетчики подписчиков - денормализованные колонки уже загруженной строки users
+        stats = db.session.execute(db.text(_DASHBOARD_SQL), {'user_id': current_user.id}).one()
+        counters = _get_follower_counters(current_user)
         
         return render_template('dashboard.html',
-            instagram_accounts_count=instagram_accounts_count,
-            total_followers=total_followers,
-            followers_with_email=followers_with_email,
-            parse_sessions_count=parse_sessions_count,
-            recent_sessions=recent_sessions
+            instagram_accounts_count=stats.accounts,
+            total_followers=counters['total_followers'],
+            followers_with_email=counters['followers_with_email'],
+            parse_sessions_count=stats.sessions,
+            recent_sessions=[_statistics_obj(s, 'started_at') for s in stats.recent_sessions]
         )
     
     @app.route('/accounts', methods=['GET', 'POST'])
@@ -194,7 +666,8 @@ def create_app(config_name=None):
                 flash('Введите username и пароль', 'error')
                 return redirect(url_for('manage_accounts'))
             
-            # Проверить не существует ли уже такой аккаунт
+            # Быстрая проверка до логина в Instagram (логин дорогой и рискованный);
+            # окончательно уникальность гарантирует индекс в БД
             existing = InstagramAccount.query.filter_by(
                 user_id=current_user.id,
                 instagram_username=username
@@ -204,121 +677,48 @@ def create_app(config_name=None):
                 flash('Этот аккаунт уже добавлен', 'error')
                 return redirect(url_for('manage_accounts'))
             
-            # Настройка прокси
-            proxy = None
             if proxy_str:
-                proxy = {'http': proxy_str, 'https': proxy_str}
                 flash(f'Используем прокси: {proxy_str}', 'info')
             
-            # Попробовать войти в аккаунт
-            flash('Проверяем данные аккаунта...', 'info')
-            service = InstagramService(username, password, proxy=proxy)
-            success, message = service.login()
+            # 🔐 Шифруємо пароль перед збереженням (и перед отправкой в очередь)
+            encrypted_pwd = encrypt_password(password)
             
-            if not success:
-                flash(f'Ошибка входа: {message}', 'error')
-                return redirect(url_for('manage_accounts'))
-            
-            # Получить информацию о профиле
-            account_info = service.get_account_info()
-            if not account_info:
-                flash('Не удалось получить информацию о профиле', 'error')
-                return redirect(url_for('manage_accounts'))
-            
-            # Сохранить аккаунт
-            try:
-                # 🔐 Шифруємо пароль перед збереженням
-                encrypted_pwd = encrypt_password(password)
-                
-                instagram_account = InstagramAccount(
-                    user_id=current_user.id,
-                    instagram_username=username,
-                    instagram_password=encrypted_pwd,  # 🔐 Зашифровано!
-                    instagram_user_id=account_info.get('user_id'),
-                    full_name=account_info.get('full_name'),
-                    biography=account_info.get('biography'),
-                    profile_pic_url=account_info.get('profile_pic_url'),
-                    followers_count=account_info.get('followers_count'),
-                    following_count=account_info.get('following_count'),
-                    posts_count=account_info.get('posts_count'),
-                    is_verified=account_info.get('is_verified', False),
-                    is_business=account_info.get('is_business', False),
-                    is_private=account_info.get('is_private', False),
-                    last_sync=datetime.utcnow()
-                )
-                db.session.add(instagram_account)
-                db.session.commit()
-                
-                flash(f'Аккаунт @{username} успешно добавлен!', 'success')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Ошибка сохранения: {str(e)}', 'error')
+            # Логин + профиль = два запроса в Instagram: при наличии очереди — в фоне
+            job_id = tasks.enqueue_web_job('add_account', current_user.id, username, encrypted_pwd, proxy_str or None,
+                                           user_id=current_user.id, redirect_url=url_for('manage_accounts'))
+            if job_id:
+                return _job_started(job_id, 'Проверяем данные аккаунта...')
             
+            _flash_job_result(tasks.add_instagram_account(current_user.id, username, encrypted_pwd, proxy_str or None))
             return redirect(url_for('manage_accounts'))
         
         # GET - вывести список аккаунтов
-        accounts = InstagramAccount.query.filter_by(user_id=current_user.id).all()
+        accounts = _list_accounts(current_user.id)
         return render_template('add_account.html', accounts=accounts)
     
     @app.route('/accounts/<account_id>/delete', methods=['POST'])
     @login_required
     def delete_account(account_id):
         """Удаление Instagram аккаунта"""
-        account = InstagramAccount.query.filter_by(
-            id=account_id,
-            user_id=current_user.id
-        ).first()
+        account = _get_user_account(account_id)
         
         if not account:
             flash('Аккаунт не найден', 'error')
             return redirect(url_for('manage_accounts'))
         
         try:
-            # Best-effort: remove local instagrapi session file for this username
-            try:
-                session_path = os.path.join(os.path.dirname(__file__), 'sessions', f"{account.instagram_username}_session.json")
-                if os.path.exists(session_path):
-                    os.remove(session_path)
-            except Exception:
-                pass
-
-            # Remove dependent rows to avoid FK constraint errors
-            from models import (
-                DmAssistantSettings, DmThreadState, DmMessage,
-                InviteCampaignSettings, InviteCampaignRecipient, InviteCampaignSend,
-                PublishedContent, MessageLog,
-                DiscoverCache,
-            )
-
-            # DM assistant - delete first to avoid FK issues
-            DmMessage.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-            DmThreadState.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-            DmAssistantSettings.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
+            username = account.instagram_username
 
-            # Invite campaign
-            InviteCampaignSend.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-            InviteCampaignRecipient.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-            InviteCampaignSettings.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
+            # Best-effort: remove saved instagrapi session (file + Redis) for this username
+            drop_saved_session(username)
 
-            # Published content history
-            PublishedContent.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-
-            # Discover cache
-            DiscoverCache.query.filter_by(instagram_account_id=account.id).delete(synchronize_session='fetch')
-
-            # Manual Direct blast logs: delete SentMessage rows linked to MessageLog, then MessageLog
-            log_ids = [r[0] for r in db.session.query(MessageLog.id).filter_by(account_id=account.id).all()]
-            if log_ids:
-                SentMessage.query.filter(SentMessage.message_log_id.in_(log_ids)).delete(synchronize_session='fetch')
-                MessageLog.query.filter(MessageLog.id.in_(log_ids)).delete(synchronize_session='fetch')
-
-            # Commit dependents first to release locks before deleting the account
-            db.session.commit()
-
-            # Now delete the account itself
-            db.session.delete(account)
+            # Один DELETE: зависимые строки (DM, инвайты, публикации, discover-кэш, логи рассылок
+            # с SentMessage, сессии парсинга с их подписчиками) удаляет БД по FK ON DELETE CASCADE
+            # (models.py; существующие БД - migrate_account_cascades.py)
+            db.session.execute(delete(InstagramAccount).where(InstagramAccount.id == account.id))
             db.session.commit()
-            flash(f'Аккаунт @{account.instagram_username} удален', 'success')
+            invalidate_user_caches(current_user.id)
+            flash(f'Аккаунт @{username} удален', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Ошибка удаления: {str(e)}', 'error')
@@ -329,45 +729,19 @@ def create_app(config_name=None):
     @login_required
     def update_account_password(account_id):
         """Re-save Instagram password (encrypt again) and verify login."""
-        account = InstagramAccount.query.filter_by(
-            id=account_id,
-            user_id=current_user.id
-        ).first()
-
-        if not account:
-            flash('Аккаунт не найден', 'error')
-            return redirect(url_for('manage_accounts'))
-
         new_password = request.form.get('new_instagram_password', '')
         if not new_password:
             flash('Введите новый пароль', 'error')
             return redirect(url_for('manage_accounts'))
 
-        # Verify credentials before saving
-        flash('Проверяем новый пароль...', 'info')
-        service = InstagramService(account.instagram_username, new_password)
-        success, message = service.login()
-        if not success:
-            flash(f'Ошибка входа: {message}', 'error')
-            return redirect(url_for('manage_accounts'))
-
-        try:
-            account.instagram_password = encrypt_password(new_password)
-
-            # Remove local instagrapi session file to avoid stale sessions
-            try:
-                session_path = os.path.join(os.path.dirname(__file__), 'sessions', f"{account.instagram_username}_session.json")
-                if os.path.exists(session_path):
-                    os.remove(session_path)
-            except Exception:
-                pass
-
-            db.session.commit()
-            flash(f'Пароль для @{account.instagram_username} обновлен', 'success')
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Ошибка сохранения пароля: {str(e)}', 'error')
+        # Проверка входом в Instagram перед сохранением: при наличии очереди — в фоне
+        encrypted_pwd = encrypt_password(new_password)
+        job_id = tasks.enqueue_web_job('update_password', current_user.id, account_id, encrypted_pwd,
+                                       user_id=current_user.id, redirect_url=url_for('manage_accounts'))
+        if job_id:
+            return _job_started(job_id, 'Проверяем новый пароль...')
 
+        _flash_job_result(tasks.update_account_password(current_user.id, account_id, encrypted_pwd))
         return redirect(url_for('manage_accounts'))
     
     @app.route('/parse', methods=['GET', 'POST'])
@@ -394,10 +768,7 @@ def create_app(config_name=None):
                 return redirect(url_for('parse_competitors'))
             
             # Проверить существует ли аккаунт
-            account = InstagramAccount.query.filter_by(
-                id=instagram_account_id,
-                user_id=current_user.id
-            ).first()
+            account = _get_user_account(instagram_account_id)
             
             if not account:
                 flash('Instagram аккаунт не найден', 'error')
@@ -412,46 +783,22 @@ def create_app(config_name=None):
             )
             db.session.add(parse_session)
             db.session.commit()
+            invalidate_user_caches(current_user.id)
             
-            # Начать парсинг
-            try:
-                # 🔐 Розшифровуємо пароль
-                decrypted_pwd = decrypt_password(account.instagram_password)
-                service = InstagramService(account.instagram_username, decrypted_pwd)
-                success, message = service.login()
-                
-                if not success:
-                    parse_session.status = 'failed'
-                    parse_session.error_message = f'Ошибка входа: {message}'
-                    db.session.commit()
-                    flash(f'Ошибка входа в аккаунт: {message}', 'error')
-                    return redirect(url_for('parse_competitors'))
-                
-                # Парсить подписчиков
-                total_collected, failed_accounts = service.parse_competitors(
-                    competitor_usernames,
-                    parse_session.id,
-                    current_user.id,
-                    max_followers
-                )
-                
-                if failed_accounts:
-                    failed_msg = ', '.join([f"@{k}: {v}" for k, v in failed_accounts.items()])
-                    flash(f'Деякі акаунти не вдалося обробити: {failed_msg}', 'warning')
-                
-                flash(f'✅ Зібрано {total_collected} профілів!', 'success')
-                return redirect(url_for('followers_table', session_id=parse_session.id))
+            # Парсинг занимает минуты: при наличии очереди — в фоне (статус виден в сессии)
+            done_url = url_for('followers_table', session_id=parse_session.id)
+            job_id = tasks.enqueue_web_job('parse', parse_session.id, max_followers,
+                                           user_id=current_user.id, redirect_url=done_url)
+            if job_id:
+                return _job_started(job_id, '⏳ Парсинг запущен в фоне...',
+                                    events_url=url_for('parse_events', session_id=parse_session.id))
             
-            except Exception as e:
-                parse_session.status = 'failed'
-                parse_session.error_message = str(e)
-                parse_session.completed_at = datetime.utcnow()
-                db.session.commit()
-                flash(f'Ошибка при парсинге: {str(e)}', 'error')
-                return redirect(url_for('parse_competitors'))
+            result = tasks.parse_competitors(parse_session.id, max_followers)
+            _flash_job_result(result)
+            return redirect(done_url if result['ok'] else url_for('parse_competitors'))
         
         # GET - форма для парсинга
-        accounts = InstagramAccount.query.filter_by(user_id=current_user.id).all()
+        accounts = _list_accounts(current_user.id)
         return render_template('parse_competitors.html', accounts=accounts)
     
     @app.route('/discover', methods=['GET', 'POST'])
@@ -465,68 +812,30 @@ def create_app(config_name=None):
                 flash('Оберіть Instagram акаунт для пошуку', 'error')
                 return redirect(url_for('discover_accounts'))
             
-            account = InstagramAccount.query.filter_by(
-                id=instagram_account_id,
-                user_id=current_user.id
-            ).first()
+            account = _get_user_account(instagram_account_id)
             
             if not account:
                 flash('Instagram акаунт не знайдено', 'error')
                 return redirect(url_for('discover_accounts'))
             
-            try:
-                # 🔐 Розшифровуємо пароль
-                decrypted_pwd = decrypt_password(account.instagram_password)
-                service = InstagramService(account.instagram_username, decrypted_pwd)
-                success, message = service.login()
-                
-                if not success:
-                    flash(f'Помилка входу: {message}', 'error')
-                    return redirect(url_for('discover_accounts'))
-                
-                # 🔍 Пошук схожих акаунтів
-                flash('🔍 Шукаємо схожі акаунти... Це може зайняти 1-2 хвилини', 'info')
-                geo_cfg = _get_geo_config_for_user(current_user.id)
-                discovered = service.discover_similar_accounts(geo_config=geo_cfg)
-
-                # Зберігаємо server-side в БД (а не в cookie-session)
-                top = discovered[:30]
-                try:
-                    cache_row = (DiscoverCache.query
-                                 .filter_by(user_id=current_user.id, instagram_account_id=instagram_account_id)
-                                 .first())
-                    if cache_row is None:
-                        cache_row = DiscoverCache(
-                            user_id=current_user.id,
-                            instagram_account_id=instagram_account_id,
-                            payload=top
-                        )
-                        db.session.add(cache_row)
-                    else:
-                        cache_row.payload = top
-                    db.session.commit()
-                except Exception:
-                    db.session.rollback()
-                
-                flash(f'✅ Знайдено {len(discovered)} потенційних акаунтів!', 'success')
-                return redirect(url_for('discover_accounts'))
-                
-            except Exception as e:
-                flash(f'Помилка пошуку: {str(e)}', 'error')
-                return redirect(url_for('discover_accounts'))
+            # 🔍 Пошук схожих акаунтів (1-2 хвилини): за наявності черги — у фоні
+            geo_cfg = _get_geo_config_for_user(current_user.id)
+            job_id = tasks.enqueue_web_job('discover', current_user.id, instagram_account_id, geo_cfg,
+                                           user_id=current_user.id, redirect_url=url_for('discover_accounts'))
+            if job_id:
+                return _job_started(job_id, '🔍 Шукаємо схожі акаунти... Це може зайняти 1-2 хвилини')
+            
+            _flash_job_result(tasks.discover_accounts(current_user.id, instagram_account_id, geo_cfg))
+            return redirect(url_for('discover_accounts'))
         
         # GET - показати форму та результати
         # Якщо раніше щось клали в cookie-session — прибираємо, щоб не було oversized cookie warning
-        from flask import session as flask_session
-        flask_session.pop('discovered_accounts', None)
+        _drop_legacy_session_keys('discovered_accounts')
 
-        last_cache = (DiscoverCache.query
-                  .filter_by(user_id=current_user.id)
-                  .order_by(DiscoverCache.updated_at.desc())
-                  .first())
-        discovered = (last_cache.payload or []) if last_cache else []
-        selected_instagram_account_id = last_cache.instagram_account_id if last_cache else ''
-        accounts = InstagramAccount.query.filter_by(user_id=current_user.id).all()
+        last_discovered = _get_last_discovered(current_user.id)
+        discovered = last_discovered['accounts']
+        selected_instagram_account_id = last_discovered['instagram_account_id']
+        accounts = _list_accounts(current_user.id)
 
         geo_cfg = _get_geo_config_for_user(current_user.id)
         hashtags = get_search_hashtags('all', geo_config=geo_cfg)
@@ -538,6 +847,34 @@ def create_app(config_name=None):
                                selected_instagram_account_id=selected_instagram_account_id,
                                geo=geo_cfg)
 
+    @app.route('/jobs/<job_id>')
+    @login_required
+    def job_status(job_id):
+        """Статус фоновой задачи (JSON для опроса со страницы job_status.html)"""
+        status = tasks.get_web_job_status(job_id, current_user.id)
+        if status is None:
+            return jsonify({'status': 'unknown'}), 404
+        
+        if status['status'] in ('finished', 'failed') and status['result']:
+            # Сообщение покажется на странице, куда уйдёт браузер
+            _flash_job_result(status['result'])
+        return jsonify({'status': status['status'], 'redirect': status['redirect']})
+    
+    @app.route('/parse/events/<session_id>')
+    @login_required
+    def parse_events(session_id):
+        """SSE-поток прогресса парсинга (из Redis stream, который пишет фоновая задача)"""
+        parse_session = ParseSession.query.filter_by(id=session_id, user_id=current_user.id).first_or_404()
+        status = parse_session.status
+        # Соединение с БД не держим, пока поток открыт
+        db.session.commit()
+        
+        return Response(
+            stream_with_context(tasks.iter_parse_events(session_id, status)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
     @app.route('/settings/geo', methods=['GET', 'POST'])
     @login_required
     def geo_settings():
@@ -600,52 +937,31 @@ def create_app(config_name=None):
         source_account = request.form.get('source_account', '').strip().lstrip('@')
         manual_usernames = request.form.get('manual_usernames', '').strip()
         
-        print(f"DEBUG: source_account = '{source_account}'")
-        print(f"DEBUG: manual_usernames = '{manual_usernames}'")
-        print(f"DEBUG: files = {request.files}")
+        # Ленивое форматирование: в production (уровень выше DEBUG) строки не собираются
+        app.logger.debug("import: source_account=%r manual_usernames=%d chars files=%s",
+                         source_account, len(manual_usernames), list(request.files))
         
         if not source_account:
             flash('Вкажіть джерело даних (назва спільноти)', 'error')
             return redirect(url_for('parse_competitors'))
         
-        usernames = []
-        
-        # Проверяем загруженный файл
+        # Источники username'ов: файл читается потоково блоками (без file.read() в память)
+        sources = []
         if 'import_file' in request.files:
             file = request.files['import_file']
-            print(f"DEBUG: file = {file}, filename = {file.filename if file else 'None'}")
+            app.logger.debug("import: file=%r", file.filename if file else None)
             if file and file.filename:
-                try:
-                    content = file.read().decode('utf-8', errors='ignore')
-                    print(f"DEBUG: file content length = {len(content)}")
-                    print(f"DEBUG: file content preview = {content[:200]}")
-                    # Парсим содержимое файла
-                    for line in content.replace(',', '\n').split('\n'):
-                        username = line.strip().lstrip('@').strip()
-                        if username and len(username) > 0:
-                            usernames.append(username)
-                except Exception as e:
-                    flash(f'Ошибка чтения файла: {str(e)}', 'error')
-                    return redirect(url_for('parse_competitors'))
-        
-        # Добавляем username'ы из текстового поля
-        if manual_usernames:
-            for line in manual_usernames.replace(',', '\n').split('\n'):
-                username = line.strip().lstrip('@').strip()
-                if username and len(username) > 0 and username not in usernames:
-                    usernames.append(username)
+                text = io.TextIOWrapper(file.stream, encoding='utf-8', errors='ignore')
+                sources.append(iter(lambda: text.read(IMPORT_READ_CHARS), ''))
         
-        print(f"DEBUG: parsed usernames count = {len(usernames)}")
-        print(f"DEBUG: first 10 usernames = {usernames[:10]}")
-        
-        if not usernames:
-            flash('Не найдено ни одного username. Загрузите файл или введите вручную.', 'error')
-            return redirect(url_for('parse_competitors'))
+        # Добавляем username'ы из текстового поля (один блок)
+        if manual_usernames:
+            sources.append([manual_usernames])
         
         # Создаём сессию импорта
         parse_session = ParseSession(
             user_id=current_user.id,
-            competitor_usernames=source_account,
+            competitor_usernames=[source_account],
             status='completed',
             started_at=datetime.utcnow(),
             completed_at=datetime.utcnow()
@@ -653,42 +969,47 @@ def create_app(config_name=None):
         db.session.add(parse_session)
         db.session.flush()
         
-        # Добавляем подписчиков в базу
+        # Добавляем подписчиков пачками по FOLLOWERS_INSERT_CHUNK по мере чтения;
+        # дубликаты отсекает уникальный индекс (user_id, username) через ON CONFLICT DO NOTHING
+        now = datetime.utcnow()
+        seen = set()
+        batch = []
         imported_count = 0
-        skipped_count = 0
+        user_id, session_id = current_user.id, parse_session.id
+        try:
+            # parse_session уже во flush-е: в цикле в сессии нет pending-объектов,
+            # no_autoflush гарантирует, что пачки не запускают flush перед собой
+            with db.session.no_autoflush:
+                for username in _iter_import_usernames(sources):
+                    if username in seen:
+                        continue
+                    seen.add(username)
+                    # ✅ Все подписчики конкурентов = целевая аудитория (регион Франкфурт, интерес 50)
+                    batch.append(username)
+                    if len(batch) >= FOLLOWERS_INSERT_CHUNK:
+                        imported_count += import_followers_by_username(batch, user_id, session_id, source_account, now)
+                        batch = []
+                if batch:
+                    imported_count += import_followers_by_username(batch, user_id, session_id, source_account, now)
+        except UnicodeError as e:
+            db.session.rollback()
+            flash(f'Ошибка чтения файла: {str(e)}', 'error')
+            return redirect(url_for('parse_competitors'))
         
-        for username in usernames:
-            # Проверяем, нет ли уже такого подписчика
-            existing = Follower.query.filter_by(
-                user_id=current_user.id,
-                username=username
-            ).first()
-            
-            if existing:
-                skipped_count += 1
-                continue
-            
-            # Создаём запись подписчика
-            # ✅ Все подписчики конкурентов = целевая аудитория!
-            follower = Follower(
-                user_id=current_user.id,
-                parse_session_id=parse_session.id,
-                instagram_user_id=username,  # Используем username как временный ID
-                username=username,
-                source_account_username=source_account,
-                collected_at=datetime.utcnow(),
-                is_target_audience=True,  # Всі підписчики конкурентів - цільові
-                is_frankfurt_region=True,  # Припускаємо регіон Франкфурт
-                interest_score=50  # Базовий рейтинг інтересу
-            )
-            db.session.add(follower)
-            imported_count += 1
+        app.logger.debug("import: parsed usernames count=%d", len(seen))
+        
+        if not seen:
+            db.session.rollback()
+            flash('Не найдено ни одного username. Загрузите файл или введите вручную.', 'error')
+            return redirect(url_for('parse_competitors'))
+        skipped_count = len(seen) - imported_count
         
         # Обновляем статистику сессии
         parse_session.total_collected = imported_count
         
         try:
             db.session.commit()
+            invalidate_user_caches(current_user.id)
             flash(f'✅ Імпортовано {imported_count} профілів з @{source_account}. Пропущено дублікатів: {skipped_count}', 'success')
             return redirect(url_for('followers_table', session_id=parse_session.id))
         except Exception as e:
@@ -701,8 +1022,7 @@ def create_app(config_name=None):
     def followers_table():
         """Таблиця аудиторії з фільтрацією та пагінацією"""
         session_id = request.args.get('session_id')
-        page = request.args.get('page', 1, type=int)
-        per_page = app.config.get('ITEMS_PER_PAGE', 50)
+        per_page = items_per_page
         
         # Фильтры
         min_followers = request.args.get('min_followers', 0, type=int)
@@ -732,20 +1052,45 @@ def create_app(config_name=None):
         if source_account:
             query = query.filter(Follower.source_account_username.ilike(f'%{source_account}%'))
         
-        # Сортировка по quality_score
-        query = query.order_by(Follower.quality_score.desc())
-        
-        # Пагинация
-        followers = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        # Получить список источников для фильтра
-        source_accounts = db.session.query(Follower.source_account_username).filter_by(
-            user_id=current_user.id
-        ).distinct().all()
-        source_accounts = [s[0] for s in source_accounts]
-        
-        return render_template('followers_table.html',
+        # Keyset-пагинация по (coalesce(quality_score, 0), id): каждая страница — диапазон по индексу,
+        # без OFFSET и без второго COUNT(*) по всему отфильтрованному набору.
+        # NULL-оценка = 0 и в ORDER BY, и в курсоре (иначе NULL идут первыми и страница на NULL
+        # пропускала бы все положительные оценки)
+        score = db.func.coalesce(Follower.quality_score, 0)
+        cursor = _parse_followers_cursor()
+        if cursor is not None:
+            query = query.filter(tuple_(score, Follower.id) < cursor)
+        
+        # Только колонки, которые выводит таблица (без biography, JSON-тегов, гео и т.п.);
+        # строки - Row-кортежи (follower.username и т.д. в шаблоне), без ORM-объектов и
+        # identity map: ни lazy-load, ни N+1 из шаблона быть не может
+        followers = (query
+                     .with_entities(Follower.id, Follower.username, Follower.full_name, Follower.profile_pic_url,
+                                    Follower.followers_count, Follower.email, Follower.is_verified,
+                                    Follower.is_business, Follower.is_private, Follower.source_account_username,
+                                    Follower.quality_score)
+                     .order_by(score.desc(), Follower.id.desc())
+                     .limit(per_page + 1)
+                     .all())
+        
+        # Фильтры переносятся в ссылки пагинации
+        filter_args = {k: v for k, v in request.args.items()
+                       if k not in ('after_score', 'after_id') and v}
+        
+        next_args = None
+        if len(followers) > per_page:
+            followers = followers[:per_page]
+            last = followers[-1]
+            next_args = dict(filter_args, after_score=last.quality_score or 0, after_id=last.id)
+        
+        # Список источников для фильтра (из сессий парсинга, кэш 60с)
+        source_accounts = _get_source_accounts(current_user.id)
+        
+        return _stream_page('followers_table.html',
             followers=followers,
+            next_args=next_args,
+            filter_args=filter_args,
+            is_first_page=cursor is None,
             source_accounts=source_accounts,
             session_id=session_id
         )
@@ -776,64 +1121,60 @@ def create_app(config_name=None):
         if is_verified:
             query = query.filter_by(is_verified=True)
         
-        followers = query.order_by(Follower.quality_score.desc()).all()
-        
-        # Создать CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Header для Meta Ads Custom Audience
-        writer.writerow([
-            'email',
-            'phone',
-            'fn',  # first name
-            'ln',  # last name  
-            'country',
-            'external_id'
-        ])
-        
-        # Данные
-        for follower in followers:
-            # Разделяем full_name на first/last name
-            name_parts = (follower.full_name or '').split(' ', 1)
-            first_name = name_parts[0] if name_parts else ''
-            last_name = name_parts[1] if len(name_parts) > 1 else ''
-            
-            writer.writerow([
-                follower.email or '',
-                follower.phone or '',
-                first_name,
-                last_name,
-                '',  # country - можно добавить определение по username
-                follower.instagram_user_id
-            ])
-        
-        # Сохранить историю экспорта
-        try:
-            export_history = ExportHistory(
-                user_id=current_user.id,
-                export_type='csv',
-                rows_exported=len(followers),
-                filters_applied={
-                    'session_id': session_id,
-                    'min_followers': min_followers,
-                    'has_email': has_email,
-                    'is_verified': is_verified
-                }
-            )
-            db.session.add(export_history)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-        
-        # Возврат файла
-        output.seek(0)
-        return send_file(
-            BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'followers_meta_ads_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+        # Готовые колонки CSV считает Postgres (full_name -> fn/ln как split(' ', 1) в Python),
+        # строки - Core-кортежи без ORM-объектов, пишутся writerows пачками по EXPORT_YIELD_PER
+        full_name = db.func.coalesce(Follower.full_name, '')
+        space_pos = db.func.strpos(full_name, ' ')
+        followers = (query
+                     .with_entities(
+                         db.func.coalesce(Follower.email, ''),
+                         db.func.coalesce(Follower.phone, ''),
+                         db.func.split_part(full_name, ' ', 1),
+                         db.case((space_pos > 0, db.func.substr(full_name, space_pos + 1)), else_=''),
+                         db.literal(''),  # country - можно добавить определение по username
+                         Follower.instagram_user_id,
+                     )
+                     .order_by(Follower.quality_score.desc()))
+        user_id = current_user.id
+        # Заполняется генератором; историю пишем только если поток отдан целиком
+        export_state = {'rows_exported': 0, 'complete': False}
+
+        def generate():
+            yield META_ADS_CSV_HEADER
+
+            # Одна запись в ответ на пачку из EXPORT_YIELD_PER строк (writerows в буфер)
+            result = db.session.execute(followers.statement, execution_options={'yield_per': EXPORT_YIELD_PER})
+            for partition in result.partitions():
+                buf = io.StringIO()
+                csv.writer(buf).writerows(partition)
+                export_state['rows_exported'] += len(partition)
+                yield buf.getvalue()
+            export_state['complete'] = True
+
+        def log_export():
+            # Сохранить историю экспорта после закрытия ответа (количество строк известно только в конце потока)
+            if not export_state['complete']:
+                return
+            try:
+                export_history = ExportHistory(
+                    user_id=user_id,
+                    export_type='csv',
+                    rows_exported=export_state['rows_exported'],
+                    filters_applied={
+                        'session_id': session_id,
+                        'min_followers': min_followers,
+                        'has_email': has_email,
+                        'is_verified': is_verified
+                    }
+                )
+                db.session.add(export_history)
+                db.session.commit()
+                invalidate_user_caches(user_id)
+            except Exception:
+                db.session.rollback()
+
+        return _csv_response(generate(), f'followers_meta_ads_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                             on_close=log_export)
     
     @app.route('/export/full-csv')
     @login_required
@@ -841,60 +1182,46 @@ def create_app(config_name=None):
         """Экспорт всех данных подписчиков в CSV"""
         session_id = request.args.get('session_id')
         
-        query = Follower.query.filter_by(user_id=current_user.id)
-        if session_id:
-            query = query.filter_by(parse_session_id=session_id)
-        
-        followers = query.order_by(Follower.quality_score.desc()).all()
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Полный header
-        writer.writerow([
-            'Username',
-            'Full Name',
-            'Followers',
-            'Following',
-            'Posts',
-            'Email',
-            'Phone',
-            'Website',
-            'Is Verified',
-            'Is Business',
-            'Is Private',
-            'Biography',
-            'Source Account',
-            'Quality Score',
-            'Collected At'
-        ])
-        
-        for follower in followers:
-            writer.writerow([
-                follower.username,
-                follower.full_name or '',
-                follower.followers_count or 0,
-                follower.following_count or 0,
-                follower.posts_count or 0,
-                follower.email or '',
-                follower.phone or '',
-                follower.website_url or '',
-                'Yes' if follower.is_verified else 'No',
-                'Yes' if follower.is_business else 'No',
-                'Yes' if follower.is_private else 'No',
-                (follower.biography or '')[:200],  # Обрезаем био
-                follower.source_account_username,
-                follower.quality_score,
-                follower.collected_at.strftime('%Y-%m-%d %H:%M') if follower.collected_at else ''
-            ])
-        
-        output.seek(0)
-        return send_file(
-            BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'followers_full_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        # Приведение к строкам / 'Yes'-'No' / обрезка био / формат даты - в Postgres,
+        # Python только перекладывает готовые кортежи в csv.writer
+        def yes_no(col):
+            return db.case((col.is_(True), 'Yes'), else_='No')
+
+        stmt = (
+            db.select(
+                Follower.username,
+                db.func.coalesce(Follower.full_name, ''),
+                db.func.coalesce(Follower.followers_count, 0),
+                db.func.coalesce(Follower.following_count, 0),
+                db.func.coalesce(Follower.posts_count, 0),
+                db.func.coalesce(Follower.email, ''),
+                db.func.coalesce(Follower.phone, ''),
+                db.func.coalesce(Follower.website_url, ''),
+                yes_no(Follower.is_verified),
+                yes_no(Follower.is_business),
+                yes_no(Follower.is_private),
+                db.func.substr(db.func.coalesce(Follower.biography, ''), 1, 200),  # Обрезаем био
+                Follower.source_account_username,
+                Follower.quality_score,
+                db.func.to_char(Follower.collected_at, 'YYYY-MM-DD HH24:MI'),
+            )
+            .where(Follower.user_id == current_user.id)
+            .order_by(Follower.quality_score.desc())
+            .execution_options(yield_per=EXPORT_YIELD_PER)
         )
+        if session_id:
+            stmt = stmt.where(Follower.parse_session_id == session_id)
+
+        def generate():
+            yield FULL_CSV_HEADER
+
+            # Одна запись в ответ на пачку из EXPORT_YIELD_PER строк (writerows в буфер)
+            for partition in db.session.execute(stmt).partitions():
+                buf = io.StringIO()
+                csv.writer(buf).writerows(partition)
+                yield buf.getvalue()
+
+        return _csv_response(generate(), f'followers_full_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
     
     @app.route('/publish', methods=['GET', 'POST'])
     @login_required
@@ -913,10 +1240,7 @@ def create_app(config_name=None):
                 return redirect(url_for('publish_content'))
             
             # Проверить аккаунт
-            account = InstagramAccount.query.filter_by(
-                id=instagram_account_id,
-                user_id=current_user.id
-            ).first()
+            account = _get_user_account(instagram_account_id)
             
             if not account:
                 flash('Instagram аккаунт не найден', 'error')
@@ -924,62 +1248,46 @@ def create_app(config_name=None):
             
             try:
                 # 🔐 Розшифровуємо пароль
-                decrypted_pwd = decrypt_password(account.instagram_password)
-                service = InstagramService(account.instagram_username, decrypted_pwd)
-                success, login_msg = service.login()
-                
-                if not success:
-                    flash(f'Ошибка входа: {login_msg}', 'error')
-                    return redirect(url_for('publish_content'))
-                
-                # Создать папку для uploads если нет
-                upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-
-                normalized_folder = os.path.join(upload_folder, 'normalized')
-                os.makedirs(normalized_folder, exist_ok=True)
+                decrypted_pwd = decrypt_account_password(account)
+                # Один логин на Instagram-аккаунт одновременно (воркеры/задачи берут ту же блокировку)
+                with instagram_account_lock(account.instagram_username) as acquired:
+                    if not acquired:
+                        flash(tasks.ACCOUNT_BUSY_MESSAGE, 'warning')
+                        return redirect(url_for('publish_content'))
+                    service = InstagramService(account.instagram_username, decrypted_pwd)
+                    success, login_msg = service.login()
                 
-                # Save uploaded files and normalize images to JPEG (instagrapi photo upload requires JPG/JPEG)
-                temp_paths = []
-                media_paths = []
-                for file in files:
-                    if not file.filename:
-                        continue
-
-                    tmp_name = f"upload_{uuid.uuid4().hex}"
-                    tmp_path = os.path.join(upload_folder, tmp_name)
-                    file.save(tmp_path)
-                    temp_paths.append(tmp_path)
-
-                    # Convert to JPG
-                    jpg_path = os.path.join(normalized_folder, f"{uuid.uuid4().hex}.jpg")
-                    try:
-                        normalize_to_jpeg(tmp_path, jpg_path)
-                        media_paths.append(jpg_path)
-                    except Exception as e:
-                        # cleanup and show readable error
-                        for p in temp_paths:
-                            try:
-                                os.remove(p)
-                            except Exception:
-                                pass
-                        for p in media_paths:
-                            try:
-                                os.remove(p)
-                            except Exception:
-                                pass
-                        flash(f'Ошибка файла: {str(e)}. Для публикации используйте изображения.', 'error')
+                    if not success:
+                        flash(f'Ошибка входа: {login_msg}', 'error')
                         return redirect(url_for('publish_content'))
                 
-                # Опубликовать
-                if content_type == 'post' and len(media_paths) == 1:
-                    is_success, result = service.publish_post(caption, media_paths[0])
-                elif content_type == 'story' and len(media_paths) >= 1:
-                    is_success, result = service.publish_story(media_paths[0])
-                elif content_type == 'carousel' and len(media_paths) > 1:
-                    is_success, result = service.publish_carousel(caption, media_paths)
-                else:
-                    is_success, result = False, 'Неизвестный тип контента или неверное количество файлов'
+                    # Создать папку для uploads если нет
+                    os.makedirs(upload_folder, exist_ok=True)
+                
+                    # Нормализованные файлы - во временной папке запроса: удаляется целиком при
+                    # выходе из with, в т.ч. при исключении на публикации
+                    with tempfile.TemporaryDirectory(prefix='pub_', dir=upload_folder) as work_dir:
+                        # Normalize images to JPEG (instagrapi photo upload requires JPG/JPEG) straight from
+                        # the upload stream: no file.save() copy of the original into uploads/ first.
+                        # Carousel images in parallel on native threads: Pillow releases the GIL while decoding/encoding
+                        uploads = [file for file in files if file.filename]
+                        media_paths = [os.path.join(work_dir, f"{i}.jpg") for i in range(len(uploads))]
+                        try:
+                            with _media_executor(min(MEDIA_NORMALIZE_WORKERS, len(uploads))) as ex:
+                                list(ex.map(normalize_to_jpeg, [file.stream for file in uploads], media_paths))
+                        except Exception as e:
+                            flash(f'Ошибка файла: {str(e)}. Для публикации используйте изображения.', 'error')
+                            return redirect(url_for('publish_content'))
+                    
+                        # Опубликовать
+                        if content_type == 'post' and len(media_paths) == 1:
+                            is_success, result = service.publish_post(caption, media_paths[0])
+                        elif content_type == 'story' and len(media_paths) >= 1:
+                            is_success, result = service.publish_story(media_paths[0])
+                        elif content_type == 'carousel' and len(media_paths) > 1:
+                            is_success, result = service.publish_carousel(caption, media_paths)
+                        else:
+                            is_success, result = False, 'Неизвестный тип контента или неверное количество файлов'
                 
                 # Сохранить в БД
                 published_content = PublishedContent(
@@ -995,18 +1303,7 @@ def create_app(config_name=None):
                 )
                 db.session.add(published_content)
                 db.session.commit()
-                
-                # Удалить временные файлы
-                for path in temp_paths:
-                    try:
-                        os.remove(path)
-                    except Exception:
-                        pass
-                for path in media_paths:
-                    try:
-                        os.remove(path)
-                    except Exception:
-                        pass
+                invalidate_user_caches(current_user.id)
                 
                 if is_success:
                     flash('Контент успешно опубликован!', 'success')
@@ -1020,12 +1317,14 @@ def create_app(config_name=None):
                 return redirect(url_for('publish_content'))
         
         # GET - форма для публикации
-        accounts = InstagramAccount.query.filter_by(user_id=current_user.id).all()
-        
-        # История публикаций
-        publications = PublishedContent.query.filter_by(
+        # Только колонки, которые рендерит publish.html: без пароля/био аккаунтов и
+        # caption/media_urls публикаций; строки без relationships - N+1 невозможен
+        accounts = db.session.query(InstagramAccount.id, InstagramAccount.instagram_username).filter_by(
             user_id=current_user.id
-        ).order_by(PublishedContent.created_at.desc()).limit(10).all()
+        ).all()
+        
+        # История публикаций (кэш 60с, сбрасывается после новой публикации)
+        publications = _get_recent_publications(current_user.id)
         
         return render_template('publish.html', accounts=accounts, publications=publications)
     
@@ -1033,36 +1332,32 @@ def create_app(config_name=None):
     @login_required
     def statistics():
         """Страница статистики парсинга"""
-        user_id = current_user.id
-        
-        # Все сессии парсинга
-        sessions = ParseSession.query.filter_by(user_id=user_id).order_by(
-            ParseSession.started_at.desc()
-        ).all()
-        
-        # Общая статистика
-        total_followers = Follower.query.filter_by(user_id=user_id).count()
-        followers_with_email = Follower.query.filter(
-            Follower.user_id == user_id,
-            Follower.email.isnot(None)
-        ).count()
-        verified_followers = Follower.query.filter_by(user_id=user_id, is_verified=True).count()
-        business_followers = Follower.query.filter_by(user_id=user_id, is_business=True).count()
-        
-        # История экспортов
-        exports = ExportHistory.query.filter_by(user_id=user_id).order_by(
-            ExportHistory.exported_at.desc()
-        ).limit(10).all()
-        
-        return render_template('statistics.html',
-            sessions=sessions,
-            total_followers=total_followers,
-            followers_with_email=followers_with_email,
-            verified_followers=verified_followers,
-            business_followers=business_followers,
-            exports=exports
+        # Сессии парсинга (keyset по started_at, id - без OFFSET) и история экспортов
+        # (первая страница в кэше 60с, сбрасывается при записи)
+        cursor = _parse_statistics_cursor()
+        sessions, exports, next_args = _get_statistics_page(current_user.id, cursor)
+        
+        # Общая статистика: строка пользователя уже загружена user_loader-ом
+        return _stream_page('statistics.html',
+            sessions=[_statistics_obj(s, 'started_at') for s in sessions],
+            exports=[_statistics_obj(e, 'exported_at') for e in exports],
+            next_args=next_args,
+            is_first_page=cursor is None,
+            **_get_follower_counters(current_user)
         )
     
+    @app.route('/api/statistics')
+    @login_required
+    def statistics_api():
+        """Данные /statistics в JSON (даты в ISO, та же пагинация before/before_id) - без рендера шаблона"""
+        sessions, exports, next_args = _get_statistics_page(current_user.id, _parse_statistics_cursor())
+        return jsonify({
+            'sessions': sessions,
+            'exports': exports,
+            'counters': _get_follower_counters(current_user),
+            'next_args': next_args,
+        })
+    
     # ============ MESSAGING ROUTES ============
     
     @app.route('/messaging')
@@ -1071,45 +1366,64 @@ def create_app(config_name=None):
         """📨 Сторінка розсилки повідомлень в Direct"""
         user_id = current_user.id
         
-        # Статистика
-        total_followers = Follower.query.filter_by(user_id=user_id).count()
-        target_audience = Follower.query.filter_by(user_id=user_id, is_target_audience=True).count()
-        frankfurt_region = Follower.query.filter_by(user_id=user_id, is_frankfurt_region=True).count()
+        # Статистика: всего - из счетчика users (триггеры), флаги - count(*) FILTER, а отправленные
+        # сегодня - скалярный подзапрос в том же SELECT: один round-trip вместо трёх
+        # (Query.count() оборачивает запрос в SELECT count(*) FROM (SELECT ...))
+        total_followers = current_user.followers_count
+        day_start, day_end = _today_range()
+        target_audience, frankfurt_region, messages_sent_today = db.session.execute(lambda_stmt(
+            lambda: db.select(
+                db.func.count().filter(Follower.is_target_audience.is_(True)),
+                db.func.count().filter(Follower.is_frankfurt_region.is_(True)),
+                db.select(db.func.count()).select_from(SentMessage).where(
+                    SentMessage.user_id == user_id,
+                    SentMessage.sent_at >= day_start,
+                    SentMessage.sent_at < day_end,
+                ).scalar_subquery(),
+            ).where(Follower.user_id == user_id)
+        )).one()
         geo_cfg = _get_geo_config_for_user(user_id)
         geo_region_label = f"{geo_cfg.get('region_name') or 'Region'} (+{geo_cfg.get('radius_km') or 0} км)"
         
-        # Скільки повідомлень відправлено сьогодні
-        from datetime import date
-        today = date.today()
-        messages_sent_today = SentMessage.query.filter(
-            SentMessage.user_id == user_id,
-            db.func.date(SentMessage.sent_at) == today
-        ).count()
-        
         # Денний ліміт (безпечний)
         daily_limit = 20
         
         # Акаунти
-        accounts = InstagramAccount.query.filter_by(user_id=user_id).all()
-
-        dm_rows = DmAssistantSettings.query.filter_by(user_id=user_id).all()
+        accounts = _list_accounts(user_id)
+
+        # Налаштування по IG-акаунтах ідуть лише в JSON для JS: тільки потрібні колонки,
+        # Row-кортежі без ORM-об'єктів (без системних полів, лічильників і т.п.)
+        dm_rows = db.session.execute(
+            db.select(DmAssistantSettings.instagram_account_id, DmAssistantSettings.enabled,
+                      DmAssistantSettings.reply_to_existing_threads, DmAssistantSettings.language,
+                      DmAssistantSettings.max_replies_per_day, DmAssistantSettings.system_instructions,
+                      DmAssistantSettings.last_run_at, DmAssistantSettings.last_error)
+            .where(DmAssistantSettings.user_id == user_id)
+        ).all()
 
         # DM assistant settings (per IG account)
-        dm_settings_by_account = {s.instagram_account_id: s for s in dm_rows}
         dm_settings_json = {
             str(s.instagram_account_id): {
                 'enabled': bool(s.enabled),
-                'reply_to_existing_threads': bool(getattr(s, 'reply_to_existing_threads', False)),
+                'reply_to_existing_threads': bool(s.reply_to_existing_threads),
                 'language': (s.language or 'ru'),
                 'max_replies_per_day': int(s.max_replies_per_day or 20),
                 'system_instructions': (s.system_instructions or ''),
-                'last_run_at': (s.last_run_at.isoformat() if getattr(s, 'last_run_at', None) else None),
+                'last_run_at': (s.last_run_at.isoformat() if s.last_run_at else None),
                 'last_error': (s.last_error or None),
             }
             for s in dm_rows
         }
 
-        invite_rows = InviteCampaignSettings.query.filter_by(user_id=user_id).all()
+        invite_rows = db.session.execute(
+            db.select(InviteCampaignSettings.instagram_account_id, InviteCampaignSettings.enabled,
+                      InviteCampaignSettings.audience_type, InviteCampaignSettings.max_sends_per_day,
+                      InviteCampaignSettings.min_delay_seconds, InviteCampaignSettings.max_delay_seconds,
+                      InviteCampaignSettings.stop_on_inbound_reply, InviteCampaignSettings.allowed_start_hour,
+                      InviteCampaignSettings.allowed_end_hour, InviteCampaignSettings.timezone,
+                      InviteCampaignSettings.steps)
+            .where(InviteCampaignSettings.user_id == user_id)
+        ).all()
         invite_settings_json = {
             str(s.instagram_account_id): {
                 'enabled': bool(s.enabled),
@@ -1118,9 +1432,9 @@ def create_app(config_name=None):
                 'min_delay_seconds': int(s.min_delay_seconds or 45),
                 'max_delay_seconds': int(s.max_delay_seconds or 75),
                 'stop_on_inbound_reply': bool(s.stop_on_inbound_reply),
-                'allowed_start_hour': int(getattr(s, 'allowed_start_hour', 8) or 8),
-                'allowed_end_hour': int(getattr(s, 'allowed_end_hour', 22) or 22),
-                'timezone': (getattr(s, 'timezone', None) or 'Europe/Berlin'),
+                'allowed_start_hour': int(s.allowed_start_hour or 8),
+                'allowed_end_hour': int(s.allowed_end_hour or 22),
+                'timezone': (s.timezone or 'Europe/Berlin'),
                 'steps': (s.steps or []),
             }
             for s in invite_rows
@@ -1140,13 +1454,9 @@ def create_app(config_name=None):
             daily_limit=daily_limit,
             accounts=accounts,
             message_logs=message_logs,
-            dm_settings_by_account=dm_settings_by_account,
             dm_settings_json=dm_settings_json,
             invite_settings_json=invite_settings_json,
-            workers_env={
-                'ENABLE_ALL_WORKERS': os.environ.get('ENABLE_ALL_WORKERS', ''),
-                'ENABLE_DM_ASSISTANT': os.environ.get('ENABLE_DM_ASSISTANT', ''),
-            },
+            workers_env=workers_env,
         )
 
     @app.route('/dm-assistant/settings', methods=['POST'])
@@ -1159,7 +1469,7 @@ def create_app(config_name=None):
             flash('Оберіть акаунт для авто-відповідача', 'error')
             return redirect(url_for('messaging'))
 
-        account = InstagramAccount.query.filter_by(id=account_id, user_id=user_id).first()
+        account = _get_user_account(account_id)
         if not account:
             flash('Акаунт не знайдено', 'error')
             return redirect(url_for('messaging'))
@@ -1184,6 +1494,7 @@ def create_app(config_name=None):
         settings.system_instructions = instructions
         settings.language = language or 'ru'
         settings.max_replies_per_day = max(1, min(max_replies_per_day, 200))
+        settings.next_run_at = None  # worker підхопить зміни в наступному циклі
 
         try:
             db.session.commit()
@@ -1205,7 +1516,7 @@ def create_app(config_name=None):
             flash('Оберіть акаунт для програми запрошень', 'error')
             return redirect(url_for('messaging'))
 
-        account = InstagramAccount.query.filter_by(id=account_id, user_id=user_id).first()
+        account = _get_user_account(account_id)
         if not account:
             flash('Акаунт не знайдено', 'error')
             return redirect(url_for('messaging'))
@@ -1265,6 +1576,7 @@ def create_app(config_name=None):
         settings.allowed_end_hour = max(0, min(int(allowed_end_hour), 23))
         settings.timezone = tz or 'Europe/Berlin'
         settings.steps = steps
+        settings.next_run_at = None  # worker підхопить зміни в наступному циклі
 
         try:
             db.session.commit()
@@ -1279,9 +1591,6 @@ def create_app(config_name=None):
     @login_required
     def send_messages():
         """🚀 Відправка повідомлень в Direct"""
-        import time
-        import random
-        
         user_id = current_user.id
         
         # Отримуємо параметри
@@ -1295,13 +1604,11 @@ def create_app(config_name=None):
             flash('Оберіть акаунт та введіть повідомлення', 'error')
             return redirect(url_for('messaging'))
         
-        # Перевірка ліміту
-        from datetime import date
-        today = date.today()
-        messages_sent_today = SentMessage.query.filter(
-            SentMessage.user_id == user_id,
-            db.func.date(SentMessage.sent_at) == today
-        ).count()
+        # Перевірка ліміту: разом з ще не відправленими отримувачами запущених розсилок.
+        # Рядок користувача блокується до commit нового MessageLog (резерв ліміту), тож дві
+        # розсилки підряд (inline або RQ) не проходять перевірку на тих самих цифрах
+        db.session.execute(db.select(User.id).where(User.id == user_id).with_for_update())
+        messages_sent_today = _count_messages_used_today(user_id)
         
         daily_limit = 20
         remaining = daily_limit - messages_sent_today
@@ -1313,7 +1620,7 @@ def create_app(config_name=None):
         limit = min(limit, remaining)
         
         # Отримуємо акаунт
-        account = InstagramAccount.query.filter_by(id=account_id, user_id=user_id).first()
+        account = _get_user_account(account_id)
         if not account:
             flash('Акаунт не знайдено', 'error')
             return redirect(url_for('messaging'))
@@ -1326,116 +1633,40 @@ def create_app(config_name=None):
         else:
             followers = Follower.query.filter_by(user_id=user_id)
         
-        # Виключаємо тих, кому вже писали
-        sent_usernames = db.session.query(SentMessage.recipient_username).filter_by(user_id=user_id).all()
-        sent_set = {s[0] for s in sent_usernames}
+        # Виключаємо тих, кому вже писали: NOT EXISTS у БД (індекс user_id + recipient_username),
+        # а не вся історія відправок у Python і назад величезним NOT IN списком
+        already_sent = db.select(SentMessage.id).where(
+            SentMessage.user_id == user_id,
+            SentMessage.recipient_username == Follower.username,
+        ).exists()
         
-        recipients = followers.filter(~Follower.username.in_(sent_set)).limit(limit).all()
+        recipient_ids = [row.id for row in followers.filter(~already_sent).with_entities(Follower.id).limit(limit)]
         
-        if not recipients:
+        if not recipient_ids:
             flash('⚠️ Немає нових отримувачів для розсилки', 'warning')
             return redirect(url_for('messaging'))
         
-        # Створюємо лог розсилки
+        # Створюємо лог розсилки (його лічильники оновлює задача після кожного повідомлення)
         message_log = MessageLog(
             user_id=user_id,
             account_id=account_id,
             account_username=account.instagram_username,
             message_template=message_template,
             audience_type=audience_type,
+            total_recipients=len(recipient_ids),
             status='running'
         )
         db.session.add(message_log)
         db.session.commit()
         
-        # Логін в Instagram
-        try:
-            decrypted_pwd = decrypt_password(account.instagram_password)
-            service = InstagramService(account.instagram_username, decrypted_pwd)
-            success, login_msg = service.login()
-            
-            if not success:
-                message_log.status = 'error'
-                message_log.error_message = login_msg
-                db.session.commit()
-                flash(f'❌ Помилка входу: {login_msg}', 'error')
-                return redirect(url_for('messaging'))
-                
-        except Exception as e:
-            message_log.status = 'error'
-            message_log.error_message = str(e)
-            db.session.commit()
-            flash(f'❌ Помилка: {str(e)}', 'error')
-            return redirect(url_for('messaging'))
-        
-        # Відправляємо повідомлення
-        successful = 0
-        failed = 0
-        
-        for i, follower in enumerate(recipients):
-            try:
-                # Персоналізація
-                personalized_msg = message_template.replace('{name}', follower.full_name or follower.username)
-                personalized_msg = personalized_msg.replace('{username}', f'@{follower.username}')
-                
-                # Відправка
-                result = service.send_direct_message(follower.username, personalized_msg)
-                
-                if result.get('success'):
-                    successful += 1
-                    status = 'sent'
-                    error = None
-                else:
-                    failed += 1
-                    status = 'failed'
-                    error = result.get('error', 'Unknown error')
-                
-                # Зберігаємо
-                sent_msg = SentMessage(
-                    user_id=user_id,
-                    message_log_id=message_log.id,
-                    recipient_username=follower.username,
-                    recipient_user_id=follower.instagram_user_id,
-                    status=status,
-                    error_message=error
-                )
-                db.session.add(sent_msg)
-                
-                # Затримка між повідомленнями (випадкова для природності)
-                if i < len(recipients) - 1:
-                    actual_delay = delay + random.randint(-10, 15)
-                    time.sleep(max(30, actual_delay))
-                    
-            except Exception as e:
-                failed += 1
-                sent_msg = SentMessage(
-                    user_id=user_id,
-                    message_log_id=message_log.id,
-                    recipient_username=follower.username,
-                    status='failed',
-                    error_message=str(e)
-                )
-                db.session.add(sent_msg)
-                
-                # Якщо забанили - зупиняємось
-                if 'feedback_required' in str(e).lower() or 'challenge' in str(e).lower():
-                    message_log.status = 'stopped'
-                    message_log.error_message = 'Instagram обмежив дії. Зачекайте 24-48 годин.'
-                    break
-        
-        # Оновлюємо лог
-        message_log.total_sent = successful + failed
-        message_log.successful = successful
-        message_log.failed = failed
-        message_log.status = 'completed' if message_log.status != 'stopped' else 'stopped'
-        message_log.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        if message_log.status == 'stopped':
-            flash(f'⚠️ Розсилку зупинено! Відправлено: {successful}, помилок: {failed}. Instagram обмежив дії.', 'warning')
-        else:
-            flash(f'✅ Розсилка завершена! Відправлено: {successful}, помилок: {failed}', 'success')
+        # Розсилка з паузами 30-60+ с між повідомленнями триває хвилини: при наявності черги — у фоні
+        job_id = tasks.enqueue_web_job('send_messages', message_log.id, recipient_ids, delay,
+                                       user_id=user_id, redirect_url=url_for('messaging'),
+                                       job_timeout=tasks.message_campaign_timeout(len(recipient_ids), delay))
+        if job_id:
+            return _job_started(job_id, f'📨 Розсилку запущено у фоні: {len(recipient_ids)} отримувачів...')
         
+        _flash_job_result(tasks.send_direct_messages(message_log.id, recipient_ids, delay))
         return redirect(url_for('messaging'))
     
     # ============ AI ASSISTANT ROUTES ============
@@ -1444,15 +1675,12 @@ def create_app(config_name=None):
     @login_required
     def ai_assistant():
         """🤖 AI Асистент - головна сторінка"""
-        from flask import session as flask_session
-
         requested_tab = request.args.get('tab', 'analyze')
         if requested_tab not in {'analyze', 'generate', 'content', 'trends'}:
             requested_tab = 'analyze'
 
         # Прибираємо великі payload'и зі session (cookie) щоб не перевищувати ліміт браузера
-        flask_session.pop('ai_trends', None)
-        flask_session.pop('ai_content_ideas', None)
+        _drop_legacy_session_keys('ai_trends', 'ai_content_ideas')
 
         # Тренди з БД (сервер-сайд), щоб не зберігати в session
         trends = (RssTrend.query
@@ -1477,13 +1705,16 @@ def create_app(config_name=None):
         ]
         content_ideas = generate_content_ideas_from_trends(trends_for_ideas) if trends_for_ideas else None
 
-        # AI результати з БД (не в cookie-session)
-        def _latest_cache(kind: str):
-            row = (AiCache.query
-                   .filter_by(user_id=current_user.id, kind=kind)
-                   .order_by(AiCache.created_at.desc())
-                   .first())
-            return row.payload if row and row.payload else None
+        # AI результати з БД (не в cookie-session): останній запис кожного kind одним
+        # SELECT DISTINCT ON (kind) по індексу (user_id, kind, created_at), а не три запити
+        latest_cache = {}
+        for kind, payload in db.session.execute(
+            db.select(AiCache.kind, AiCache.payload)
+            .where(AiCache.user_id == current_user.id, AiCache.kind.in_(('analysis', 'message', 'content')))
+            .distinct(AiCache.kind)
+            .order_by(AiCache.kind, AiCache.created_at.desc())
+        ):
+            latest_cache.setdefault(kind, payload or None)
 
         settings = AutomationSettings.query.filter_by(user_id=current_user.id).first()
 
@@ -1503,9 +1734,9 @@ def create_app(config_name=None):
         return render_template('ai_assistant.html',
             ai_available=bool(OPENAI_API_KEY),
             active_tab=requested_tab,
-            analysis_results=_latest_cache('analysis'),
-            generated_messages=_latest_cache('message'),
-            generated_content=_latest_cache('content'),
+            analysis_results=latest_cache.get('analysis'),
+            generated_messages=latest_cache.get('message'),
+            generated_content=latest_cache.get('content'),
             trends=trends,
             content_ideas=content_ideas,
             automation_settings=settings,
@@ -1516,7 +1747,6 @@ def create_app(config_name=None):
     @login_required
     def ai_analyze_profiles():
         """🔍 AI аналіз профілів"""
-        from flask import session as flask_session
         import re
         
         limit = int(request.form.get('limit', 20))
@@ -1596,8 +1826,6 @@ def create_app(config_name=None):
     @login_required
     def ai_generate_message():
         """✍️ Генерація персоналізованого повідомлення"""
-        from flask import session as flask_session
-        
         username = request.form.get('username', '').strip().lstrip('@')
         bio = request.form.get('bio', '').strip()
         goal = request.form.get('goal', 'знайомство')
@@ -1626,8 +1854,6 @@ def create_app(config_name=None):
     @login_required
     def ai_generate_content():
         """📝 Генерація контенту для публікації"""
-        from flask import session as flask_session
-        
         topic = request.form.get('topic', '').strip()
         post_type = request.form.get('post_type', 'informative')
         
@@ -1651,11 +1877,8 @@ def create_app(config_name=None):
     @login_required
     def ai_fetch_trends():
         """📰 Отримання трендів з RSS"""
-        from flask import session as flask_session
-
         # Гарантовано чистимо старі великі поля з cookie-based session
-        flask_session.pop('ai_trends', None)
-        flask_session.pop('ai_content_ideas', None)
+        _drop_legacy_session_keys('ai_trends', 'ai_content_ideas')
 
         trends = get_trending_topics(user_id=current_user.id, days=14, max_topics=10)
         if not trends:
@@ -1709,8 +1932,6 @@ def create_app(config_name=None):
     @login_required
     def ai_create_draft_from_trend(trend_id: str):
         """📝 Створити чернетку поста з RSS тренду (саммарі + CTA)."""
-        from flask import session as flask_session
-
         trend = RssTrend.query.filter_by(id=trend_id, user_id=current_user.id).first()
         if not trend:
             flash('Тренд не знайдено', 'error')
@@ -1888,6 +2109,7 @@ def create_app(config_name=None):
         settings.publish_times = publish_times or ["09:00", "18:00"]
         settings.timezone = timezone_name
         settings.max_posts_per_day = max(1, min(max_posts_per_day, 10))
+        settings.next_run_at = None  # worker підхопить зміни в наступному циклі
 
         # Optional music file upload
         music_file = request.files.get('music_file')
@@ -1904,7 +2126,7 @@ def create_app(config_name=None):
             os.makedirs(music_dir, exist_ok=True)
             stored_name = f"music_{uuid.uuid4().hex}{ext}"
             full_path = os.path.join(music_dir, stored_name)
-            music_file.save(full_path)
+            _save_upload(music_file, full_path)
             # store repo-relative path
             settings.music_file_path = os.path.join('uploads', 'music', stored_name)
 
@@ -1922,13 +2144,34 @@ def create_app(config_name=None):
     
     # ============ ERROR HANDLERS ============
     
+    # Страницы ошибок для анонимных запросов (боты/сканеры, 404-шторм) рендерятся один раз;
+    # залогиненным - обычный рендер (в base.html их навигация и flash-сообщения)
+    _error_pages = {}
+    
+    def _error_page(template_name: str, status: int):
+        try:
+            is_authenticated = current_user.is_authenticated
+        except Exception:
+            # 500 из-за недоступной БД: user_loader тоже упадет
+            is_authenticated = False
+        if is_authenticated:
+            return render_template(template_name), status
+        
+        html = _error_pages.get(template_name)
+        if html is None:
+            # Чистый контекст без сессии: в кэш не попадут flash-сообщения текущего запроса
+            with app.test_request_context('/'):
+                html = render_template(template_name)
+            _error_pages[template_name] = html
+        return Response(html, status=status, mimetype='text/html')
+    
     @app.errorhandler(404)
     def not_found(e):
-        return render_template('404.html'), 404
+        return _error_page('404.html', 404)
     
     @app.errorhandler(500)
     def server_error(e):
-        return render_template('500.html'), 500
+        return _error_page('500.html', 500)
     
     return app
 
@@ -1944,11 +2187,23 @@ if __name__ == '__main__':
     # Создать папку для uploads
     os.makedirs(app.config.get('UPLOAD_FOLDER', 'uploads'), exist_ok=True)
     
+    port = int(os.environ.get('PORT', 5000))
     print("Запуск Instagram OSINT приложения...")
-    print(f"Сервер: http://127.0.0.1:{os.environ.get('PORT', 5000)}")
+    print(f"Сервер: http://127.0.0.1:{port}")
     
-    app.run(
-        host='0.0.0.0',
-        port=int(os.environ.get('PORT', 5000)),
-        debug=app.config['DEBUG']
-    )
+    if os.environ.get('DEV_SERVER', '').lower() == 'gevent':
+        # Та же модель конкурентности, что у gunicorn.conf.py (без reloader/debugger Werkzeug)
+        from gevent.pywsgi import WSGIServer
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            print("⚠️ psycogreen not installed: psycopg2 calls will block the gevent server")
+        print("gevent WSGIServer")
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
+    else:
+        app.run(
+            host='0.0.0.0',
+            port=port,
+            debug=app.config['DEBUG']
+        )
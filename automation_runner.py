@@ -30,22 +30,24 @@ if not ENABLE_AUTOMATION:
 # Import the app to initialize db
 import app as app_module  # noqa: E402
 from database import db  # noqa: E402
-from models import User  # noqa: E402
+from models import AutomationSettings  # noqa: E402
 from automation_service import create_scheduled_content_from_new_rss, publish_due_content  # noqa: E402
 
 
 def main():
-    flask_app = app_module.create_app()
+    # Reuse the app instance created in app.py (prevents double create_app()).
+    flask_app = getattr(app_module, 'app', None) or app_module.create_app()
 
     with flask_app.app_context():
         while True:
             try:
-                users = User.query.all()
-                for u in users:
-                    created = create_scheduled_content_from_new_rss(u.id, days=2, max_topics=20)
-                    published = publish_due_content(u.id, limit=3)
+                user_ids = [row[0] for row in db.session.query(AutomationSettings.user_id)
+                            .filter(AutomationSettings.enabled.is_(True)).distinct().all()]
+                for user_id in user_ids:
+                    created = create_scheduled_content_from_new_rss(user_id, days=2, max_topics=20)
+                    published = publish_due_content(user_id, limit=3)
                     if created or published:
-                        print(f"[{datetime.utcnow().isoformat()}] user={u.id} created={created} published={published}")
+                        print(f"[{datetime.utcnow().isoformat()}] user={user_id} created={created} published={published}")
             except Exception as e:
                 print(f"Automation error: {e}")
 
@@ -17,7 +17,7 @@ from models import (
     PublishedContent,
 )
 from encryption import decrypt_password
-from instagram_service import InstagramService
+from instagram_service import InstagramService, instagram_account_lock
 from rss_service import get_trending_topics
 from ai_service import summarize_trend
 from media_utils import download_and_prepare_instagram_jpeg
@@ -26,6 +26,9 @@ from video_utils import animate_photo_to_mp4
 
 DEFAULT_PUBLISH_TIMES = ["09:00", "18:00"]
 
+# Мінімальна пауза між запусками для одного користувача (не крутимо прострочені задачі щосекунди)
+AUTOMATION_MIN_RESCHEDULE_SECONDS = int(os.environ.get('AUTOMATION_LOOP_SECONDS', '60'))
+
 
 def _get_tz(tz_name: str):
     try:
@@ -209,6 +212,28 @@ def create_scheduled_content_from_new_rss(user_id: str, days: int = 2, max_topic
     return created
 
 
+def schedule_next_run(user_id: str, min_delay_seconds: int = AUTOMATION_MIN_RESCHEDULE_SECONDS) -> datetime:
+    """Set settings.next_run_at = earliest of next RSS check / next scheduled publish."""
+    settings = get_or_create_settings(user_id)
+    now = datetime.utcnow()
+
+    interval = int(settings.rss_check_interval_minutes or 240)
+    candidates = [(settings.last_rss_check_at or now) + timedelta(minutes=interval)]
+
+    if settings.auto_publish:
+        next_publish = (db.session.query(db.func.min(ContentIdea.scheduled_at))
+                        .filter(ContentIdea.user_id == user_id,
+                                ContentIdea.status == 'scheduled',
+                                ContentIdea.scheduled_at.isnot(None))
+                        .scalar())
+        if next_publish:
+            candidates.append(next_publish)
+
+    settings.next_run_at = max(min(candidates), now + timedelta(seconds=max(1, min_delay_seconds)))
+    db.session.commit()
+    return settings.next_run_at
+
+
 def publish_due_content(user_id: str, limit: int = 3) -> int:
     settings = get_or_create_settings(user_id)
     if not (settings.enabled and settings.auto_publish):
@@ -238,6 +263,15 @@ def publish_due_content(user_id: str, limit: int = 3) -> int:
         db.session.commit()
         return 0
 
+    with instagram_account_lock(account.instagram_username) as acquired:
+        if not acquired:
+            # leave ideas as scheduled; the next run retries
+            return 0
+        return _publish_logged_in(user_id, account, password, settings, due)
+
+
+def _publish_logged_in(user_id: str, account: InstagramAccount, password: str,
+                       settings: AutomationSettings, due: List[ContentIdea]) -> int:
     service = InstagramService(account.instagram_username, password)
     ok, msg = service.login()
     if not ok:
@@ -317,6 +351,9 @@ def publish_due_content(user_id: str, limit: int = 3) -> int:
 
             db.session.commit()
 
+            from cache import invalidate_user_caches
+            invalidate_user_caches(user_id)
+
             try:
                 os.remove(local_jpg)
             except Exception:
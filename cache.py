@@ -0,0 +1,65 @@
+"""Per-user JSON caches in Redis shared by the web app, services and background jobs.
+
+Pages cache small read-mostly lists (/followers sources, /statistics, /publish history,
+the last /discover result); every write path calls invalidate_user_caches(user_id).
+Without Redis (see redis_client.get_redis) reads miss and writes/invalidation are no-ops.
+"""
+
+from __future__ import annotations
+
+import json
+
+from redis_client import get_redis
+
+# Last /discover result (DiscoverCache): served from Redis instead of the cookie session or
+# a SELECT on every GET; the discover job writes it here as soon as it finishes.
+DISCOVER_CACHE_SECONDS = 600
+
+
+def source_accounts_key(user_id: str) -> str:
+    return f"followers:sources:{user_id}"
+
+
+def statistics_key(user_id: str) -> str:
+    return f"stats:{user_id}"
+
+
+def publications_key(user_id: str) -> str:
+    return f"publish:{user_id}"
+
+
+def discover_key(user_id: str) -> str:
+    return f"discover:{user_id}"
+
+
+def cache_get_json(key: str):
+    """Cached value, or None (no Redis / miss / error)."""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        cached = r.get(key)
+    except Exception:
+        return None
+    return json.loads(cached) if cached is not None else None
+
+
+def cache_set_json(key: str, value, ttl_seconds: int) -> None:
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.set(key, json.dumps(value), ex=ttl_seconds)
+    except Exception:
+        pass
+
+
+def invalidate_user_caches(user_id: str) -> None:
+    """Drop the user's caches (/followers sources, /statistics, /publish history, /discover) after a write."""
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(source_accounts_key(user_id), statistics_key(user_id),
+                     publications_key(user_id), discover_key(user_id))
+        except Exception:
+            pass
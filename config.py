@@ -2,10 +2,24 @@ import os
 from datetime import timedelta
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Загрузить переменные окружения из .env файла
 load_dotenv()
 
 
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# JSON-колонки (AiCache.payload, DiscoverCache.payload, followers.matched_keywords, ...) разбираются
+# на каждом чтении: psycopg2 вызывает json_deserializer SQLAlchemy - orjson вместо stdlib json
+JSON_ENGINE_OPTIONS = {'json_serializer': _orjson_dumps, 'json_deserializer': orjson.loads} if orjson else {}
+
+
 class Config:
     """Базовая конфигурация"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -17,6 +31,25 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Пул соединений на процесс (gunicorn worker / runner). Итог: процессы x (pool_size + max_overflow)
+    # должен помещаться в max_connections Postgres
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'pool_pre_ping': True,   # отбрасывать соединения, закрытые сервером/балансировщиком
+        'pool_recycle': 1800,
+        'connect_args': {
+            'application_name': os.environ.get('DB_APPLICATION_NAME', 'osintgram'),
+            # Зависший запрос не держит соединение пула бесконечно (0 = без лимита)
+            'options': f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '60000'))}",
+        },
+        # psycopg2: INSERT executemany -> multi-row VALUES, UPDATE/DELETE executemany -> execute_batch
+        'executemany_mode': 'values_plus_batch',
+        'insertmanyvalues_page_size': 5000,
+        **JSON_ENGINE_OPTIONS,
+    }
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_SECURE = True
@@ -29,6 +62,23 @@ class Config:
     
     # Pagination
     ITEMS_PER_PAGE = 50
+
+    # DDL (CREATE SCHEMA + db.create_all()) при старте приложения. В production
+    # выключено: схему создаёт release-шаг `flask init-db` (на Render - Pre-Deploy Command);
+    # если таблиц еще нет (шаг не выполнялся), create_app все равно создаст их при старте
+    RUN_DDL = os.environ.get('RUN_DDL', '0').lower() in {'1', 'true', 'yes'}
+    
+    # Предупреждение о возможном N+1: больше SQL-запросов за один HTTP-запрос (0 = выкл.)
+    SQL_QUERY_WARN_THRESHOLD = int(os.environ.get('SQL_QUERY_WARN_THRESHOLD', '0'))
+    # Более строгие бюджеты для страниц, которые уже оптимизированы (endpoint -> макс. запросов)
+    SQL_QUERY_BUDGETS = {
+        'statistics': 8,
+        'dashboard': 8,
+        'followers_table': 8,
+        'publish_content': 8,
+    }
+    # True: превышение бюджета - AssertionError (тесты), а не только предупреждение
+    SQL_QUERY_BUDGET_STRICT = False
     
     # Instagram
     INSTAGRAPI_REQUEST_TIMEOUT = 30
@@ -40,6 +90,8 @@ class DevelopmentConfig(Config):
     DEBUG = True
     TESTING = False
     SESSION_COOKIE_SECURE = False
+    RUN_DDL = os.environ.get('RUN_DDL', '1').lower() in {'1', 'true', 'yes'}
+    SQL_QUERY_WARN_THRESHOLD = int(os.environ.get('SQL_QUERY_WARN_THRESHOLD', '25'))
 
 
 class ProductionConfig(Config):
@@ -51,8 +103,12 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Конфигурация для тестирования"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # Тесты с БД (tests/) требуют PostgreSQL: schema, DISTINCT ON, ON CONFLICT, триггеры счетчиков
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+    SQLALCHEMY_ENGINE_OPTIONS = dict(JSON_ENGINE_OPTIONS)
     WTF_CSRF_ENABLED = False
+    SQL_QUERY_WARN_THRESHOLD = 25
+    SQL_QUERY_BUDGET_STRICT = True
 
 
 # Выбор конфига в зависимости от окружения
@@ -27,3 +27,49 @@ def init_db(app):
     """
     with app.app_context():
         print(f"Database connected to schema '{SCHEMA_NAME}'")
+
+
+def init_query_counter(app):
+    """
+    Счетчик SQL-запросов на HTTP-запрос (dev-защита от N+1).
+
+    Если за один запрос выполнено больше SQL_QUERY_WARN_THRESHOLD statement-ов
+    (или бюджета endpoint-а из SQL_QUERY_BUDGETS), печатает предупреждение с путем -
+    так новые lazy-load в шаблонах видны сразу. С SQL_QUERY_BUDGET_STRICT (TestingConfig)
+    превышение - AssertionError, т.е. тест на страницу падает (tests/test_query_budgets.py).
+    Считается до teardown запроса - вместе с запросами потоковых (stream_template) страниц.
+
+    Args:
+        app: Flask application instance
+    """
+    threshold = int(app.config.get('SQL_QUERY_WARN_THRESHOLD') or 0)
+    if threshold <= 0:
+        return
+
+    from flask import g, has_request_context, request
+    from sqlalchemy import event
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g._sql_query_count = g.get('_sql_query_count', 0) + 1
+
+    budgets = dict(app.config.get('SQL_QUERY_BUDGETS') or {})
+    strict = bool(app.config.get('SQL_QUERY_BUDGET_STRICT'))
+
+    # teardown, а не after_request: страницы на stream_template дорендериваются (и выполняют
+    # запросы) уже после after_request, а контекст запроса снимается только после ответа целиком
+    @app.teardown_request
+    def _warn_query_count(exc=None):
+        if exc is not None:
+            return
+        count = g.get('_sql_query_count', 0)
+        limit = budgets.get(request.endpoint, threshold)
+        if count > limit:
+            message = f"{request.method} {request.path}: {count} SQL запросов (порог {limit}) - возможен N+1"
+            if strict:
+                raise AssertionError(message)
+            print(f"⚠️ {message}")
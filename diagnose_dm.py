@@ -3,7 +3,8 @@ from models import InstagramAccount, DmAssistantSettings
 
 
 def main() -> None:
-    flask_app = app_module.create_app()
+    # Reuse the app instance created in app.py (prevents double create_app()).
+    flask_app = getattr(app_module, 'app', None) or app_module.create_app()
     with flask_app.app_context():
         accs = InstagramAccount.query.all()
         print(f"Accounts: {len(accs)}")
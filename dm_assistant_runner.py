@@ -28,20 +28,23 @@ if not ENABLE_DM_ASSISTANT:
     raise SystemExit(0)
 
 import app as app_module  # noqa: E402
-from models import User  # noqa: E402
+from database import db  # noqa: E402
+from models import DmAssistantSettings  # noqa: E402
 from dm_assistant_service import poll_and_reply_for_user  # noqa: E402
 
 
 def main():
-    flask_app = app_module.create_app()
+    # Reuse the app instance created in app.py (prevents double create_app()).
+    flask_app = getattr(app_module, 'app', None) or app_module.create_app()
 
     with flask_app.app_context():
         while True:
             try:
-                users = User.query.all()
+                user_ids = [row[0] for row in db.session.query(DmAssistantSettings.user_id)
+                            .filter(DmAssistantSettings.enabled.is_(True)).distinct().all()]
                 total = 0
-                for u in users:
-                    total += poll_and_reply_for_user(u.id, threads_limit=10, messages_per_thread=20)
+                for user_id in user_ids:
+                    total += poll_and_reply_for_user(user_id, threads_limit=10, messages_per_thread=20)
                 if total:
                     print(f"[{datetime.utcnow().isoformat()}] dm replies sent: {total}")
             except Exception as e:
@@ -15,6 +15,8 @@ from datetime import timedelta
 import os
 from typing import Any, Dict, List, Optional
 
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from database import db
 from models import (
     InstagramAccount,
@@ -23,7 +25,7 @@ from models import (
     DmMessage,
 )
 from encryption import decrypt_password
-from instagram_service import InstagramService
+from instagram_service import InstagramService, instagram_account_lock
 from ai_service import generate_dm_reply
 
 
@@ -32,6 +34,9 @@ from ai_service import generate_dm_reply
 # safely treat it as a "new" conversation and reply immediately.
 FIRST_SEEN_REPLY_WINDOW_MINUTES = 10
 
+# How often an enabled account's inbox is polled (next_run_at = last run + interval).
+DM_ASSISTANT_INTERVAL_SECONDS = int(os.environ.get('DM_ASSISTANT_LOOP_SECONDS', '45'))
+
 
 def _env_truthy(name: str, default: str = 'false') -> bool:
     return os.environ.get(name, default).lower() in {'1', 'true', 'yes'}
@@ -111,7 +116,7 @@ def _persist_messages_best_effort(
     window = messages[-max_items:] if len(messages) > max_items else messages
 
     try:
-        added = 0
+        rows = []
         skipped_no_id = 0
         for m in window:
             sender_id = str(_get_attr(m, ['user_id', 'sender_id', 'from_user_id'], default='') or '')
@@ -120,14 +125,14 @@ def _persist_messages_best_effort(
             if not row.get('item_id'):
                 skipped_no_id += 1
                 continue
+            rows.append(row)
 
-            exists = (DmMessage.query
-                      .filter_by(instagram_account_id=account_id, thread_id=thread_id, item_id=row['item_id'])
-                      .first())
-            if exists:
-                continue
-            db.session.add(DmMessage(**row))
-            added += 1
+        # One INSERT for the window; already stored messages are skipped by the unique
+        # (instagram_account_id, thread_id, item_id) index instead of a SELECT per message
+        added = 0
+        if rows:
+            stmt = pg_insert(DmMessage).on_conflict_do_nothing().returning(DmMessage.id)
+            added = len(db.session.execute(stmt, rows).all())
 
         db.session.commit()
         if _is_debug() and (added or skipped_no_id):
@@ -371,6 +376,7 @@ def poll_and_reply_for_user(user_id: str, threads_limit: int = 10, messages_per_
 
     for settings in settings_list:
         settings.last_run_at = _now_utc()
+        settings.next_run_at = settings.last_run_at + timedelta(seconds=max(1, DM_ASSISTANT_INTERVAL_SECONDS))
         settings.last_error = None
         try:
             replied = _poll_and_reply_for_account(
@@ -408,6 +414,24 @@ def _poll_and_reply_for_account(
         settings.last_error = 'decrypt_failed: set ENCRYPTION_KEY (or same SECRET_KEY) to decrypt instagram_password'
         return 0
 
+    with instagram_account_lock(account.instagram_username) as acquired:
+        if not acquired:
+            settings.last_error = 'account_busy: another job is logged in to this Instagram account'
+            return 0
+        return _poll_and_reply_logged_in(
+            user_id, account_id, account, password, settings, threads_limit, messages_per_thread,
+        )
+
+
+def _poll_and_reply_logged_in(
+    user_id: str,
+    account_id: str,
+    account: InstagramAccount,
+    password: str,
+    settings: DmAssistantSettings,
+    threads_limit: int,
+    messages_per_thread: int,
+) -> int:
     service = InstagramService(account.instagram_username, password)
     ok, login_msg = service.login()
     if not ok:
@@ -5,6 +5,7 @@
 import os
 from cryptography.fernet import Fernet
 from base64 import urlsafe_b64encode, urlsafe_b64decode
+import functools
 import hashlib
 import re
 
@@ -46,6 +47,16 @@ def get_encryption_key() -> bytes:
     return urlsafe_b64encode(hashed)
 
 
+@functools.lru_cache(maxsize=1)
+def _get_cipher() -> Fernet:
+    """
+    Fernet з ключем, отриманим один раз на процес (env + sha256 + розбір ключа).
+
+    Лениво, а не при імпорті: app.py імпортує цей модуль до load_dotenv().
+    """
+    return Fernet(get_encryption_key())
+
+
 def encrypt_password(password: str) -> str:
     """
     Зашифрувати пароль.
@@ -59,8 +70,7 @@ def encrypt_password(password: str) -> str:
     if not password:
         return ""
     
-    key = get_encryption_key()
-    fernet = Fernet(key)
+    fernet = _get_cipher()
     encrypted = fernet.encrypt(password.encode())
     return encrypted.decode()
 
@@ -79,8 +89,7 @@ def decrypt_password(encrypted_password: str) -> str:
         return ""
     
     try:
-        key = get_encryption_key()
-        fernet = Fernet(key)
+        fernet = _get_cipher()
         decrypted = fernet.decrypt(encrypted_password.encode())
         return decrypted.decode()
     except Exception as e:
@@ -92,3 +101,28 @@ def decrypt_password(encrypted_password: str) -> str:
             print(f"Помилка розшифрування ({err_name}): {err_msg}")
             return ""
         return encrypted_password
+
+
+def decrypt_account_password(account) -> str:
+    """
+    Розшифрувати пароль InstagramAccount з кешем на час HTTP-запиту (flask.g).
+
+    Кеш живе лише в межах запиту: відкриті паролі не залишаються в пам'яті процесу.
+
+    Args:
+        account: InstagramAccount
+
+    Returns:
+        str: Пароль у відкритому вигляді
+    """
+    from flask import g, has_request_context
+
+    if not has_request_context():
+        return decrypt_password(account.instagram_password)
+
+    cache = g.setdefault('_decrypted_passwords', {})
+    # Ключ включає шифротекст: після зміни пароля в тому ж запиті кеш не застаріє
+    cache_key = (account.id, account.instagram_password)
+    if cache_key not in cache:
+        cache[cache_key] = decrypt_password(account.instagram_password)
+    return cache[cache_key]
@@ -0,0 +1,56 @@
+"""Gunicorn settings (picked up automatically from the working directory).
+
+Web requests are I/O-bound (Postgres, Redis, OpenAI, Instagram): gevent workers let one
+process overlap many in-flight requests instead of blocking a sync worker per request.
+psycopg2 is a C extension that gevent's monkey-patching does not reach, so it gets
+psycogreen's wait callback after fork - otherwise every DB round-trip blocks the whole worker.
+In-request asyncio (AI batch analysis) runs its event loop on the gevent hub's native
+threadpool, since all greenlets of a worker share one OS thread.
+
+Env:
+  WEB_CONCURRENCY=5              # worker processes (default 2*CPU+1)
+  GUNICORN_WORKER_CLASS=gevent   # or sync
+  GUNICORN_WORKER_CONNECTIONS=100
+  GUNICORN_TIMEOUT=120
+  DB_MAX_CONNECTIONS=100         # Postgres max_connections available to the web service
+
+Keep DB_POOL_SIZE + DB_MAX_OVERFLOW (per worker) within Postgres max_connections:
+greenlets beyond the pool wait up to DB_POOL_TIMEOUT for a connection instead of
+opening new ones, so worker_connections can be larger than the pool.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("⚠️ gevent not installed, falling back to sync workers. Run: pip install gevent psycogreen")
+        worker_class = 'sync'
+
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+# Peak DB connections of the web service: every worker can fill its pool + overflow
+_db_pool_peak = workers * (int(os.environ.get('DB_POOL_SIZE', '10')) + int(os.environ.get('DB_MAX_OVERFLOW', '20')))
+_db_max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', '100'))
+if _db_pool_peak > _db_max_connections:
+    print(f"⚠️ {workers} workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) = {_db_pool_peak} connections "
+          f"> DB_MAX_CONNECTIONS={_db_max_connections}. Lower WEB_CONCURRENCY or the pool, "
+          f"otherwise bursts end in 'too many connections' instead of waiting in the pool")
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen not installed: psycopg2 calls will block the gevent worker")
+        return
+    patch_psycopg()
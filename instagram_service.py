@@ -9,12 +9,17 @@ from instagrapi.exceptions import (
     FeedbackRequired, UnknownError, ClientError
 )
 from database import db
+from redis_client import get_redis, redis_lock
 from models import Follower, ParseSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime
+import json
 import logging
 import re
 import os
-from typing import List, Dict, Tuple, Optional
+from contextlib import contextmanager
+from sqlalchemy import text
+from typing import Callable, List, Dict, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +27,111 @@ logger = logging.getLogger(__name__)
 SESSIONS_DIR = os.path.join(os.path.dirname(__file__), 'sessions')
 os.makedirs(SESSIONS_DIR, exist_ok=True)
 
+# Сессии Instagram (cookies + device/user-agent) в Redis, чтобы все web/worker-процессы
+# и хосты переиспользовали один логин вместо нового handshake (файл - локальный фолбэк)
+IG_SESSION_TTL_SECONDS = int(os.environ.get('IG_SESSION_TTL_SECONDS', str(30 * 24 * 3600)))
+
+# Сколько строк подписчиков отправлять в одном INSERT-вызове (внутри SQLAlchemy ещё
+# режет на multi-row VALUES по insertmanyvalues_page_size)
+FOLLOWERS_INSERT_CHUNK = int(os.environ.get('FOLLOWERS_INSERT_CHUNK', '5000'))
+
+
+def bulk_insert_followers(rows: List[Dict]) -> List[str]:
+    """
+    Пакетная вставка подписчиков: INSERT ... VALUES (...), (...) ON CONFLICT DO NOTHING.
+    Дубликаты (user_id + instagram_user_id / username) отсекают уникальные индексы.
+    Коммит — на вызывающей стороне.
+    
+    Returns:
+        List[str]: username реально вставленных строк
+    """
+    inserted = []
+    stmt = pg_insert(Follower).on_conflict_do_nothing().returning(Follower.username)
+    for start in range(0, len(rows), FOLLOWERS_INSERT_CHUNK):
+        chunk = rows[start:start + FOLLOWERS_INSERT_CHUNK]
+        inserted.extend(row[0] for row in db.session.execute(stmt, chunk))
+    return inserted
+
+
+def import_followers_by_username(usernames: List[str], user_id: str, parse_session_id: str,
+                                 source_account_username: str, collected_at: datetime) -> int:
+    """
+    Импорт подписчиков по username (instagram_user_id = username, все - целевая аудитория)
+    через bulk_insert_followers. Коммит — на вызывающей стороне.
+
+    Returns:
+        int: сколько строк реально вставлено (без дубликатов)
+    """
+    return len(bulk_insert_followers([
+        {
+            'user_id': user_id,
+            'parse_session_id': parse_session_id,
+            'instagram_user_id': username,
+            'username': username,
+            'source_account_username': source_account_username,
+            'collected_at': collected_at,
+            'is_target_audience': True,
+            'is_frankfurt_region': True,
+            'interest_score': 50,
+        }
+        for username in usernames
+    ]))
+
+
+# TTL блокировки аккаунта важен только если процесс умер, не отпустив её
+IG_ACCOUNT_LOCK_SECONDS = int(os.environ.get('IG_ACCOUNT_LOCK_SECONDS', '1800'))
+
+
+@contextmanager
+def instagram_account_lock(username: str, ttl_seconds: int = IG_ACCOUNT_LOCK_SECONDS):
+    """
+    Один логин/сессия instagrapi на Instagram-аккаунт одновременно: параллельные логины
+    перезаписывают cookies друг друга (и выглядят подозрительно для Instagram).
+    Неблокирующая: yield True, если блокировка наша.
+
+    С Redis - lock:ig:<username>; без Redis - PostgreSQL pg_try_advisory_lock(hashtext('ig:'||username))
+    на отдельном соединении из пула (session-level lock живет, пока соединение не отпустит его).
+    """
+    key = f"ig:{username.lower()}"
+    if get_redis() is not None:
+        with redis_lock(f"lock:{key}", ttl_seconds) as acquired:
+            yield acquired
+        return
+
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+
+    with db.engine.connect() as conn:
+        acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {'key': key}).scalar())
+        conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {'key': key})
+                conn.commit()
+
+
+def _session_key(username: str) -> str:
+    return f"ig_session:{username.lower()}"
+
+
+def drop_saved_session(username: str) -> None:
+    """Удалить сохранённую сессию Instagram (файл + Redis), напр. при смене пароля."""
+    session_file = os.path.join(SESSIONS_DIR, f'{username}_session.json')
+    try:
+        if os.path.exists(session_file):
+            os.remove(session_file)
+    except OSError:
+        pass
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(_session_key(username))
+        except Exception:
+            pass
+
 
 class InstagramService:
     """Сервис для работы с Instagram через Instagrapi"""
@@ -50,6 +160,38 @@ class InstagramService:
         self._logged_in = False
         self.session_file = os.path.join(SESSIONS_DIR, f'{username}_session.json')
     
+    def _load_saved_session(self) -> bool:
+        """Загрузить настройки клиента (cookies, device) из Redis или файла сессии."""
+        r = get_redis()
+        if r is not None:
+            try:
+                raw = r.get(_session_key(self.username))
+                if raw:
+                    self.client.set_settings(json.loads(raw))
+                    return True
+            except Exception as e:
+                print(f"WARN: redis session load failed for {self.username}: {e}")
+        
+        if os.path.exists(self.session_file):
+            try:
+                self.client.load_settings(self.session_file)
+                return True
+            except Exception as e:
+                print(f"WARN: session file unreadable for {self.username}: {e}")
+        return False
+    
+    def _save_session(self) -> None:
+        self.client.dump_settings(self.session_file)
+        r = get_redis()
+        if r is not None:
+            try:
+                r.set(_session_key(self.username), json.dumps(self.client.get_settings()), ex=IG_SESSION_TTL_SECONDS)
+            except Exception as e:
+                print(f"WARN: redis session save failed for {self.username}: {e}")
+    
+    def _drop_saved_session(self) -> None:
+        drop_saved_session(self.username)
+    
     def login(self) -> Tuple[bool, str]:
         """
         Вход в аккаунт Instagram с поддержкой сохранения сессии
@@ -60,17 +202,17 @@ class InstagramService:
         if not self.password:
             return False, 'Порожній пароль (помилка розшифрування або не задано)'
 
-        # Пробуем загрузить существующую сессию
-        if os.path.exists(self.session_file):
+        # Пробуем загрузить существующую сессию (Redis, затем файл)
+        if self._load_saved_session():
             try:
-                self.client.load_settings(self.session_file)
                 self.client.login(self.username, self.password)
                 self._logged_in = True
+                self._save_session()
                 print(f"OK: login via saved session: {self.username}")
                 return True, "Успешно вошли через сохранённую сессию"
             except Exception as e:
                 print(f"WARN: session expired, fallback to normal login: {e}")
-                os.remove(self.session_file)
+                self._drop_saved_session()
         
         # Обычный вход
         try:
@@ -79,7 +221,7 @@ class InstagramService:
             self._logged_in = True
             
             # Сохраняем сессию
-            self.client.dump_settings(self.session_file)
+            self._save_session()
             print(f"OK: login success, session saved: {self.username}")
             
             return True, "Успешно вошли в аккаунт"
@@ -312,7 +454,8 @@ class InstagramService:
             return [], error_msg
     
     def parse_competitors(self, competitor_usernames: List[str], parse_session_id: str, 
-                          user_id: str, max_followers: int = 10000) -> Tuple[int, Dict]:
+                          user_id: str, max_followers: int = 10000,
+                          on_progress: Optional[Callable[[Dict], None]] = None) -> Tuple[int, Dict]:
         """
         Парсить подписчиков нескольких конкурентов
         
@@ -321,6 +464,7 @@ class InstagramService:
             parse_session_id: ID сессии парсинга
             user_id: ID пользователя приложения
             max_followers: максимальное количество подписчиков для сбора с каждого аккаунта
+            on_progress: колбэк с прогрессом после каждого аккаунта (для SSE на странице)
             
         Returns:
             Tuple[int, Dict]: (общее количество собранных, словарь ошибок)
@@ -329,6 +473,19 @@ class InstagramService:
         failed_accounts = {}
         unique_usernames = set()
         
+        def _progress(account: str, error: str = '') -> None:
+            if on_progress is None:
+                return
+            try:
+                on_progress({
+                    'type': 'progress',
+                    'account': account,
+                    'total_collected': total_collected,
+                    'error': error,
+                })
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+        
         for competitor_username in competitor_usernames:
             competitor_username = competitor_username.lstrip('@').strip()
             
@@ -340,34 +497,30 @@ class InstagramService:
                 
                 if error:
                     failed_accounts[competitor_username] = error
+                    _progress(competitor_username, error)
                     continue
                 
-                # Сохранить подписчиков в БД
-                for follower_data in followers_data:
-                    # Проверить не существует ли уже такой подписчик
-                    existing = Follower.query.filter_by(
-                        user_id=user_id,
-                        instagram_user_id=follower_data['instagram_user_id']
-                    ).first()
-                    
-                    if not existing:
-                        follower = Follower(
-                            user_id=user_id,
-                            parse_session_id=parse_session_id,
-                            **follower_data
-                        )
-                        db.session.add(follower)
-                        unique_usernames.add(follower_data['username'])
-                        total_collected += 1
+                # Сохранить подписчиков в БД одним INSERT; уже существующих
+                # (user_id + instagram_user_id / username) пропускает ON CONFLICT DO NOTHING
+                if followers_data:
+                    rows = [
+                        {**follower_data, 'user_id': user_id, 'parse_session_id': parse_session_id}
+                        for follower_data in followers_data
+                    ]
+                    inserted = bulk_insert_followers(rows)
+                    unique_usernames.update(inserted)
+                    total_collected += len(inserted)
                 
                 db.session.commit()
                 logger.info(f"Saved {len(followers_data)} followers from {competitor_username}")
+                _progress(competitor_username)
                 
             except Exception as e:
                 error_msg = str(e)
                 failed_accounts[competitor_username] = error_msg
                 logger.error(f"Error parsing {competitor_username}: {error_msg}")
                 db.session.rollback()
+                _progress(competitor_username, error_msg)
         
         # Обновить сессию парсинга
         parse_session = ParseSession.query.get(parse_session_id)
@@ -25,7 +25,8 @@ LOOP_SECONDS = int(os.environ.get('INVITE_CAMPAIGN_LOOP_SECONDS', '60'))
 
 # Import the app to initialize db
 import app as app_module  # noqa: E402
-from models import User  # noqa: E402
+from database import db  # noqa: E402
+from models import InviteCampaignSettings  # noqa: E402
 from invite_campaign_service import run_invite_campaign_for_user  # noqa: E402
 
 
@@ -34,16 +35,18 @@ def main():
         print('Invite campaign disabled (set ENABLE_INVITE_CAMPAIGN=true).')
         raise SystemExit(0)
 
-    flask_app = app_module.create_app()
+    # Reuse the app instance created in app.py (prevents double create_app()).
+    flask_app = getattr(app_module, 'app', None) or app_module.create_app()
 
     with flask_app.app_context():
         while True:
             try:
-                users = User.query.all()
-                for u in users:
-                    stats = run_invite_campaign_for_user(u.id)
+                user_ids = [row[0] for row in db.session.query(InviteCampaignSettings.user_id)
+                            .filter(InviteCampaignSettings.enabled.is_(True)).distinct().all()]
+                for user_id in user_ids:
+                    stats = run_invite_campaign_for_user(user_id)
                     if stats.get('sent') or stats.get('stopped') or stats.get('completed') or stats.get('failed'):
-                        print(f"[{datetime.utcnow().isoformat()}] user={u.id} {stats}")
+                        print(f"[{datetime.utcnow().isoformat()}] user={user_id} {stats}")
             except Exception as e:
                 print(f"Invite campaign error: {e}")
 
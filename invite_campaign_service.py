@@ -14,11 +14,14 @@ from __future__ import annotations
 import random
 import time
 from datetime import date, datetime, timedelta
+import os
 from typing import Any, Dict, List, Optional, Tuple
 
 from zoneinfo import ZoneInfo
 from datetime import timezone
 
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from database import db
 from models import (
     Follower,
@@ -29,7 +32,11 @@ from models import (
     DmMessage,
 )
 from encryption import decrypt_password
-from instagram_service import InstagramService
+from instagram_service import InstagramService, instagram_account_lock
+
+
+# How often enabled campaigns are processed (next_run_at = last run + interval).
+INVITE_CAMPAIGN_INTERVAL_SECONDS = int(os.environ.get('INVITE_CAMPAIGN_LOOP_SECONDS', '60'))
 
 
 def _now_utc() -> datetime:
@@ -149,11 +156,14 @@ def _pick_new_followers(
         elif group == 'own':
             q = q.filter(db.func.lower(Follower.source_account_username) == my_u)
 
-    # Exclude already-enrolled recipients for this account
-    subq = db.session.query(InviteCampaignRecipient.recipient_username).filter(
-        InviteCampaignRecipient.instagram_account_id == account_id
-    )
-    q = q.filter(~Follower.username.in_(subq))
+    # Exclude already-enrolled recipients for this account. Correlated NOT EXISTS plans as an
+    # anti-join on the (instagram_account_id, recipient_username) unique index; NOT IN (subquery)
+    # cannot (NULL semantics) and degrades to re-scanning the subquery once it outgrows work_mem.
+    already_enrolled = db.select(InviteCampaignRecipient.id).where(
+        InviteCampaignRecipient.instagram_account_id == account_id,
+        InviteCampaignRecipient.recipient_username == Follower.username,
+    ).exists()
+    q = q.filter(~already_enrolled)
 
     # Prefer newest collected first (simple heuristic)
     q = q.order_by(Follower.collected_at.desc())
@@ -161,41 +171,36 @@ def _pick_new_followers(
     return q.limit(int(limit)).all()
 
 
-def _ensure_recipient_enrolled(
-    user_id: str,
-    account_id: str,
-    recipient_username: str,
-    recipient_user_id: Optional[str] = None,
-) -> Optional[InviteCampaignRecipient]:
-    existing = InviteCampaignRecipient.query.filter_by(
-        instagram_account_id=account_id,
-        recipient_username=recipient_username,
-    ).first()
-    if existing:
-        return existing
+def _enroll_recipients(user_id: str, account_id: str, followers: List[Follower]) -> int:
+    """Enroll followers as recipients in one INSERT ... ON CONFLICT DO NOTHING.
+
+    Already enrolled usernames (incl. concurrent runners) are skipped by the unique
+    (instagram_account_id, recipient_username) index instead of a SELECT per follower.
+    Returns the number of newly enrolled recipients.
+    """
+    if not followers:
+        return 0
 
     now = _now_utc()
-    rec = InviteCampaignRecipient(
-        user_id=user_id,
-        instagram_account_id=account_id,
-        recipient_username=recipient_username,
-        recipient_user_id=recipient_user_id,
-        status='active',
-        current_step=0,
-        enrolled_at=now,
-        next_send_at=now,
-    )
-    db.session.add(rec)
-    try:
-        db.session.commit()
-        return rec
-    except Exception:
-        db.session.rollback()
-        # likely unique constraint race
-        return InviteCampaignRecipient.query.filter_by(
-            instagram_account_id=account_id,
-            recipient_username=recipient_username,
-        ).first()
+    rows = [
+        {
+            'user_id': user_id,
+            'instagram_account_id': account_id,
+            'recipient_username': f.username,
+            'recipient_user_id': f.instagram_user_id,
+            'status': 'active',
+            'current_step': 0,
+            'enrolled_at': now,
+            'next_send_at': now,
+        }
+        for f in followers
+    ]
+    stmt = (pg_insert(InviteCampaignRecipient)
+            .on_conflict_do_nothing()
+            .returning(InviteCampaignRecipient.id))
+    enrolled = len(db.session.execute(stmt, rows).all())
+    db.session.commit()
+    return enrolled
 
 
 def _format_template(template: str, follower: Optional[Follower]) -> str:
@@ -283,6 +288,7 @@ def run_invite_campaign_for_user(user_id: str, max_per_account: Optional[int] =
 
     for settings in settings_list:
         settings.last_run_at = _now_utc()
+        settings.next_run_at = settings.last_run_at + timedelta(seconds=max(1, INVITE_CAMPAIGN_INTERVAL_SECONDS))
         settings.last_error = None
         try:
             s, stopped, completed, failed = _run_for_account(user_id, settings, max_per_account=max_per_account)
@@ -323,6 +329,21 @@ def _run_for_account(
         db.session.commit()
         return 0, 0, 0, 0
 
+    with instagram_account_lock(account.instagram_username) as acquired:
+        if not acquired:
+            return 0, 0, 0, 0
+        return _run_logged_in(user_id, account_id, account, password, settings, steps, max_per_account)
+
+
+def _run_logged_in(
+    user_id: str,
+    account_id: str,
+    account: InstagramAccount,
+    password: str,
+    settings: InviteCampaignSettings,
+    steps: List[Dict[str, Any]],
+    max_per_account: Optional[int],
+) -> Tuple[int, int, int, int]:
     service = InstagramService(account.instagram_username, password)
     ok, _ = service.login()
     if not ok:
@@ -368,13 +389,7 @@ def _run_for_account(
             )
             if not new_followers:
                 break
-            for f in new_followers:
-                _ensure_recipient_enrolled(
-                    user_id=user_id,
-                    account_id=account_id,
-                    recipient_username=f.username,
-                    recipient_user_id=f.instagram_user_id,
-                )
+            _enroll_recipients(user_id=user_id, account_id=account_id, followers=new_followers)
             rec = _pick_due_recipient(user_id, account_id)
             if rec is None:
                 break
@@ -5,7 +5,7 @@ from __future__ import annotations
 import os
 import re
 import uuid
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple, Union
 
 import requests
 from PIL import Image
@@ -52,11 +52,15 @@ def download_image(url: str, dest_dir: str, timeout: int = 25) -> str:
     return path
 
 
-def normalize_to_jpeg(input_path: str, output_path: str, max_size: Tuple[int, int] = (1080, 1350)) -> str:
-    """Convert image to RGB JPEG and resize to fit within max_size."""
+def normalize_to_jpeg(input_path: Union[str, BinaryIO], output_path: str,
+                      max_size: Tuple[int, int] = (1080, 1350)) -> str:
+    """Convert image (path or binary file object, e.g. an upload stream) to RGB JPEG within max_size."""
     os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
 
     with Image.open(input_path) as im:
+        # JPEG: decode already downscaled by libjpeg (DCT scaling, not below max_size) instead of
+        # decoding the full camera resolution; convert() would otherwise force a full-size load first
+        im.draft('RGB', max_size)
         im = im.convert('RGB')
         im.thumbnail(max_size, Image.LANCZOS)
         im.save(output_path, format='JPEG', quality=92, optimize=True)
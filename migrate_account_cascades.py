@@ -0,0 +1,90 @@
+"""Switch foreign keys of Instagram-account-owned rows to ON DELETE CASCADE (idempotent).
+
+Run:
+  py -3.10 migrate_account_cascades.py
+
+Requires DATABASE_URL.
+
+Deleting an instagram_accounts row then removes its DM / invite campaign / published
+content / discover cache / message logs (+ sent_messages) / parse sessions (+ followers)
+server-side, so /accounts/<id>/delete is a single DELETE. New databases get the same
+constraints from models.py via db.create_all().
+
+Constraints are re-added as NOT VALID and validated afterwards: existing rows are checked
+without holding the ALTER TABLE lock for the whole scan.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import SCHEMA_NAME  # noqa: E402
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if not DATABASE_URL:
+    raise RuntimeError('DATABASE_URL is not set')
+
+# (table, column, referenced table)
+FOREIGN_KEYS = [
+    ('parse_sessions', 'instagram_account_id', 'instagram_accounts'),
+    ('followers', 'parse_session_id', 'parse_sessions'),
+    ('published_content', 'instagram_account_id', 'instagram_accounts'),
+    ('message_logs', 'account_id', 'instagram_accounts'),
+    ('sent_messages', 'message_log_id', 'message_logs'),
+    ('discover_cache', 'instagram_account_id', 'instagram_accounts'),
+    ('dm_assistant_settings', 'instagram_account_id', 'instagram_accounts'),
+    ('dm_thread_state', 'instagram_account_id', 'instagram_accounts'),
+    ('dm_messages', 'instagram_account_id', 'instagram_accounts'),
+    ('invite_campaign_settings', 'instagram_account_id', 'instagram_accounts'),
+    ('invite_campaign_recipients', 'instagram_account_id', 'instagram_accounts'),
+    ('invite_campaign_sends', 'instagram_account_id', 'instagram_accounts'),
+]
+
+print('Migrating foreign keys: ON DELETE CASCADE for Instagram account data...')
+
+conn = psycopg2.connect(DATABASE_URL)
+conn.autocommit = True
+cur = conn.cursor()
+
+for table, column, ref_table in FOREIGN_KEYS:
+    cur.execute("SELECT to_regclass(%s)", (f'{SCHEMA_NAME}.{table}',))
+    if cur.fetchone()[0] is None:
+        print(f'  {table}: table not found, skipped')
+        continue
+
+    cur.execute("""
+    SELECT c.conname, c.confdeltype
+    FROM pg_constraint c
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+    WHERE c.contype = 'f' AND c.conrelid = %s::regclass AND a.attname = %s;
+    """, (f'{SCHEMA_NAME}.{table}', column))
+    existing = cur.fetchall()
+
+    if any(deltype == 'c' for _, deltype in existing):
+        print(f'  {table}.{column}: already ON DELETE CASCADE')
+        continue
+
+    name = existing[0][0] if existing else f'{table}_{column}_fkey'
+    # One transaction: the FK is never missing for concurrent writers
+    conn.autocommit = False
+    with conn:
+        for conname, _ in existing:
+            cur.execute(f'ALTER TABLE {SCHEMA_NAME}.{table} DROP CONSTRAINT "{conname}";')
+        cur.execute(f"""
+        ALTER TABLE {SCHEMA_NAME}.{table}
+          ADD CONSTRAINT "{name}" FOREIGN KEY ({column})
+          REFERENCES {SCHEMA_NAME}.{ref_table}(id) ON DELETE CASCADE NOT VALID;
+        """)
+    conn.autocommit = True
+    cur.execute(f'ALTER TABLE {SCHEMA_NAME}.{table} VALIDATE CONSTRAINT "{name}";')
+    print(f'  {table}.{column}: ON DELETE CASCADE')
+
+cur.close()
+conn.close()
+
+print('Done.')
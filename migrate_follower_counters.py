@@ -0,0 +1,61 @@
+"""Add denormalized follower counters to users + maintaining triggers (idempotent).
+
+Run:
+  py -3.10 migrate_follower_counters.py
+
+Requires DATABASE_URL.
+
+users.followers_count / followers_with_email_count / followers_verified_count /
+followers_business_count are kept up to date by triggers on followers
+(models.FOLLOWER_COUNTER_DDL). Triggers are installed and counters backfilled in one
+transaction under a lock on followers, so no concurrent insert is counted twice or lost.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from models import FOLLOWER_COUNTER_DDL, FOLLOWER_COUNTER_RECOUNT_SQL  # noqa: E402
+from database import SCHEMA_NAME  # noqa: E402
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if not DATABASE_URL:
+    raise RuntimeError('DATABASE_URL is not set')
+
+COLUMNS = [
+    'followers_count',
+    'followers_with_email_count',
+    'followers_verified_count',
+    'followers_business_count',
+]
+
+print('Migrating users: follower counters + triggers...')
+
+conn = psycopg2.connect(DATABASE_URL)
+cur = conn.cursor()
+
+for column in COLUMNS:
+    cur.execute(f"""
+    ALTER TABLE {SCHEMA_NAME}.users
+      ADD COLUMN IF NOT EXISTS {column} INTEGER NOT NULL DEFAULT 0;
+    """)
+
+# Blocks writes to followers until commit (reads keep working)
+cur.execute(f"LOCK TABLE {SCHEMA_NAME}.followers IN SHARE ROW EXCLUSIVE MODE;")
+
+for ddl in FOLLOWER_COUNTER_DDL:
+    cur.execute(ddl)
+
+cur.execute(FOLLOWER_COUNTER_RECOUNT_SQL)
+print(f'  users: backfilled {cur.rowcount} rows')
+
+conn.commit()
+cur.close()
+conn.close()
+
+print('Done.')
@@ -0,0 +1,40 @@
+"""Add message_logs.total_recipients (idempotent).
+
+Run:
+  py -3.10 migrate_message_log_recipients.py
+
+Requires DATABASE_URL.
+
+/send-messages counts recipients of pending/running campaigns that are not sent yet
+(total_recipients - total_sent) against the daily limit. Existing rows get 0, so
+campaigns started before the migration only count what they already sent.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if not DATABASE_URL:
+    raise RuntimeError('DATABASE_URL is not set')
+
+print('Migrating message_logs: add total_recipients...')
+
+conn = psycopg2.connect(DATABASE_URL)
+conn.autocommit = True
+cur = conn.cursor()
+
+cur.execute("""
+ALTER TABLE IF EXISTS osintgram.message_logs
+  ADD COLUMN IF NOT EXISTS total_recipients INTEGER DEFAULT 0;
+""")
+
+cur.close()
+conn.close()
+
+print('Done.')
@@ -0,0 +1,86 @@
+"""Create performance indexes used by hot read paths (idempotent).
+
+Usage:
+  py -3.10 migrate_perf_indexes.py
+
+db.create_all() only creates indexes together with new tables, so existing
+DBs / Render deployments need this script to pick up indexes added to models.py.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import app  # noqa: E402
+from database import db  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from database import SCHEMA_NAME  # noqa: E402
+
+
+INDEXES = [
+    # /admin keyset pagination on (created_at, id)
+    f"CREATE INDEX IF NOT EXISTS idx_users_created_id ON {SCHEMA_NAME}.users(created_at, id)",
+
+    # /followers filters + keyset ORDER BY coalesce(quality_score, 0) DESC, id DESC pagination
+    f"CREATE INDEX IF NOT EXISTS idx_followers_user_score_id "
+    f"ON {SCHEMA_NAME}.followers(user_id, coalesce(quality_score, 0), id)",
+    f"CREATE INDEX IF NOT EXISTS idx_followers_user_session_score_id "
+    f"ON {SCHEMA_NAME}.followers(user_id, parse_session_id, coalesce(quality_score, 0), id)",
+    f"CREATE INDEX IF NOT EXISTS idx_followers_user_email_score_id "
+    f"ON {SCHEMA_NAME}.followers(user_id, coalesce(quality_score, 0), id) WHERE email IS NOT NULL",
+    # ...superseded by the coalesce versions above (NULL scores sorted first and broke the cursor)
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_quality",
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_session_quality",
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_email_quality",
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_quality_id",
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_session_quality_id",
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_followers_user_email_quality_id",
+
+    # /messaging audience counters (covering index, Postgres 11+)
+    f"CREATE INDEX IF NOT EXISTS idx_followers_user_flags "
+    f"ON {SCHEMA_NAME}.followers(user_id) INCLUDE (is_target_audience, is_frankfurt_region)",
+
+    # /send-messages "already messaged" NOT EXISTS anti-join
+    f"CREATE INDEX IF NOT EXISTS idx_sent_messages_user_recipient "
+    f"ON {SCHEMA_NAME}.sent_messages(user_id, recipient_username)",
+    # /messaging + /send-messages daily limit: count by user_id over a sent_at range
+    f"CREATE INDEX IF NOT EXISTS idx_sent_messages_user_sent_at "
+    f"ON {SCHEMA_NAME}.sent_messages(user_id, sent_at)",
+
+    # /ai latest result per kind (DISTINCT ON (kind) ORDER BY kind, created_at DESC)
+    f"CREATE INDEX IF NOT EXISTS idx_ai_cache_user_kind_created "
+    f"ON {SCHEMA_NAME}.ai_cache(user_id, kind, created_at)",
+    # ...superseded by the (..., created_at) version above
+    f"DROP INDEX IF EXISTS {SCHEMA_NAME}.idx_ai_cache_user_kind",
+
+    # /statistics recent exports (user_id had no index at all)
+    f"CREATE INDEX IF NOT EXISTS idx_export_history_user_exported "
+    f"ON {SCHEMA_NAME}.export_history(user_id, exported_at)",
+
+    # source_account_username ILIKE '%x%' (needs pg_trgm; not declared in models.py so
+    # db.create_all() keeps working on databases without the extension)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_followers_source_trgm "
+    f"ON {SCHEMA_NAME}.followers USING gin (source_account_username gin_trgm_ops)",
+]
+
+
+def main() -> None:
+    with app.app_context():
+        print('Creating performance indexes...')
+        for ddl in INDEXES:
+            # Each statement in its own transaction: one failure (e.g. no permission
+            # for CREATE EXTENSION) must not roll back the other indexes.
+            try:
+                # Index builds on big tables outlive the app's default statement_timeout
+                db.session.execute(text('SET LOCAL statement_timeout = 0'))
+                db.session.execute(text(ddl))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f'  ⚠️ skipped: {ddl}\n     {e}')
+        print('Done.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Add unique indexes used by ON CONFLICT upserts (idempotent).
+
+Run:
+  py -3.10 migrate_unique_constraints.py
+
+Requires DATABASE_URL.
+
+- followers(user_id, username): duplicate rows are removed first, keeping the row
+  with a real Instagram id (imports store the username as a placeholder id),
+  then the most recently updated one.
+- instagram_accounts(user_id, instagram_username): replaces the non-unique index.
+  Duplicated accounts are NOT deleted automatically (they own settings/history);
+  the script reports them and skips the index until they are cleaned up.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if not DATABASE_URL:
+    raise RuntimeError('DATABASE_URL is not set')
+
+print('Migrating unique indexes: followers(user_id, username), instagram_accounts(user_id, instagram_username)...')
+
+conn = psycopg2.connect(DATABASE_URL)
+conn.autocommit = True
+cur = conn.cursor()
+
+cur.execute("""
+DELETE FROM osintgram.followers f
+USING (
+  SELECT id,
+         ROW_NUMBER() OVER (
+           PARTITION BY user_id, username
+           ORDER BY (instagram_user_id <> username) DESC, updated_at DESC NULLS LAST, id
+         ) AS rn
+  FROM osintgram.followers
+) d
+WHERE f.id = d.id AND d.rn > 1;
+""")
+print(f'  followers: removed {cur.rowcount} duplicate rows')
+
+cur.execute("""
+CREATE UNIQUE INDEX IF NOT EXISTS idx_followers_user_username_unique
+  ON osintgram.followers(user_id, username);
+""")
+
+cur.execute("""
+SELECT user_id, instagram_username, COUNT(*)
+FROM osintgram.instagram_accounts
+GROUP BY user_id, instagram_username
+HAVING COUNT(*) > 1;
+""")
+dupes = cur.fetchall()
+if dupes:
+    print('  instagram_accounts: duplicates found, unique index skipped:')
+    for user_id, username, cnt in dupes:
+        print(f'    user={user_id} @{username} x{cnt}')
+else:
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_instagram_accounts_user_username_unique
+      ON osintgram.instagram_accounts(user_id, instagram_username);
+    """)
+    cur.execute("DROP INDEX IF EXISTS osintgram.idx_user_instagram_username;")
+
+cur.close()
+conn.close()
+
+print('Done.')
@@ -0,0 +1,50 @@
+"""Add next_run_at scheduling columns to worker settings tables (idempotent).
+
+Run:
+  py -3.10 migrate_worker_schedule.py
+
+Requires DATABASE_URL.
+
+all_workers_runner.py only processes settings rows with next_run_at <= now
+(NULL = due immediately), so existing rows keep running right after migration.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if not DATABASE_URL:
+    raise RuntimeError('DATABASE_URL is not set')
+
+TABLES = [
+    ('automation_settings', 'idx_automation_settings_due'),
+    ('dm_assistant_settings', 'idx_dm_assistant_settings_due'),
+    ('invite_campaign_settings', 'idx_invite_campaign_settings_due'),
+]
+
+print('Migrating worker settings: add next_run_at...')
+
+conn = psycopg2.connect(DATABASE_URL)
+conn.autocommit = True
+cur = conn.cursor()
+
+for table, index_name in TABLES:
+    cur.execute(f"""
+    ALTER TABLE IF EXISTS osintgram.{table}
+      ADD COLUMN IF NOT EXISTS next_run_at TIMESTAMP;
+    """)
+    cur.execute(f"""
+    CREATE INDEX IF NOT EXISTS {index_name}
+      ON osintgram.{table}(enabled, next_run_at);
+    """)
+
+cur.close()
+conn.close()
+
+print('Done.')
@@ -8,6 +8,7 @@ from flask_login import UserMixin
 from datetime import datetime
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event
 
 
 # ============ USER TABLE ============
@@ -15,7 +16,10 @@ from werkzeug.security import generate_password_hash, check_password_hash
 class User(UserMixin, db.Model):
     """Таблица пользователей приложения"""
     __tablename__ = 'users'
-    __table_args__ = {'schema': SCHEMA_NAME}
+    __table_args__ = (
+        db.Index('idx_users_created_id', 'created_at', 'id'),
+        {'schema': SCHEMA_NAME}
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
@@ -35,10 +39,19 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
+    # Денормализованные счетчики подписчиков (дашборд/статистика без COUNT по followers).
+    # Поддерживаются триггерами на followers (FOLLOWER_COUNTER_DDL ниже)
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    followers_with_email_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    followers_verified_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    followers_business_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Отношения
     instagram_accounts = db.relationship('InstagramAccount', back_populates='user', cascade='all, delete-orphan')
     parse_sessions = db.relationship('ParseSession', back_populates='user', cascade='all, delete-orphan')
     followers = db.relationship('Follower', back_populates='user', cascade='all, delete-orphan')
+    # lazy='raise': обращение без явного joinedload/contains_eager падает вместо N+1 в списках
+    billing_account = db.relationship('BillingAccount', uselist=False, viewonly=True, lazy='raise')
     
     def set_password(self, password: str) -> None:
         """
@@ -71,7 +84,7 @@ class InstagramAccount(db.Model):
     """Таблица Instagram аккаунтов пользователя"""
     __tablename__ = 'instagram_accounts'
     __table_args__ = (
-        db.Index('idx_user_instagram_username', 'user_id', 'instagram_username'),
+        db.Index('idx_instagram_accounts_user_username_unique', 'user_id', 'instagram_username', unique=True),
         {'schema': SCHEMA_NAME}
     )
     
@@ -105,7 +118,9 @@ class InstagramAccount(db.Model):
     
     # Отношения
     user = db.relationship('User', back_populates='instagram_accounts')
-    parse_sessions = db.relationship('ParseSession', back_populates='instagram_account', cascade='all, delete-orphan')
+    # passive_deletes: сессии и их подписчиков удаляет FK ON DELETE CASCADE в БД, без загрузки в ORM
+    parse_sessions = db.relationship('ParseSession', back_populates='instagram_account', cascade='all, delete-orphan',
+                                     passive_deletes=True)
     
     def __repr__(self):
         return f'<InstagramAccount {self.instagram_username}>'
@@ -118,13 +133,28 @@ class Follower(db.Model):
     __tablename__ = 'followers'
     __table_args__ = (
         db.Index('idx_user_username_unique', 'user_id', 'instagram_user_id', unique=True),
+        # Импорт кладет username в instagram_user_id, поэтому уникальность и по username
+        db.Index('idx_followers_user_username_unique', 'user_id', 'username', unique=True),
         db.Index('idx_user_source_account', 'user_id', 'source_account_username'),
+        # /followers: фильтр по user_id (+ session / email) и keyset ORDER BY coalesce(quality_score, 0) DESC, id DESC
+        # (btree читается в обратном порядке, DESC в индексе не нужен; id в ключе - курсор
+        # (coalesce(quality_score, 0), id) < (...) остается чистым диапазоном по индексу, без сортировки;
+        # coalesce - чтобы NULL-оценки не ломали курсор)
+        db.Index('idx_followers_user_score_id', 'user_id', db.text('coalesce(quality_score, 0)'), 'id'),
+        db.Index('idx_followers_user_session_score_id', 'user_id', 'parse_session_id',
+                 db.text('coalesce(quality_score, 0)'), 'id'),
+        db.Index('idx_followers_user_email_score_id', 'user_id', db.text('coalesce(quality_score, 0)'), 'id',
+                 postgresql_where=db.text('email IS NOT NULL')),
+        # /messaging: count(*) FILTER по флагам аудитории - index-only scan без чтения heap
+        db.Index('idx_followers_user_flags', 'user_id',
+                 postgresql_include=['is_target_audience', 'is_frankfurt_region']),
+        # + GIN pg_trgm по source_account_username для ILIKE '%x%' (см. migrate_perf_indexes.py)
         {'schema': SCHEMA_NAME}
     )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
-    parse_session_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.parse_sessions.id'), index=True)
+    parse_session_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.parse_sessions.id', ondelete='CASCADE'), index=True)
     
     # Данные подписчика
     instagram_user_id = db.Column(db.String(255), nullable=False)
@@ -180,6 +210,107 @@ class Follower(db.Model):
         return f'<Follower {self.username}>'
 
 
+# Счетчики users.followers_* ведёт сама БД: statement-level триггеры с transition tables
+# (один UPDATE users на пакетный INSERT/DELETE, в т.ч. каскадный) + row-level триггер
+# на смену email/is_verified/is_business. ON CONFLICT DO NOTHING строки не считаются.
+_FOLLOWER_COUNTER_DELTA = """
+    UPDATE {schema}.users u SET
+        followers_count = u.followers_count {op} d.n,
+        followers_with_email_count = u.followers_with_email_count {op} d.n_email,
+        followers_verified_count = u.followers_verified_count {op} d.n_verified,
+        followers_business_count = u.followers_business_count {op} d.n_business
+    FROM (
+        SELECT user_id,
+               COUNT(*) AS n,
+               COUNT(email) AS n_email,
+               COUNT(*) FILTER (WHERE is_verified) AS n_verified,
+               COUNT(*) FILTER (WHERE is_business) AS n_business
+        FROM {rows}
+        GROUP BY user_id
+    ) d
+    WHERE u.id = d.user_id;
+"""
+
+FOLLOWER_COUNTER_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION {SCHEMA_NAME}.followers_counters_ins() RETURNS trigger AS $$
+    BEGIN
+        {_FOLLOWER_COUNTER_DELTA.format(schema=SCHEMA_NAME, op='+', rows='new_rows')}
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SCHEMA_NAME}.followers_counters_del() RETURNS trigger AS $$
+    BEGIN
+        {_FOLLOWER_COUNTER_DELTA.format(schema=SCHEMA_NAME, op='-', rows='old_rows')}
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SCHEMA_NAME}.followers_counters_upd() RETURNS trigger AS $$
+    BEGIN
+        UPDATE {SCHEMA_NAME}.users SET
+            followers_with_email_count = followers_with_email_count
+                + (NEW.email IS NOT NULL)::int - (OLD.email IS NOT NULL)::int,
+            followers_verified_count = followers_verified_count
+                + COALESCE(NEW.is_verified, false)::int - COALESCE(OLD.is_verified, false)::int,
+            followers_business_count = followers_business_count
+                + COALESCE(NEW.is_business, false)::int - COALESCE(OLD.is_business, false)::int
+        WHERE id = NEW.user_id;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS trg_followers_counters_ins ON {SCHEMA_NAME}.followers",
+    f"""
+    CREATE TRIGGER trg_followers_counters_ins AFTER INSERT ON {SCHEMA_NAME}.followers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE {SCHEMA_NAME}.followers_counters_ins()
+    """,
+    f"DROP TRIGGER IF EXISTS trg_followers_counters_del ON {SCHEMA_NAME}.followers",
+    f"""
+    CREATE TRIGGER trg_followers_counters_del AFTER DELETE ON {SCHEMA_NAME}.followers
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE {SCHEMA_NAME}.followers_counters_del()
+    """,
+    f"DROP TRIGGER IF EXISTS trg_followers_counters_upd ON {SCHEMA_NAME}.followers",
+    f"""
+    CREATE TRIGGER trg_followers_counters_upd AFTER UPDATE OF email, is_verified, is_business
+    ON {SCHEMA_NAME}.followers
+    FOR EACH ROW
+    WHEN (OLD.email IS DISTINCT FROM NEW.email
+          OR OLD.is_verified IS DISTINCT FROM NEW.is_verified
+          OR OLD.is_business IS DISTINCT FROM NEW.is_business)
+    EXECUTE PROCEDURE {SCHEMA_NAME}.followers_counters_upd()
+    """,
+]
+
+# Полный пересчет счетчиков из followers: backfill в миграции и `flask recount-followers`
+# (если триггеры обходили - TRUNCATE, session_replication_role = replica и т.п.)
+FOLLOWER_COUNTER_RECOUNT_SQL = f"""
+UPDATE {SCHEMA_NAME}.users u SET
+  followers_count = COALESCE(d.n, 0),
+  followers_with_email_count = COALESCE(d.n_email, 0),
+  followers_verified_count = COALESCE(d.n_verified, 0),
+  followers_business_count = COALESCE(d.n_business, 0)
+FROM {SCHEMA_NAME}.users u2
+LEFT JOIN (
+  SELECT user_id,
+         COUNT(*) AS n,
+         COUNT(email) AS n_email,
+         COUNT(*) FILTER (WHERE is_verified) AS n_verified,
+         COUNT(*) FILTER (WHERE is_business) AS n_business
+  FROM {SCHEMA_NAME}.followers
+  GROUP BY user_id
+) d ON d.user_id = u2.id
+WHERE u.id = u2.id
+"""
+
+# db.create_all() на новой БД ставит триггеры вместе с таблицей;
+# существующие БД - через migrate_follower_counters.py
+for _ddl in FOLLOWER_COUNTER_DDL:
+    event.listen(Follower.__table__, 'after_create', DDL(_ddl).execute_if(dialect='postgresql'))
+
+
 # ============ PARSE SESSIONS TABLE ============
 
 class ParseSession(db.Model):
@@ -192,7 +323,7 @@ class ParseSession(db.Model):
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), index=True)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), index=True)
     
     # Данные сессии
     competitor_usernames = db.Column(db.JSON, nullable=False)  # ['username1', 'username2']
@@ -212,7 +343,8 @@ class ParseSession(db.Model):
     # Отношения
     user = db.relationship('User', back_populates='parse_sessions')
     instagram_account = db.relationship('InstagramAccount', back_populates='parse_sessions')
-    followers = db.relationship('Follower', back_populates='parse_session', cascade='all, delete-orphan')
+    followers = db.relationship('Follower', back_populates='parse_session', cascade='all, delete-orphan',
+                                passive_deletes=True)
     
     def __repr__(self):
         return f'<ParseSession {self.id}>'
@@ -227,7 +359,7 @@ class PublishedContent(db.Model):
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
     
     # Контент
     content_type = db.Column(db.String(50), nullable=False)  # 'post', 'story', 'carousel', 'reel'
@@ -259,7 +391,11 @@ class PublishedContent(db.Model):
 class ExportHistory(db.Model):
     """История экспортов для Meta Ads"""
     __tablename__ = 'export_history'
-    __table_args__ = {'schema': SCHEMA_NAME}
+    __table_args__ = (
+        # /statistics: последние экспорты пользователя (ORDER BY exported_at DESC LIMIT 10)
+        db.Index('idx_export_history_user_exported', 'user_id', 'exported_at'),
+        {'schema': SCHEMA_NAME}
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
@@ -291,10 +427,13 @@ class MessageLog(db.Model):
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
     
     # Акаунт відправника
-    account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'))
+    account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'))
     account_username = db.Column(db.String(255))
     
     # Статистика розсилки
+    # Скільки отримувачів вибрано при запуску: total_recipients - total_sent ще зайнято
+    # в денному ліміті, поки розсилка pending/running
+    total_recipients = db.Column(db.Integer, default=0)
     total_sent = db.Column(db.Integer, default=0)
     successful = db.Column(db.Integer, default=0)
     failed = db.Column(db.Integer, default=0)
@@ -316,11 +455,17 @@ class MessageLog(db.Model):
 class SentMessage(db.Model):
     """Окремі відправлені повідомлення"""
     __tablename__ = 'sent_messages'
-    __table_args__ = {'schema': SCHEMA_NAME}
+    __table_args__ = (
+        # /send-messages: NOT EXISTS (user_id, recipient_username) - anti-join по индексу
+        db.Index('idx_sent_messages_user_recipient', 'user_id', 'recipient_username'),
+        # Денний ліміт: count(*) за user_id і діапазоном sent_at - index-only range scan
+        db.Index('idx_sent_messages_user_sent_at', 'user_id', 'sent_at'),
+        {'schema': SCHEMA_NAME}
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
-    message_log_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.message_logs.id'), index=True)
+    message_log_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.message_logs.id', ondelete='CASCADE'), index=True)
     
     # Отримувач
     recipient_username = db.Column(db.String(255), nullable=False, index=True)
@@ -437,6 +582,7 @@ class AutomationSettings(db.Model):
     __tablename__ = 'automation_settings'
     __table_args__ = (
         db.Index('idx_automation_settings_user', 'user_id', unique=True),
+        db.Index('idx_automation_settings_due', 'enabled', 'next_run_at'),
         {'schema': SCHEMA_NAME}
     )
 
@@ -458,6 +604,8 @@ class AutomationSettings(db.Model):
 
     last_rss_check_at = db.Column(db.DateTime)
     last_publish_run_at = db.Column(db.DateTime)
+    # Коли worker має обробити користувача наступного разу (NULL = одразу)
+    next_run_at = db.Column(db.DateTime)
     last_error = db.Column(db.Text)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -486,7 +634,8 @@ class AiCache(db.Model):
     """Зберігає останні результати AI (щоб не класти великі об'єкти в cookie-session)."""
     __tablename__ = 'ai_cache'
     __table_args__ = (
-        db.Index('idx_ai_cache_user_kind', 'user_id', 'kind'),
+        # /ai: последний результат каждого kind - DISTINCT ON (kind) ... ORDER BY kind, created_at DESC
+        db.Index('idx_ai_cache_user_kind_created', 'user_id', 'kind', 'created_at'),
         {'schema': SCHEMA_NAME}
     )
 
@@ -534,7 +683,7 @@ class DiscoverCache(db.Model):
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False, index=True)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
 
     payload = db.Column(db.JSON)  # list[dict]
 
@@ -550,12 +699,13 @@ class DmAssistantSettings(db.Model):
     __table_args__ = (
         db.Index('idx_dm_assistant_settings_user', 'user_id'),
         db.Index('idx_dm_assistant_settings_user_account', 'user_id', 'instagram_account_id', unique=True),
+        db.Index('idx_dm_assistant_settings_due', 'enabled', 'next_run_at'),
         {'schema': SCHEMA_NAME}
     )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
 
     enabled = db.Column(db.Boolean, default=False)
     system_instructions = db.Column(db.Text)
@@ -569,6 +719,7 @@ class DmAssistantSettings(db.Model):
     reply_to_existing_threads = db.Column(db.Boolean, default=False)
 
     last_run_at = db.Column(db.DateTime)
+    next_run_at = db.Column(db.DateTime)  # NULL = due now
     last_error = db.Column(db.Text)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -587,7 +738,7 @@ class DmThreadState(db.Model):
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
     thread_id = db.Column(db.String(128), nullable=False)
 
     last_seen_item_id = db.Column(db.String(128))
@@ -609,7 +760,7 @@ class DmMessage(db.Model):
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
 
     thread_id = db.Column(db.String(128), nullable=False)
     item_id = db.Column(db.String(128), nullable=False)
@@ -636,12 +787,13 @@ class InviteCampaignSettings(db.Model):
     __table_args__ = (
         db.Index('idx_invite_campaign_settings_user', 'user_id'),
         db.Index('idx_invite_campaign_settings_user_account', 'user_id', 'instagram_account_id', unique=True),
+        db.Index('idx_invite_campaign_settings_due', 'enabled', 'next_run_at'),
         {'schema': SCHEMA_NAME}
     )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
 
     enabled = db.Column(db.Boolean, default=False)
     audience_type = db.Column(db.String(50), default='target')  # target|frankfurt|all
@@ -661,6 +813,7 @@ class InviteCampaignSettings(db.Model):
     timezone = db.Column(db.String(64), default='Europe/Berlin')
 
     last_run_at = db.Column(db.DateTime)
+    next_run_at = db.Column(db.DateTime)  # NULL = due now
     last_error = db.Column(db.Text)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -681,7 +834,7 @@ class InviteCampaignRecipient(db.Model):
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
 
     recipient_username = db.Column(db.String(255), nullable=False)
     recipient_user_id = db.Column(db.String(255))
@@ -714,7 +867,7 @@ class InviteCampaignSend(db.Model):
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.users.id'), nullable=False)
-    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id'), nullable=False)
+    instagram_account_id = db.Column(db.String(36), db.ForeignKey(f'{SCHEMA_NAME}.instagram_accounts.id', ondelete='CASCADE'), nullable=False)
     recipient_username = db.Column(db.String(255), nullable=False)
     recipient_user_id = db.Column(db.String(255))
     thread_id = db.Column(db.String(128))
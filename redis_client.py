@@ -0,0 +1,73 @@
+"""Optional Redis connection shared by caches, locks and the worker queue.
+
+Enable via env:
+  REDIS_URL=redis://localhost:6379/0
+
+Without REDIS_URL (or without the `redis` package) get_redis() returns None and
+callers fall back to in-process behaviour (no cross-process locks/caches).
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import uuid
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# Compare-and-delete: release only the lock we own (it may have expired and been re-taken).
+_RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def get_redis():
+    """Shared Redis client (connection pool per process) or None if not configured."""
+    if not REDIS_URL:
+        return None
+
+    try:
+        import redis
+    except ImportError:
+        print("⚠️ redis package not installed. Run: pip install redis")
+        return None
+
+    return redis.Redis.from_url(REDIS_URL)
+
+
+@contextmanager
+def redis_lock(name: str, ttl_seconds: int = 300):
+    """Non-blocking distributed lock. Yields True if this process holds the lock.
+
+    Without Redis the lock is a no-op (always acquired): a single process runs the workers.
+    """
+    r = get_redis()
+    if r is None:
+        yield True
+        return
+
+    token = uuid.uuid4().hex
+    try:
+        acquired = bool(r.set(name, token, nx=True, ex=max(1, int(ttl_seconds))))
+    except Exception as e:
+        print(f"⚠️ Redis lock error ({name}): {e}")
+        yield True
+        return
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                r.eval(_RELEASE_LOCK_LUA, 1, name, token)
+            except Exception as e:
+                print(f"⚠️ Redis unlock error ({name}): {e}")
@@ -34,7 +34,7 @@ def _workers_loop(flask_app) -> None:
         print('Workers disabled (set ENABLE_ALL_WORKERS=true to enable).')
         return
 
-    from models import User  # imported after dotenv
+    from models import AutomationSettings, DmAssistantSettings, InviteCampaignSettings  # imported after dotenv
     from database import db
     from dm_assistant_service import poll_and_reply_for_user
     from invite_campaign_service import run_invite_campaign_for_user
@@ -43,17 +43,30 @@ def _workers_loop(flask_app) -> None:
     with flask_app.app_context():
         while True:
             try:
-                users = User.query.all()
-                for u in users:
+                # Only users with at least one enabled worker; each service runs only where enabled.
+                jobs = {}
+                for job, model in (('automation', AutomationSettings),
+                                   ('dm', DmAssistantSettings),
+                                   ('invite', InviteCampaignSettings)):
+                    rows = db.session.query(model.user_id).filter(model.enabled.is_(True)).distinct().all()
+                    for row in rows:
+                        jobs.setdefault(row[0], set()).add(job)
+
+                for user_id, user_jobs in jobs.items():
                     try:
-                        created = create_scheduled_content_from_new_rss(u.id, days=2, max_topics=20)
-                        published = publish_due_content(u.id, limit=3)
-                        replied = poll_and_reply_for_user(u.id, threads_limit=10, messages_per_thread=20)
-                        stats = run_invite_campaign_for_user(u.id)
+                        created = published = replied = 0
+                        stats = {}
+                        if 'automation' in user_jobs:
+                            created = create_scheduled_content_from_new_rss(user_id, days=2, max_topics=20)
+                            published = publish_due_content(user_id, limit=3)
+                        if 'dm' in user_jobs:
+                            replied = poll_and_reply_for_user(user_id, threads_limit=10, messages_per_thread=20)
+                        if 'invite' in user_jobs:
+                            stats = run_invite_campaign_for_user(user_id)
 
                         if created or published or replied or stats.get('sent') or stats.get('stopped') or stats.get('failed'):
                             print(
-                                f"[{datetime.utcnow().isoformat()}] user={u.id} "
+                                f"[{datetime.utcnow().isoformat()}] user={user_id} "
                                 f"automation(created={created}, published={published}) "
                                 f"dm_replied={replied} invite={stats}"
                             )
@@ -63,7 +76,7 @@ def _workers_loop(flask_app) -> None:
                             db.session.rollback()
                         except Exception:
                             pass
-                        print(f"Worker error for user={u.id}: {ue}")
+                        print(f"Worker error for user={user_id}: {ue}")
             except Exception as e:
                 # Recover session for next iteration
                 try:
@@ -0,0 +1,193 @@
+"""Semantic cache for informational AI calls (profile analysis, trend summaries).
+
+Many prompts differ only slightly (empty bios, "Frankfurt", shop descriptions),
+so before calling the chat model we look for a previous answer whose input is
+identical (hash match) or semantically close (embedding cosine >= threshold).
+
+Only informational kinds are cached. Generated messages/posts must stay unique,
+so they never go through this cache.
+
+Enable/disable via env:
+  AI_SEMANTIC_CACHE=true
+  AI_SEMANTIC_CACHE_THRESHOLD=0.95
+  AI_SEMANTIC_CACHE_MAX_ENTRIES=5000
+
+Notes:
+- The store is in-process (per web/worker process) and bounded (ring buffer).
+- Embedding search needs numpy (installed with moviepy); without it only exact
+  matches are served.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def _env_truthy(name: str, default: str = 'true') -> bool:
+    return os.environ.get(name, default).lower() in {'1', 'true', 'yes'}
+
+
+SEMANTIC_CACHE_ENABLED = _env_truthy('AI_SEMANTIC_CACHE', 'true')
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('AI_SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('AI_SEMANTIC_CACHE_MAX_ENTRIES', '5000'))
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_DIMENSIONS = 512
+
+# Informational (cacheable) kinds only; message/post generation is never cached.
+CACHEABLE_KINDS = {'analyze_profile', 'summarize_trend'}
+
+
+def _normalize(text: str) -> str:
+    return ' '.join((text or '').lower().split())
+
+
+def _exact_key(kind: str, text: str) -> str:
+    return kind + ':' + hashlib.sha1(_normalize(text).encode('utf-8')).hexdigest()
+
+
+class _VectorIndex:
+    """Fixed-size ring buffer of unit vectors + payloads for one kind."""
+
+    def __init__(self, capacity: int, dims: int):
+        self.capacity = max(1, capacity)
+        self.vectors = np.zeros((self.capacity, dims), dtype=np.float32)
+        self.payloads: list = [None] * self.capacity
+        self.size = 0
+        self.next = 0
+
+    def search(self, vec) -> Tuple[float, Any]:
+        if self.size == 0:
+            return 0.0, None
+        scores = self.vectors[:self.size] @ vec
+        best = int(scores.argmax())
+        return float(scores[best]), self.payloads[best]
+
+    def add(self, vec, payload: Any) -> None:
+        self.vectors[self.next] = vec
+        self.payloads[self.next] = payload
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+class SemanticCache:
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max(1, int(max_entries))
+        self.threshold = float(threshold)
+        self._exact: "OrderedDict[str, Any]" = OrderedDict()
+        self._indexes: Dict[str, _VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def get_exact(self, kind: str, text: str) -> Optional[Any]:
+        key = _exact_key(kind, text)
+        with self._lock:
+            value = self._exact.get(key)
+            if value is not None:
+                self._exact.move_to_end(key)
+            return value
+
+    def get_similar(self, kind: str, vector) -> Optional[Any]:
+        if vector is None:
+            return None
+        with self._lock:
+            index = self._indexes.get(kind)
+            if index is None:
+                return None
+            score, payload = index.search(vector)
+        return payload if score >= self.threshold else None
+
+    def put(self, kind: str, text: str, value: Any, vector=None) -> None:
+        key = _exact_key(kind, text)
+        with self._lock:
+            self._exact[key] = value
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+            if vector is not None:
+                index = self._indexes.get(kind)
+                if index is None:
+                    index = _VectorIndex(self.max_entries, len(vector))
+                    self._indexes[kind] = index
+                index.add(vector, value)
+
+
+_cache = SemanticCache()
+
+
+def _unit_vector(embedding):
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else None
+
+
+def _copy(value: Any) -> Any:
+    # Callers may annotate results (e.g. result['ai_generated'] = True).
+    return dict(value) if isinstance(value, dict) else value
+
+
+def _semantic_enabled(kind: str, client) -> bool:
+    return SEMANTIC_CACHE_ENABLED and np is not None and client is not None and kind in CACHEABLE_KINDS
+
+
+def lookup(kind: str, text: str, client=None) -> Tuple[Optional[Any], Any]:
+    """Return (cached_value, vector). Pass `vector` back to store() on a miss."""
+    if not SEMANTIC_CACHE_ENABLED or kind not in CACHEABLE_KINDS:
+        return None, None
+
+    hit = _cache.get_exact(kind, text)
+    if hit is not None:
+        return _copy(hit), None
+
+    if not _semantic_enabled(kind, client):
+        return None, None
+
+    try:
+        resp = client.embeddings.create(model=EMBEDDING_MODEL, input=_normalize(text),
+                                        dimensions=EMBEDDING_DIMENSIONS)
+        vector = _unit_vector(resp.data[0].embedding)
+    except Exception as e:
+        print(f"⚠️ semantic cache: embedding error: {e}")
+        return None, None
+
+    return _copy(_cache.get_similar(kind, vector)), vector
+
+
+async def alookup(kind: str, text: str, client=None) -> Tuple[Optional[Any], Any]:
+    """Async variant of lookup() for AsyncOpenAI clients."""
+    if not SEMANTIC_CACHE_ENABLED or kind not in CACHEABLE_KINDS:
+        return None, None
+
+    hit = _cache.get_exact(kind, text)
+    if hit is not None:
+        return _copy(hit), None
+
+    if not _semantic_enabled(kind, client):
+        return None, None
+
+    try:
+        resp = await client.embeddings.create(model=EMBEDDING_MODEL, input=_normalize(text),
+                                              dimensions=EMBEDDING_DIMENSIONS)
+        vector = _unit_vector(resp.data[0].embedding)
+    except Exception as e:
+        print(f"⚠️ semantic cache: embedding error: {e}")
+        return None, None
+
+    return _copy(_cache.get_similar(kind, vector)), vector
+
+
+def store(kind: str, text: str, value: Any, vector=None) -> None:
+    """Remember a successful AI answer for `text`."""
+    if not SEMANTIC_CACHE_ENABLED or kind not in CACHEABLE_KINDS or value is None:
+        return
+    _cache.put(kind, text, _copy(value), vector=vector)
@@ -0,0 +1,652 @@
+"""Background jobs: per-user workers (automation, DM assistant, invite campaign) and
+slow web actions (adding an Instagram account, parsing, discover, Direct campaigns).
+
+Used in two ways:
+- In-process: all_workers_runner.py calls run_automation/run_dm/run_invite from its thread pool.
+- Redis work queue (RQ): with WORKERS_QUEUE=rq, all_workers_runner.py only enqueues
+  (job, user_id) for due users and stateless consumers execute them:
+
+    rq worker osintgram-workers --url $REDIS_URL
+
+Every job takes a per-user Redis lock (lock:<job>:<user_id>), so several runner/worker
+replicas never drive the same user (Instagram account) concurrently.
+
+Web actions (WEB_JOBS) log in to Instagram and can take minutes. They hold a per-account
+lock (instagram_service.instagram_account_lock: Redis lock:ig:<username>, or a Postgres advisory
+lock without Redis), so add/parse/discover/send and the workers never log in to one account at once.
+With WORKERS_QUEUE=rq the route enqueues them and the browser polls /jobs/<job_id>;
+otherwise they run inline in the request as before. Parsing progress is appended to a Redis stream
+(parse:events:<session_id>) that /parse/events/<session_id> forwards as SSE.
+
+Nightly AI scoring (score_unanalyzed_followers) goes through the OpenAI Batch API from a
+cron job (`flask score-followers`, e.g. a Render Cron Job), not from a request.
+
+Env:
+  REDIS_URL=redis://localhost:6379/0
+  WORKERS_QUEUE=rq
+  WORKERS_QUEUE_NAME=osintgram-workers
+  WORKER_LOCK_SECONDS=1800
+  WEB_JOB_TIMEOUT_SECONDS=900
+  AI_NIGHTLY_SCORE_LIMIT=5000
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from redis_client import get_redis, redis_lock
+
+load_dotenv()
+
+WORKERS_QUEUE_NAME = os.environ.get('WORKERS_QUEUE_NAME', 'osintgram-workers')
+# Lock TTL only matters if a worker dies mid-job (normally the lock is released at the end).
+WORKER_LOCK_SECONDS = int(os.environ.get('WORKER_LOCK_SECONDS', '1800'))
+WORKERS_QUEUE = os.environ.get('WORKERS_QUEUE', '').strip().lower()
+WEB_JOB_TIMEOUT_SECONDS = int(os.environ.get('WEB_JOB_TIMEOUT_SECONDS', '900'))
+# Followers per nightly OpenAI Batch API run (`flask score-followers`).
+AI_NIGHTLY_SCORE_LIMIT = int(os.environ.get('AI_NIGHTLY_SCORE_LIMIT', '5000'))
+# How long finished web job results stay in Redis for the status page.
+WEB_JOB_RESULT_TTL = 3600
+# Parse progress stream: keep only the tail, expire together with job results.
+PARSE_EVENTS_MAXLEN = 200
+SSE_BLOCK_MS = 15000
+
+
+@functools.lru_cache(maxsize=1)
+def _get_app():
+    # Import lazily: RQ imports this module in the worker process.
+    import app as app_module
+    return getattr(app_module, 'app', None) or app_module.create_app()
+
+
+def run_automation(user_id: str) -> Optional[str]:
+    from database import db
+    from automation_service import create_scheduled_content_from_new_rss, publish_due_content, schedule_next_run
+
+    _clear_queued('automation', user_id)
+    with redis_lock(f"lock:automation:{user_id}", WORKER_LOCK_SECONDS) as acquired:
+        if not acquired:
+            return None
+        with _get_app().app_context():
+            try:
+                created = create_scheduled_content_from_new_rss(user_id, days=2, max_topics=20)
+                published = publish_due_content(user_id, limit=3)
+                schedule_next_run(user_id)
+            except Exception as e:
+                db.session.rollback()
+                return f"automation error: {e}"
+    if created or published:
+        return f"automation(created={created}, published={published})"
+    return None
+
+
+def run_dm(user_id: str) -> Optional[str]:
+    from database import db
+    from dm_assistant_service import poll_and_reply_for_user
+
+    _clear_queued('dm', user_id)
+    with redis_lock(f"lock:dm:{user_id}", WORKER_LOCK_SECONDS) as acquired:
+        if not acquired:
+            return None
+        with _get_app().app_context():
+            try:
+                replied = poll_and_reply_for_user(user_id, threads_limit=10, messages_per_thread=20)
+            except Exception as e:
+                db.session.rollback()
+                return f"dm error: {e}"
+    return f"dm_replied={replied}" if replied else None
+
+
+def run_invite(user_id: str) -> Optional[str]:
+    from database import db
+    from invite_campaign_service import run_invite_campaign_for_user
+
+    _clear_queued('invite', user_id)
+    with redis_lock(f"lock:invite:{user_id}", WORKER_LOCK_SECONDS) as acquired:
+        if not acquired:
+            return None
+        with _get_app().app_context():
+            try:
+                stats = run_invite_campaign_for_user(user_id)
+            except Exception as e:
+                db.session.rollback()
+                return f"invite error: {e}"
+    if stats.get('sent') or stats.get('stopped') or stats.get('failed'):
+        return f"invite={stats}"
+    return None
+
+
+JOBS = {
+    'automation': run_automation,
+    'dm': run_dm,
+    'invite': run_invite,
+}
+
+
+def get_queue():
+    """RQ queue on the shared Redis connection, or None if Redis/rq are unavailable."""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        from rq import Queue
+    except ImportError:
+        print("⚠️ rq package not installed. Run: pip install rq")
+        return None
+    return Queue(WORKERS_QUEUE_NAME, connection=r)
+
+
+def _queued_key(job: str, user_id: str) -> str:
+    return f"queued:{job}:{user_id}"
+
+
+def _clear_queued(job: str, user_id: str) -> None:
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(_queued_key(job, user_id))
+        except Exception:
+            pass
+
+
+def enqueue_user_job(queue, job: str, user_id: str) -> bool:
+    """Enqueue (job, user_id) unless it is already waiting in the queue."""
+    r = get_redis()
+    # Marker prevents piling up duplicates while next_run_at is not yet moved by the job.
+    if not r.set(_queued_key(job, user_id), '1', nx=True, ex=WORKER_LOCK_SECONDS):
+        return False
+    queue.enqueue(JOBS[job], user_id, job_timeout=WORKER_LOCK_SECONDS)
+    return True
+
+
+# ============ NIGHTLY AI SCORING ============
+
+def score_unanalyzed_followers(limit: int = AI_NIGHTLY_SCORE_LIMIT,
+                               on_progress: Optional[Callable] = None) -> int:
+    """Score followers the AI has not analyzed yet (quality_score = 0) via the OpenAI Batch API.
+
+    Batch results cost half the tokens but arrive within 24h, so this is for a cron job
+    (`flask score-followers`), never a request. Needs an app context; returns rows updated.
+    """
+    from sqlalchemy import update
+
+    from ai_service import OPENAI_API_KEY, batch_analyze_profiles_via_batch_api
+    from database import db
+    from models import Follower
+
+    # Without a key the batch helper returns fallback scores for everyone - don't write those
+    if not OPENAI_API_KEY:
+        return 0
+
+    rows = (db.session.query(Follower.id, Follower.username, Follower.biography,
+                             Follower.followers_count, Follower.posts_count, Follower.is_business)
+            .filter(Follower.quality_score == 0)
+            .order_by(Follower.collected_at.desc())
+            .limit(limit)
+            .all())
+    # Don't hold a pooled connection (open transaction) while the batch runs for hours
+    db.session.commit()
+    if not rows:
+        return 0
+
+    results = batch_analyze_profiles_via_batch_api([
+        {
+            'username': row.username,
+            'biography': row.biography,
+            'followers_count': row.followers_count or 0,
+            'posts_count': row.posts_count or 0,
+            'is_business': row.is_business or False,
+        }
+        for row in rows
+    ], on_progress=on_progress)
+
+    # Results come back in input order: bulk UPDATE by primary key
+    db.session.execute(update(Follower), [
+        {
+            'id': row.id,
+            'quality_score': result['ai_analysis'].get('quality_score') or 0,
+            'is_target_audience': result['ai_analysis'].get('is_target_audience', True),
+        }
+        for row, result in zip(rows, results)
+    ])
+    db.session.commit()
+    return len(rows)
+
+
+# ============ WEB ACTIONS ============
+# Each returns {'ok': bool, 'message': str, 'category': flash category} and needs an app context.
+
+ACCOUNT_BUSY_MESSAGE = 'Этот Instagram аккаунт сейчас занят другой задачей. Попробуйте через несколько минут.'
+
+
+def add_instagram_account(user_id: str, username: str, encrypted_password: str,
+                          proxy_str: Optional[str] = None) -> dict:
+    """Login + profile fetch + save InstagramAccount (two Instagram round-trips)."""
+    from sqlalchemy.exc import IntegrityError
+
+    from database import db
+    from encryption import decrypt_password
+    from instagram_service import InstagramService, instagram_account_lock
+    from models import InstagramAccount
+
+    proxy = {'http': proxy_str, 'https': proxy_str} if proxy_str else None
+    with instagram_account_lock(username, WEB_JOB_TIMEOUT_SECONDS) as acquired:
+        if not acquired:
+            return {'ok': False, 'message': ACCOUNT_BUSY_MESSAGE, 'category': 'warning'}
+        service = InstagramService(username, decrypt_password(encrypted_password), proxy=proxy)
+        success, message = service.login()
+        if not success:
+            return {'ok': False, 'message': f'Ошибка входа: {message}', 'category': 'error'}
+
+        account_info = service.get_account_info()
+    if not account_info:
+        return {'ok': False, 'message': 'Не удалось получить информацию о профиле', 'category': 'error'}
+
+    try:
+        db.session.add(InstagramAccount(
+            user_id=user_id,
+            instagram_username=username,
+            instagram_password=encrypted_password,
+            instagram_user_id=account_info.get('user_id'),
+            full_name=account_info.get('full_name'),
+            biography=account_info.get('biography'),
+            profile_pic_url=account_info.get('profile_pic_url'),
+            followers_count=account_info.get('followers_count'),
+            following_count=account_info.get('following_count'),
+            posts_count=account_info.get('posts_count'),
+            is_verified=account_info.get('is_verified', False),
+            is_business=account_info.get('is_business', False),
+            is_private=account_info.get('is_private', False),
+            last_sync=datetime.utcnow(),
+        ))
+        db.session.commit()
+    except IntegrityError:
+        # Unique (user_id, instagram_username): a concurrent request added it first
+        db.session.rollback()
+        return {'ok': False, 'message': 'Этот аккаунт уже добавлен', 'category': 'error'}
+    except Exception as e:
+        db.session.rollback()
+        return {'ok': False, 'message': f'Ошибка сохранения: {e}', 'category': 'error'}
+
+    return {'ok': True, 'message': f'Аккаунт @{username} успешно добавлен!', 'category': 'success'}
+
+
+def update_account_password(user_id: str, account_id: str, encrypted_password: str) -> dict:
+    """Verify a new password with a login, then save it and drop the stale saved session."""
+    from database import db
+    from encryption import decrypt_password
+    from instagram_service import InstagramService, drop_saved_session, instagram_account_lock
+    from models import InstagramAccount
+
+    account = InstagramAccount.query.filter_by(id=account_id, user_id=user_id).first()
+    if account is None:
+        return {'ok': False, 'message': 'Аккаунт не найден', 'category': 'error'}
+    username = account.instagram_username
+
+    with instagram_account_lock(username, WEB_JOB_TIMEOUT_SECONDS) as acquired:
+        if not acquired:
+            return {'ok': False, 'message': ACCOUNT_BUSY_MESSAGE, 'category': 'warning'}
+        # Don't hold a DB connection during the Instagram login
+        db.session.commit()
+        service = InstagramService(username, decrypt_password(encrypted_password))
+        success, message = service.login()
+    if not success:
+        return {'ok': False, 'message': f'Ошибка входа: {message}', 'category': 'error'}
+
+    try:
+        account.instagram_password = encrypted_password
+        # Remove saved instagrapi session (file + Redis) to avoid stale sessions
+        drop_saved_session(username)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {'ok': False, 'message': f'Ошибка сохранения пароля: {e}', 'category': 'error'}
+
+    return {'ok': True, 'message': f'Пароль для @{username} обновлен', 'category': 'success'}
+
+
+def parse_competitors(parse_session_id: str, max_followers: int) -> dict:
+    """Collect followers for an existing ParseSession (status 'processing')."""
+    from database import db
+    from encryption import decrypt_password
+    from instagram_service import InstagramService, instagram_account_lock
+    from models import InstagramAccount, ParseSession
+
+    parse_session = db.session.get(ParseSession, parse_session_id)
+    if parse_session is None:
+        return {'ok': False, 'message': 'Сессия парсинга не найдена', 'category': 'error'}
+
+    def _fail(error_message: str, message: str) -> dict:
+        parse_session.status = 'failed'
+        parse_session.error_message = error_message
+        parse_session.completed_at = datetime.utcnow()
+        db.session.commit()
+        return {'ok': False, 'message': message, 'category': 'error'}
+
+    try:
+        account = db.session.get(InstagramAccount, parse_session.instagram_account_id)
+        username, password = account.instagram_username, decrypt_password(account.instagram_password)
+        competitor_usernames, user_id = parse_session.competitor_usernames, parse_session.user_id
+        # Don't hold a pooled connection (open transaction) through login/scraping:
+        # parse_competitors commits per account and only checks one out to write.
+        db.session.commit()
+
+        with instagram_account_lock(username, WEB_JOB_TIMEOUT_SECONDS) as acquired:
+            if not acquired:
+                result = _fail(ACCOUNT_BUSY_MESSAGE, ACCOUNT_BUSY_MESSAGE)
+            else:
+                service = InstagramService(username, password)
+                success, message = service.login()
+
+                if not success:
+                    result = _fail(f'Ошибка входа: {message}', f'Ошибка входа в аккаунт: {message}')
+                else:
+                    total_collected, failed_accounts = service.parse_competitors(
+                        competitor_usernames,
+                        parse_session_id,
+                        user_id,
+                        max_followers,
+                        on_progress=lambda event: publish_parse_event(parse_session_id, event),
+                    )
+                    if failed_accounts:
+                        failed_msg = ', '.join([f"@{k}: {v}" for k, v in failed_accounts.items()])
+                        result = {'ok': True, 'category': 'warning',
+                                  'message': f'✅ Зібрано {total_collected} профілів! '
+                                             f'Деякі акаунти не вдалося обробити: {failed_msg}'}
+                    else:
+                        result = {'ok': True, 'message': f'✅ Зібрано {total_collected} профілів!',
+                                  'category': 'success'}
+    except Exception as e:
+        db.session.rollback()
+        result = _fail(str(e), f'Ошибка при парсинге: {e}')
+
+    # Источники /followers (failed_accounts) и списки /statistics изменились
+    from cache import invalidate_user_caches
+    invalidate_user_caches(parse_session.user_id)
+
+    publish_parse_event(parse_session_id, {'type': 'done', **result})
+    return result
+
+
+def discover_accounts(user_id: str, instagram_account_id: str, geo_config: dict) -> dict:
+    """Search similar accounts and store the top results in DiscoverCache."""
+    from database import db
+    from encryption import decrypt_password
+    from instagram_service import InstagramService, instagram_account_lock
+    from models import DiscoverCache, InstagramAccount
+
+    try:
+        account = InstagramAccount.query.filter_by(id=instagram_account_id, user_id=user_id).first()
+        if account is None:
+            return {'ok': False, 'message': 'Instagram акаунт не знайдено', 'category': 'error'}
+
+        username, password = account.instagram_username, decrypt_password(account.instagram_password)
+        db.session.commit()
+
+        with instagram_account_lock(username, WEB_JOB_TIMEOUT_SECONDS) as acquired:
+            if not acquired:
+                return {'ok': False, 'message': ACCOUNT_BUSY_MESSAGE, 'category': 'warning'}
+            service = InstagramService(username, password)
+            success, message = service.login()
+            if not success:
+                return {'ok': False, 'message': f'Помилка входу: {message}', 'category': 'error'}
+
+            discovered = service.discover_similar_accounts(geo_config=geo_config)
+    except Exception as e:
+        return {'ok': False, 'message': f'Помилка пошуку: {e}', 'category': 'error'}
+
+    # Server-side in DB (not in the cookie session)
+    top = discovered[:30]
+    try:
+        cache_row = (DiscoverCache.query
+                     .filter_by(user_id=user_id, instagram_account_id=instagram_account_id)
+                     .first())
+        if cache_row is None:
+            db.session.add(DiscoverCache(user_id=user_id, instagram_account_id=instagram_account_id, payload=top))
+        else:
+            cache_row.payload = top
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    else:
+        # GET /discover reads the Redis copy; put the fresh result there right away
+        from cache import DISCOVER_CACHE_SECONDS, cache_set_json, discover_key
+        cache_set_json(discover_key(user_id),
+                       {'accounts': top, 'instagram_account_id': instagram_account_id},
+                       DISCOVER_CACHE_SECONDS)
+
+    return {'ok': True, 'message': f'✅ Знайдено {len(discovered)} потенційних акаунтів!', 'category': 'success'}
+
+
+def message_campaign_timeout(recipients: int, delay: int) -> int:
+    """Job/lock timeout for a DM campaign: the sleeps between messages plus login headroom."""
+    return recipients * max(30, delay + 15) + WEB_JOB_TIMEOUT_SECONDS
+
+
+def send_direct_messages(message_log_id: str, recipient_ids: list, delay: int) -> dict:
+    """Send the MessageLog's template to the given followers, one Direct message per recipient.
+
+    MessageLog.successful/failed/total_sent are committed after every message, so /messaging
+    shows progress while the job sleeps between sends.
+    """
+    import random
+
+    from database import db
+    from encryption import decrypt_password
+    from instagram_service import InstagramService, instagram_account_lock
+    from models import Follower, InstagramAccount, MessageLog, SentMessage
+
+    message_log = db.session.get(MessageLog, message_log_id)
+    if message_log is None:
+        return {'ok': False, 'message': 'Розсилку не знайдено', 'category': 'error'}
+
+    def _fail(error_message: str, message: str) -> dict:
+        message_log.status = 'error'
+        message_log.error_message = error_message
+        message_log.completed_at = datetime.utcnow()
+        db.session.commit()
+        return {'ok': False, 'message': message, 'category': 'error'}
+
+    account = db.session.get(InstagramAccount, message_log.account_id)
+    if account is None:
+        return _fail('Акаунт не знайдено', 'Акаунт не знайдено')
+
+    user_id, message_template = message_log.user_id, message_log.message_template
+    try:
+        username, password = account.instagram_username, decrypt_password(account.instagram_password)
+    except Exception as e:
+        return _fail(str(e), f'❌ Помилка: {e}')
+
+    # Only the columns the loop needs, in the order the route picked the recipients
+    rows = (db.session.query(Follower.id, Follower.username, Follower.full_name, Follower.instagram_user_id)
+            .filter(Follower.user_id == user_id, Follower.id.in_(recipient_ids))
+            .all())
+    by_id = {row.id: row for row in rows}
+    recipients = [by_id[follower_id] for follower_id in recipient_ids if follower_id in by_id]
+    # Don't hold a pooled connection through login and the sleeps between messages
+    db.session.commit()
+
+    successful = 0
+    failed = 0
+    lock_seconds = message_campaign_timeout(len(recipients), delay)
+    with instagram_account_lock(username, lock_seconds) as acquired:
+        if not acquired:
+            return _fail(ACCOUNT_BUSY_MESSAGE, ACCOUNT_BUSY_MESSAGE)
+
+        try:
+            service = InstagramService(username, password)
+            success, login_msg = service.login()
+        except Exception as e:
+            return _fail(str(e), f'❌ Помилка: {e}')
+        if not success:
+            return _fail(login_msg, f'❌ Помилка входу: {login_msg}')
+
+        for i, follower in enumerate(recipients):
+            sent_row = {
+                'user_id': user_id,
+                'message_log_id': message_log_id,
+                'recipient_username': follower.username,
+                'recipient_user_id': follower.instagram_user_id,
+            }
+            try:
+                # Personalisation
+                personalized_msg = message_template.replace('{name}', follower.full_name or follower.username)
+                personalized_msg = personalized_msg.replace('{username}', f'@{follower.username}')
+
+                result = service.send_direct_message(follower.username, personalized_msg)
+
+                if result.get('success'):
+                    successful += 1
+                    sent_row.update(status='sent', error_message=None)
+                else:
+                    failed += 1
+                    sent_row.update(status='failed', error_message=result.get('error', 'Unknown error'))
+            except Exception as e:
+                failed += 1
+                sent_row.update(recipient_user_id=None, status='failed', error_message=str(e))
+
+                # Instagram restricted the account: stop the campaign
+                if 'feedback_required' in str(e).lower() or 'challenge' in str(e).lower():
+                    message_log.status = 'stopped'
+                    message_log.error_message = 'Instagram обмежив дії. Зачекайте 24-48 годин.'
+                    break
+            finally:
+                # One commit per message (a plain-dict INSERT, no ORM object kept around) together
+                # with the counters: not batched, because SentMessage rows are what stops a rerun
+                # from messaging the same people again - a crash must not lose any of them
+                db.session.execute(db.insert(SentMessage).values(**sent_row))
+                message_log.total_sent = successful + failed
+                message_log.successful = successful
+                message_log.failed = failed
+                db.session.commit()
+
+            # Random delay between messages (looks natural); the commit above released the connection
+            if i < len(recipients) - 1:
+                time.sleep(max(30, delay + random.randint(-10, 15)))
+
+    message_log.status = 'completed' if message_log.status != 'stopped' else 'stopped'
+    message_log.completed_at = datetime.utcnow()
+    db.session.commit()
+
+    if message_log.status == 'stopped':
+        return {'ok': False, 'category': 'warning',
+                'message': f'⚠️ Розсилку зупинено! Відправлено: {successful}, помилок: {failed}. '
+                           f'Instagram обмежив дії.'}
+    return {'ok': True, 'message': f'✅ Розсилка завершена! Відправлено: {successful}, помилок: {failed}',
+            'category': 'success'}
+
+
+def _parse_events_key(parse_session_id: str) -> str:
+    return f"parse:events:{parse_session_id}"
+
+
+def publish_parse_event(parse_session_id: str, event: dict) -> None:
+    """Append a progress event to the session's Redis stream (no-op without Redis)."""
+    r = get_redis()
+    if r is None:
+        return
+    key = _parse_events_key(parse_session_id)
+    try:
+        r.xadd(key, {'data': json.dumps(event, ensure_ascii=False)},
+               maxlen=PARSE_EVENTS_MAXLEN, approximate=True)
+        r.expire(key, WEB_JOB_RESULT_TTL)
+    except Exception as e:
+        print(f"⚠️ Redis parse event error ({key}): {e}")
+
+
+def iter_parse_events(parse_session_id: str, status: str):
+    """SSE frames for a parse session: replays the stream, then blocks on XREAD until 'done'.
+
+    Without Redis (or for a session that is no longer running) sends one 'status' event.
+    """
+    r = get_redis()
+    if r is None or status != 'processing':
+        yield f"data: {json.dumps({'type': 'status', 'status': status})}\n\n"
+        return
+
+    key = _parse_events_key(parse_session_id)
+    last_id = '0'
+    deadline = time.monotonic() + WEB_JOB_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            batches = r.xread({key: last_id}, block=SSE_BLOCK_MS, count=50)
+        except Exception as e:
+            print(f"⚠️ Redis parse events read error ({key}): {e}")
+            return
+        if not batches:
+            yield ": keep-alive\n\n"
+            continue
+        for _, entries in batches:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                data = fields.get(b'data') or fields.get('data') or b'{}'
+                if isinstance(data, bytes):
+                    data = data.decode('utf-8')
+                yield f"data: {data}\n\n"
+                if json.loads(data).get('type') == 'done':
+                    return
+
+
+WEB_JOBS = {
+    'add_account': add_instagram_account,
+    'update_password': update_account_password,
+    'parse': parse_competitors,
+    'discover': discover_accounts,
+    'send_messages': send_direct_messages,
+}
+
+
+def run_web_job(name: str, *args) -> dict:
+    """RQ entrypoint for WEB_JOBS (the worker process has no app context of its own)."""
+    with _get_app().app_context():
+        return WEB_JOBS[name](*args)
+
+
+def enqueue_web_job(name: str, *args, user_id: str, redirect_url: str,
+                    job_timeout: int = WEB_JOB_TIMEOUT_SECONDS) -> Optional[str]:
+    """Enqueue a web action and return the RQ job id, or None to run it inline."""
+    if WORKERS_QUEUE != 'rq':
+        return None
+    queue = get_queue()
+    if queue is None:
+        return None
+    job = queue.enqueue(
+        run_web_job, name, *args,
+        job_timeout=job_timeout,
+        result_ttl=WEB_JOB_RESULT_TTL,
+        failure_ttl=WEB_JOB_RESULT_TTL,
+        meta={'user_id': user_id, 'redirect': redirect_url},
+    )
+    return job.id
+
+
+def get_web_job_status(job_id: str, user_id: str) -> Optional[dict]:
+    """{'status', 'result', 'redirect'} for the job owner, or None if unknown/foreign."""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        from rq.exceptions import NoSuchJobError
+        from rq.job import Job
+    except ImportError:
+        return None
+    try:
+        job = Job.fetch(job_id, connection=r)
+    except NoSuchJobError:
+        return None
+    if job.meta.get('user_id') != user_id:
+        return None
+
+    status = job.get_status()
+    status = getattr(status, 'value', status)
+    result = job.return_value() if status == 'finished' else None
+    if status == 'failed':
+        result = {'ok': False, 'message': 'Задача завершилась с ошибкой', 'category': 'error'}
+    return {'status': status, 'result': result, 'redirect': job.meta.get('redirect')}
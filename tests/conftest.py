@@ -0,0 +1,108 @@
+"""Shared fixtures: the app on a PostgreSQL test database and a SQL statement counter.
+
+The models live in a Postgres schema and the pages use DISTINCT ON / ON CONFLICT, so
+the tests need a real (throwaway) PostgreSQL database; without it they are skipped:
+
+    pip install pytest
+    TEST_DATABASE_URL=postgresql://localhost/instagram_osint_test pytest -q
+"""
+
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not os.environ.get('TEST_DATABASE_URL'):
+        pytest.skip('TEST_DATABASE_URL is not set: the tests need a PostgreSQL database')
+
+    # Before the import: app.py builds the module-level app from FLASK_ENV, and
+    # load_dotenv() does not override variables that are already set.
+    os.environ['FLASK_ENV'] = 'testing'
+    os.environ['REDIS_URL'] = ''
+    import app as app_module
+    from app import create_schema_and_tables
+    from database import db
+
+    flask_app = app_module.app
+    create_schema_and_tables(flask_app)
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(scope='session')
+def user(app):
+    """A user with a few rows behind every budgeted page (lists with one row hide N+1)."""
+    from database import db
+    from models import (
+        ExportHistory, Follower, InstagramAccount, ParseSession, PublishedContent, User,
+    )
+
+    with app.app_context():
+        user = User(email='budget@example.com', username='budget')
+        user.set_password('budget-password')
+        db.session.add(user)
+        db.session.flush()
+
+        account = InstagramAccount(user_id=user.id, instagram_username='budget_account',
+                                   instagram_password='not-a-real-token')
+        db.session.add(account)
+        db.session.flush()
+
+        now = datetime.utcnow()
+        for i in range(3):
+            session = ParseSession(user_id=user.id, instagram_account_id=account.id,
+                                   competitor_usernames=[f'competitor{i}'], status='completed',
+                                   started_at=now - timedelta(hours=i), completed_at=now)
+            db.session.add(session)
+            db.session.flush()
+            db.session.add(Follower(user_id=user.id, parse_session_id=session.id,
+                                    instagram_user_id=f'ig{i}', username=f'follower{i}',
+                                    source_account_username=f'competitor{i}',
+                                    email=f'follower{i}@example.com' if i else None,
+                                    quality_score=None if i == 2 else 10 * i))
+            db.session.add(PublishedContent(user_id=user.id, instagram_account_id=account.id,
+                                            content_type='post', caption=f'post {i}', status='published'))
+            db.session.add(ExportHistory(user_id=user.id, export_type='csv', rows_exported=i))
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def client(app, user):
+    """Test client logged in as `user` (Flask-Login reads _user_id from the session)."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def count_queries(app):
+    """count_queries() -> context manager collecting every SQL statement run inside the block."""
+    from database import db
+
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def _count_queries():
+        queries = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            queries.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', _record)
+        try:
+            yield queries
+        finally:
+            event.remove(engine, 'before_cursor_execute', _record)
+
+    return _count_queries
@@ -0,0 +1,22 @@
+"""Pages from SQL_QUERY_BUDGETS stay within their SQL statement budget (guards against N+1)."""
+
+import pytest
+from flask import url_for
+
+from config import TestingConfig
+
+
+@pytest.mark.parametrize('endpoint', sorted(TestingConfig.SQL_QUERY_BUDGETS))
+def test_page_within_query_budget(app, client, count_queries, endpoint):
+    budget = app.config['SQL_QUERY_BUDGETS'][endpoint]
+    with app.test_request_context():
+        url = url_for(endpoint)
+
+    with count_queries() as queries:
+        response = client.get(url)
+        # Streamed pages (stream_template) run their queries while the body is rendered
+        response.get_data()
+        response.close()
+
+    assert response.status_code == 200
+    assert len(queries) <= budget, f"{url}: {len(queries)} SQL statements (budget {budget}):\n" + '\n'.join(queries)